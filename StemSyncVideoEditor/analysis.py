@@ -0,0 +1,602 @@
+import itertools
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from cache import cache_key, has_npz, load_npz, save_npz
+from media import FFMPEG_BIN, probe_video
+from metrics import count, log, measured, merged, stage
+from structure import (
+    BAR_RESTART_PENALTY, BEATS_PER_BAR, CHORUS_SIMILARITY, MIN_SECTION_BARS, N_MFCC, NOVELTY_BARS,
+    NOVELTY_THRESHOLD, analyze_structure
+)
+
+
+# ======================================================
+# AUDIO ANALYSIS
+# files are decoded a block at a time and only per-frame
+# features are kept, so memory does not grow with length
+# ======================================================
+# anything that changes these must change the cache key too
+ANALYSIS_SR = None  # native rate, 22050 halves the work on 44.1/48 kHz files
+ANALYSIS_RATES = [None, 22050, 11025]
+HOP_LENGTH = 512
+N_FFT = 2048
+BLOCK_SECONDS = 30
+TOP_DB = 80.0
+TEMPO_BLOCK_FRAMES = 4096
+
+# stem features come from one STFT over the middle half of every rms frame
+# (same centres), taken from the signal averaged down to at most
+# FEATURE_RATE first, which keeps a stem at ~1.5x the cost of rms alone
+FEATURE_RATE = 22050
+FLUX_BANDS = 48  # log-spaced bands the flux is measured over
+FLUX_LOW = 40.0  # Hz, bottom of the lowest band
+FLUX_COMPRESSION = 100.0  # log(1 + C * |X|) before the frame difference
+ONSET_WINDOW = 2.0  # seconds of onsets counted per density value
+ONSET_MEAN = 0.5  # seconds of flux a peak has to stand out from
+ONSET_DELTA = 2.0  # ... by this factor
+ONSET_MAX = 0.03  # seconds either side a peak has to be the largest of
+STEM_FEATURES = ["rms", "flux", "onsets", "centroid"]
+
+# Against whole-file librosa.load (same rate):
+# - rms and the spectrogram are framed exactly like librosa (center=True,
+#   zero padding), they only differ by float32 rounding (< 1e-5 relative)
+# - power_to_db clips at TOP_DB below the loudest frame *so far* instead of
+#   the loudest frame of the whole file. Onset strength can only differ in
+#   mel bands more than 80 dB down before the song reaches its peak level,
+#   i.e. near-digital silence, so beats and onsets match in practice.
+# - resampled rates use soxr's streaming HQ resampler, which matches
+#   librosa's soxr_hq to within ~1e-4 away from the first few samples.
+# - formats libsndfile cannot read are decoded by ffmpeg as float, where
+#   librosa went through audioread's 16-bit output, which also clipped
+#   peaks above full scale. Beats can move there by a frame or two.
+
+# librosa (and numba) are only imported when something is actually
+# analysed, a fully cached render never pays for them
+
+def analysis_key(kind, path, sr=ANALYSIS_SR, **params):
+    return cache_key(path, kind=kind, sr=sr or "native", hop=HOP_LENGTH, n_fft=N_FFT, decode="stream", **params)
+
+def stem_key(path, sr=ANALYSIS_SR):
+    return analysis_key(
+        "stem", path, sr,
+        feature_rate=FEATURE_RATE, bands=FLUX_BANDS, low=FLUX_LOW, compression=FLUX_COMPRESSION,
+        onset_window=ONSET_WINDOW, onset_mean=ONSET_MEAN, onset_delta=ONSET_DELTA, onset_max=ONSET_MAX
+    )
+
+def mix_key(path, sr=ANALYSIS_SR):
+    return analysis_key(
+        "mix", path, sr,
+        beats_per_bar=BEATS_PER_BAR, restart=BAR_RESTART_PENALTY, novelty_bars=NOVELTY_BARS,
+        min_section_bars=MIN_SECTION_BARS, novelty_threshold=NOVELTY_THRESHOLD, chorus=CHORUS_SIMILARITY,
+        mfcc=N_MFCC
+    )
+
+def frame_times(count, sr):
+    # librosa.frames_to_time for frames 0..count-1
+    return np.arange(count) * HOP_LENGTH / float(sr)
+
+
+def downmix(block):
+    # mean of the channels, same float32 result as block.mean(axis=1)
+    # but a column at a time, numpy reduces a short axis slowly
+    if block.shape[1] == 1:
+        return block[:, 0]
+    y = block[:, 0].copy()
+    for c in range(1, block.shape[1]):
+        y += block[:, c]
+    y /= block.shape[1]
+    return y
+
+
+class AudioStream:
+    # mono float32 blocks of a file at the analysis rate
+    def __init__(self, path, sr=ANALYSIS_SR):
+        import soundfile as sf
+
+        self.path = path
+        try:
+            self.native_sr = sf.info(path).samplerate
+            self.channels = 0
+        except RuntimeError:
+            # a format libsndfile cannot read (m4a, ...), piped through ffmpeg instead
+            info = probe_video(path)
+            self.native_sr, self.channels = info["sample_rate"], info["channels"]
+            if not self.native_sr or not self.channels:
+                raise RuntimeError(f"No audio stream in {path}")
+        self.sr = int(sr or self.native_sr)
+        self.samples = 0
+
+    def native_blocks(self):
+        import soundfile as sf
+
+        size = int(self.native_sr * BLOCK_SECONDS)
+        if self.channels:
+            yield from self.ffmpeg_blocks(size)
+            return
+
+        for block in sf.blocks(self.path, blocksize=size, dtype="float32", always_2d=True):
+            yield downmix(block)
+
+    def ffmpeg_blocks(self, size):
+        import subprocess
+
+        proc = subprocess.Popen(
+            [FFMPEG_BIN, "-hide_banner", "-nostdin", "-loglevel", "error", "-i", self.path,
+             "-map", "0:a:0", "-f", "f32le", "-acodec", "pcm_f32le", "-"],
+            stdout=subprocess.PIPE
+        )
+        try:
+            while True:
+                data = proc.stdout.read(size * self.channels * 4)
+                if not data:
+                    break
+                block = np.frombuffer(data[:len(data) // (4 * self.channels) * 4 * self.channels], dtype=np.float32)
+                yield downmix(block.reshape(-1, self.channels))
+        finally:
+            proc.stdout.close()
+            if proc.wait() != 0:
+                raise RuntimeError(f"ffmpeg could not decode {self.path}")
+
+    def __iter__(self):
+        resampler = None
+        if self.sr != self.native_sr:
+            import soxr
+
+            resampler = soxr.ResampleStream(self.native_sr, self.sr, 1, dtype="float32", quality="HQ")
+
+        for y in self.native_blocks():
+            if resampler is not None:
+                y = resampler.resample_chunk(y)
+            self.samples += len(y)
+            yield y
+
+        if resampler is not None:
+            y = resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+            self.samples += len(y)
+            yield y
+
+    @property
+    def duration(self):
+        return self.samples / float(self.sr)
+
+
+def centered_frames(blocks, frame_length=N_FFT, hop_length=HOP_LENGTH):
+    # the frames librosa cuts with center=True and zero padding,
+    # yielded a block at a time (views, use them before the next one)
+    pad = frame_length // 2
+    buf = np.zeros(pad, dtype=np.float32)
+    for block in blocks_then_padding(blocks, pad):
+        buf = np.concatenate([buf, block])
+        count = (len(buf) - frame_length) // hop_length + 1 if len(buf) >= frame_length else 0
+        if count > 0:
+            yield np.lib.stride_tricks.sliding_window_view(buf, frame_length)[::hop_length][:count]
+            buf = buf[count * hop_length:]
+
+def blocks_then_padding(blocks, pad):
+    for block in blocks:
+        yield block
+    yield np.zeros(pad, dtype=np.float32)
+
+
+def frame_rms(frames):
+    # einsum squares and sums without a frames-sized temporary
+    return np.sqrt(np.einsum("ij,ij->i", frames, frames) / frames.shape[1])
+
+
+def decimated(blocks, factor):
+    # sums of `factor` consecutive samples (a cheap low-pass) across block boundaries
+    carry = np.zeros(0, dtype=np.float32)
+    for block in blocks:
+        if factor == 1:
+            yield block
+            continue
+        if len(carry):
+            block = np.concatenate([carry, block])
+        n = len(block) // factor * factor
+        carry = block[n:]
+        y = block[0:n:factor].copy()
+        for k in range(1, factor):
+            y += block[k:n:factor]
+        yield y
+
+
+def band_matrix(freqs, sr):
+    # bins x (FLUX_BANDS mean-magnitude bands, weighted sum for the centroid, total),
+    # and each band's share of the bins (a band counts as much as its bins would)
+    edges = np.geomspace(FLUX_LOW, sr / 2.0, FLUX_BANDS + 1)
+    band = np.clip(np.searchsorted(edges, freqs, side="right") - 1, 0, FLUX_BANDS - 1)
+    sizes = np.bincount(band, minlength=FLUX_BANDS).astype(np.float32)
+    M = np.zeros((len(freqs), FLUX_BANDS + 2), dtype=np.float32)
+    M[np.arange(len(freqs)), band] = 1.0 / sizes[band]
+    M[:, FLUX_BANDS] = freqs
+    M[:, FLUX_BANDS + 1] = 1.0
+    return M, sizes / sizes.sum()
+
+
+def stem_features(audio):
+    # rms of every analysis frame, plus spectral flux and centroid of the
+    # middle half of the same frames from one small STFT
+    import scipy.fft
+
+    factor = int(np.clip(audio.sr // FEATURE_RATE, 1, HOP_LENGTH))
+    while HOP_LENGTH % factor:
+        factor -= 1
+    hop = HOP_LENGTH // factor
+    n_fft = 2 * hop
+    window = (np.hanning(n_fft + 1)[:-1] / factor).astype(np.float32)  # sums back to means
+    freqs = np.arange(n_fft // 2 + 1) * audio.sr / factor / n_fft
+    bands, weights = band_matrix(freqs, audio.sr / factor)
+
+    # both framings read the same decoded blocks, a block or so apart
+    full, small = itertools.tee(audio)
+    rms, flux, centroid = [], [], []
+    prev = np.zeros((1, FLUX_BANDS), dtype=np.float32)
+    for frames, middles in itertools.zip_longest(
+        centered_frames(full), centered_frames(decimated(small, factor), n_fft, hop)
+    ):
+        if frames is not None:
+            rms.append(frame_rms(frames))
+        if middles is None:
+            continue
+
+        mag = np.abs(scipy.fft.rfft(middles * window, axis=1, overwrite_x=True))
+        summed = mag @ bands
+        total = summed[:, -1]
+        centroid.append(np.where(total > 0, summed[:, -2] / np.maximum(total, 1e-10), 0.0))
+
+        # half-wave rectified difference of the compressed bands, the first frame against silence
+        comp = np.log1p(FLUX_COMPRESSION * summed[:, :FLUX_BANDS])
+        flux.append(np.maximum(0.0, np.diff(np.vstack([prev, comp]), axis=0)) @ weights)
+        prev = comp[-1:]
+
+    rms = np.concatenate(rms or [np.zeros(0)])
+    flux = np.concatenate(flux or [np.zeros(0)])[:len(rms)]
+    centroid = np.concatenate(centroid or [np.zeros(0)])[:len(rms)]
+    return rms, flux, onset_density(flux, audio.sr), centroid
+
+
+def moving_sum(x, width):
+    # sum over a centred window of `width` values, clipped at the ends
+    c = np.concatenate([[0.0], np.cumsum(x, dtype=float)])
+    i = np.arange(len(x))
+    return c[np.minimum(i + width - width // 2, len(x))] - c[np.maximum(i - width // 2, 0)]
+
+def onset_density(flux, sr):
+    # onsets per second around each frame: flux peaks that top the flux
+    # ONSET_MAX around them and stand out from its mean over ONSET_MEAN,
+    # counted over ONSET_WINDOW seconds
+    if len(flux) < 3:
+        return np.zeros(len(flux))
+    rate = sr / float(HOP_LENGTH)
+    ones = np.ones(len(flux))
+    mean_width = max(1, int(round(ONSET_MEAN * rate)))
+    local = moving_sum(flux, mean_width) / moving_sum(ones, mean_width)
+
+    reach = max(1, int(round(ONSET_MAX * rate)))
+    padded = np.pad(flux, reach, mode="constant", constant_values=-np.inf)
+    peaks = flux >= np.lib.stride_tricks.sliding_window_view(padded, 2 * reach + 1).max(axis=1)
+    peaks &= (flux > ONSET_DELTA * local) & (flux > 0)
+
+    width = max(1, int(round(ONSET_WINDOW * rate)))
+    return moving_sum(peaks, width) / (moving_sum(ones, width) / rate)
+
+
+def analyze_audio(path, use_cache=True, sr=ANALYSIS_SR):
+    key = stem_key(path, sr) if use_cache else None
+    data = load_npz("analysis", key) if use_cache else None
+
+    if data is None:
+        with stage("stem"):
+            audio = AudioStream(path, sr)
+            rms, flux, onsets, centroid = stem_features(audio)
+            data = {
+                "sr": audio.sr,
+                "rms": rms,
+                "flux": flux,
+                "onsets": onsets,
+                "centroid": centroid,
+                "silence": np.percentile(rms, 10) * 1.5,
+                "duration": audio.duration,
+            }
+        if use_cache:
+            save_npz("analysis", key, **data)
+    else:
+        count("analysis_cache_hits")
+
+    sr = int(data["sr"])
+    rms = data["rms"]
+    return {
+        "sr": sr,
+        "rms": rms,
+        "rms_times": frame_times(len(rms), sr),
+        "flux": data["flux"],
+        "onsets": data["onsets"],
+        "centroid": data["centroid"],
+        "silence": float(data["silence"]),
+        "duration": float(data["duration"])
+    }
+
+# ======================================================
+# MIX ANALYSIS (final song is decoded once)
+# ======================================================
+class MixAnalysis:
+    def __init__(self, path, use_cache=True, sr=ANALYSIS_SR):
+        self.path = path
+
+        key = mix_key(path, sr) if use_cache else None
+        data = load_npz("analysis", key) if use_cache else None
+        if data is None:
+            with stage("mix"):
+                data = self._analyze(path, sr)
+            if use_cache:
+                save_npz("analysis", key, **data)
+        else:
+            count("analysis_cache_hits")
+
+        self.sr = int(data["sr"])
+        self.duration = float(data["duration"])
+        self.onset_env = data["onset_env"]
+        self.beat_times = data["beat_times"]
+        self.onset_times = data["onset_times"]
+        self.rms = data["rms"]
+        self.rms_times = frame_times(len(self.rms), self.sr)
+        self.downbeats = data["downbeat_times"]
+
+        self.sections = [
+            {"start": float(st), "end": float(en), "type": str(label)}
+            for st, en, label in zip(
+                data["section_starts"], data["section_ends"], data["section_types"]
+            )
+        ]
+
+    @staticmethod
+    def features(audio):
+        # rms, the two onset envelopes of one mel spectrogram (beat_track
+        # aggregates with median, onset_detect with mean), and chroma / MFCC
+        # of the same spectrum for the structure analysis
+        import librosa
+        import scipy.fft
+
+        window = librosa.filters.get_window("hann", N_FFT, fftbins=True).astype(np.float32)
+        mel_basis = librosa.filters.mel(sr=audio.sr, n_fft=N_FFT).T
+        chroma_basis = librosa.filters.chroma(sr=audio.sr, n_fft=N_FFT).T.astype(np.float32)
+
+        rms, beat_env, onset_env, chroma, mfcc = [], [], [], [], []
+        loudest = -np.inf
+        prev = None
+        for frames in centered_frames(audio):
+            power = np.abs(np.fft.rfft(frames * window, axis=1)) ** 2
+            S = 10.0 * np.log10(np.maximum(1e-10, power @ mel_basis))
+
+            # power_to_db(top_db=80) against the loudest frame so far
+            run = np.maximum.accumulate(np.maximum(S.max(axis=1), loudest))
+            loudest = run[-1]
+            floor = (run - TOP_DB)[:, None]
+
+            # frame t minus frame t-1, both clipped at frame t's floor
+            rows = S if prev is None else np.vstack([prev, S])
+            floor_rows = floor if prev is None else np.vstack([floor[:1], floor])
+            diff = np.maximum(0.0, np.maximum(rows[1:], floor_rows[1:]) - np.maximum(rows[:-1], floor_rows[1:]))
+
+            rms.append(frame_rms(frames))
+            beat_env.append(np.median(diff, axis=1))
+            onset_env.append(np.mean(diff, axis=1))
+            chroma.append(power @ chroma_basis)
+            mfcc.append(scipy.fft.dct(np.maximum(S, floor), axis=1, norm="ortho")[:, :N_MFCC])
+            prev = S[-1:]
+
+        rms = np.concatenate(rms or [np.zeros(0)])
+        chroma = np.concatenate(chroma or [np.zeros((0, 12))])
+        mfcc = np.concatenate(mfcc or [np.zeros((0, N_MFCC))])
+
+        # onset_strength's lag + centering shift, trimmed to the frame count
+        shift = np.zeros(1 + N_FFT // (2 * HOP_LENGTH))
+        beat_env = np.concatenate([shift] + beat_env)[:len(rms)]
+        onset_env = np.concatenate([shift] + onset_env)[:len(rms)]
+        return rms, beat_env, onset_env, chroma, mfcc
+
+    @staticmethod
+    def _analyze(path, sr=ANALYSIS_SR):
+        import librosa
+
+        audio = AudioStream(path, sr)
+        with stage("features"):
+            rms, beat_env, onset_env, chroma, mfcc = MixAnalysis.features(audio)
+        sr = audio.sr
+
+        with stage("beats"):
+            bpm = estimate_tempo(beat_env, sr)
+            _, beats = librosa.beat.beat_track(onset_envelope=beat_env, sr=sr, hop_length=HOP_LENGTH, bpm=bpm)
+            onset_frames = librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr, hop_length=HOP_LENGTH)
+        beat_times = librosa.frames_to_time(beats, sr=sr, hop_length=HOP_LENGTH)
+
+        with stage("sections"):
+            structure = analyze_structure(beat_times, beats, chroma, mfcc, onset_env, rms, audio.duration)
+            if structure is None:
+                # too few beats to find bars in
+                sections, downbeats = sections_from_rms(rms, frame_times(len(rms), sr)), np.zeros(0)
+            else:
+                sections, downbeats = structure
+
+        return {
+            "sr": sr,
+            "duration": audio.duration,
+            "onset_env": onset_env,
+            "beat_times": beat_times,
+            "onset_times": librosa.frames_to_time(onset_frames, sr=sr, hop_length=HOP_LENGTH),
+            "downbeat_times": downbeats,
+            "rms": rms,
+            "section_starts": np.array([sec["start"] for sec in sections]),
+            "section_ends": np.array([sec["end"] for sec in sections]),
+            "section_types": np.array([sec["type"] for sec in sections]),
+        }
+
+
+def estimate_tempo(onset_env, sr):
+    # what beat_track estimates by itself, but the tempogram (8 s of
+    # autocorrelation per frame, gigabytes for an hour) is averaged a
+    # block of frames at a time instead of being built whole
+    import librosa
+
+    win_length = librosa.time_to_frames(8.0, sr=sr, hop_length=HOP_LENGTH).item()
+    window = librosa.filters.get_window("hann", win_length, fftbins=True)[:, None]
+
+    padded = np.pad(onset_env, win_length // 2, mode="linear_ramp", end_values=[0, 0])
+    frames = librosa.util.frame(padded, frame_length=win_length, hop_length=1)[:, :len(onset_env)]
+
+    total = np.zeros(win_length)
+    for i in range(0, frames.shape[1], TEMPO_BLOCK_FRAMES):
+        block = librosa.autocorrelate(frames[:, i:i + TEMPO_BLOCK_FRAMES] * window, axis=0)
+        total += librosa.util.normalize(block, norm=np.inf, axis=0).sum(axis=1)
+
+    tg = (total / max(frames.shape[1], 1))[:, None]
+    return float(librosa.feature.tempo(tg=tg, sr=sr, hop_length=HOP_LENGTH, aggregate=None)[0])
+
+
+def as_mix_analysis(final_audio):
+    if isinstance(final_audio, MixAnalysis):
+        return final_audio
+    return MixAnalysis(final_audio)
+
+# ======================================================
+# BEAT + ONSET SNAP
+# ======================================================
+def detect_snapped_beats(final_audio, snap_window):
+    mix = as_mix_analysis(final_audio)
+    beat_times = mix.beat_times
+    onset_times = mix.onset_times
+
+    if not len(onset_times):
+        return sorted(set([float(t) for t in beat_times]))
+
+    # nearest onset per beat, ties go to the earlier onset
+    right = np.clip(np.searchsorted(onset_times, beat_times), 0, len(onset_times) - 1)
+    left = np.clip(right - 1, 0, len(onset_times) - 1)
+    use_right = np.abs(onset_times[right] - beat_times) < np.abs(onset_times[left] - beat_times)
+    nearest = np.where(use_right, onset_times[right], onset_times[left])
+
+    snapped = np.where(np.abs(nearest - beat_times) <= snap_window, nearest, beat_times)
+
+    return sorted(set([float(t) for t in snapped]))
+
+# ======================================================
+# SECTION + PHRASE DETECTION
+# ======================================================
+def detect_sections(final_audio):
+    return as_mix_analysis(final_audio).sections
+
+def detect_downbeats(final_audio):
+    return as_mix_analysis(final_audio).downbeats
+
+def sections_from_rms(rms, times):
+    from scipy.signal import medfilt
+
+    rms = medfilt(rms, kernel_size=31)
+
+    thresh = np.percentile(rms, 70)
+    sections = []
+    current = None
+
+    for t, e in zip(times, rms):
+        label = "chorus" if e >= thresh else "verse"
+        if current is None or current["type"] != label:
+            current = {"start": t, "type": label}
+            sections.append(current)
+
+    for i in range(len(sections)):
+        sections[i]["end"] = sections[i + 1]["start"] if i + 1 < len(sections) else times[-1]
+
+    return sections
+
+
+# ======================================================
+# PARALLEL ANALYSIS
+# ======================================================
+ANALYSIS_WORKERS = os.cpu_count() or 1
+
+# kept alive between renders so workers pay the librosa/numba warm-up once
+# (and shared by every song of a batch, see stemsync.py)
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+def get_pool(workers):
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_workers = workers
+        return _pool
+
+def replace_pool(broken):
+    # a worker died (usually out of memory) and took every job still in the
+    # pool with it; the first song to notice drops it, the next call starts a
+    # fresh one, a fresh one another song already started is left alone
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is broken:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+            _pool_workers = 0
+
+def run_analysis(pool, stem_paths, mix_path, sr, results):
+    # every job not in results yet; results fill up as jobs finish,
+    # so after a broken pool only the unfinished ones are run again
+    jobs = {}
+    if mix_path and "mix" not in results:
+        # the mix is the longest single job, start it first
+        jobs["mix"] = pool.submit(measured, MixAnalysis, mix_path, True, sr)
+    for p in stem_paths:
+        if p not in results:
+            jobs[p] = pool.submit(measured, analyze_audio, p, True, sr)
+    for key, job in jobs.items():
+        results[key] = merged(job)
+
+def analyze_all(stem_paths, mix_path=None, workers=ANALYSIS_WORKERS, sr=ANALYSIS_SR):
+    stem_paths = list(dict.fromkeys(stem_paths))
+    jobs = len(stem_paths) + (1 if mix_path else 0)
+    workers = max(1, int(workers))
+
+    # when everything is cached, loading is a few ms, not worth a trip through the pool
+    cached = all(has_npz("analysis", stem_key(p, sr)) for p in stem_paths) and (
+        not mix_path or has_npz("analysis", mix_key(mix_path, sr))
+    )
+
+    if min(workers, jobs) == 1 or cached:
+        stems = {p: analyze_audio(p, sr=sr) for p in stem_paths}
+        mix = MixAnalysis(mix_path, sr=sr) if mix_path else None
+        return stems, mix
+
+    # the pool is sized by the setting, not by this song's file count,
+    # so songs with different stem counts keep sharing one pool
+    results = {}
+    pool = get_pool(workers)
+    try:
+        run_analysis(pool, stem_paths, mix_path, sr, results)
+    except BrokenProcessPool:
+        replace_pool(pool)
+        # the worker that died may have been running another song of a batch:
+        # the rest of this song runs in a pool of its own, if that one breaks
+        # too it was this song, and only this song fails
+        log.warning(f"Analysis worker died, retrying {jobs - len(results)} file(s) on their own")
+        own = ProcessPoolExecutor(max_workers=min(workers, jobs))
+        try:
+            run_analysis(own, stem_paths, mix_path, sr, results)
+        except BrokenProcessPool as e:
+            missing = [p for p in stem_paths if p not in results]
+            if mix_path and "mix" not in results:
+                missing.append(mix_path)
+            raise BrokenProcessPool(
+                "An analysis worker died (out of memory?) on " + ", ".join(os.path.basename(p) for p in missing)
+            ) from e
+        finally:
+            own.shutdown(wait=False, cancel_futures=True)
+
+    return {p: results[p] for p in stem_paths}, results.get("mix")
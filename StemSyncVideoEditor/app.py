@@ -1,526 +1,104 @@
 
 import gradio as gr
-import librosa
-import numpy as np
-import os
-import tempfile
-from moviepy.editor import VideoFileClip, concatenate_videoclips, AudioFileClip
-from scipy.signal import medfilt
-import shutil, tempfile, os
-from moviepy.editor import vfx
 
+from analysis import ANALYSIS_WORKERS
+from encoding import DEFAULT_PROFILE, ENCODING_PROFILES, output_fps, resolve_profile
+from jobs import RENDER_JOBS, JobCancelled, get_queue, wait_job
+from metrics import setup_logging
+from pipeline import (
+    RENDER_BACKENDS, RENDER_WORKERS, EditError, file_path, preview_edit, render_edit, sweep_edit,
+    timeline_edit
+)
+from proxies import prepare_proxies
+from scenes import prepare_scenes
 
 
-DEBUG = True
-def debug(msg):
-    if DEBUG:
-        print(msg)
-
-def base(path):
-    return os.path.splitext(os.path.basename(path))[0].lower()
-
-def get_default_output_path():
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    out = os.path.join(script_dir, "output")
-    os.makedirs(out, exist_ok=True)
-    i = 1
-    while True:
-        p = os.path.join(out, f"render_{i:03d}.mp4")
-        if not os.path.exists(p):
-            return p
-        i += 1
-
-
-# ======================================================
-# intro / outro clips
-# ======================================================        
-def find_optional_clip(name):
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    path = os.path.join(script_dir, name)
-    return path if os.path.exists(path) else None
-
-# ======================================================
-# AUDIO ANALYSIS
-# ======================================================
-def analyze_audio(path):
-    y, sr = librosa.load(path, sr=None, mono=True)
-    rms = librosa.feature.rms(y=y)[0]
-    rms_times = librosa.frames_to_time(np.arange(len(rms)), sr=sr)
-    silence = np.percentile(rms, 10) * 1.5
-    duration = librosa.get_duration(y=y, sr=sr)
-    return {
-        "y": y,
-        "sr": sr,
-        "rms": rms,
-        "rms_times": rms_times,
-        "silence": silence,
-        "duration": duration
-    }
-# ======================================================
-# stabilize_video
-# ======================================================
-def stabilize_video(path):
-    return path
-
-# ======================================================
-# next beat after
-# ======================================================
-def next_beat_after(beats, t):
-    for b in beats:
-        if b >= t:
-            return b
-    return t
-
-# ======================================================
-# BEAT + ONSET SNAP
-# ======================================================
-def detect_snapped_beats(final_audio_path, snap_window):
-    y, sr = librosa.load(final_audio_path, sr=None, mono=True)
-
-    _, beats = librosa.beat.beat_track(y=y, sr=sr)
-    beat_times = librosa.frames_to_time(beats, sr=sr)
-
-    onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-    onset_frames = librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr)
-    onset_times = librosa.frames_to_time(onset_frames, sr=sr)
-
-    snapped = []
-    for b in beat_times:
-        nearest = min(onset_times, key=lambda o: abs(o - b)) if len(onset_times) else b
-        if abs(nearest - b) <= snap_window:
-            snapped.append(nearest)
-        else:
-            snapped.append(b)
-
-    return sorted(set([float(t) for t in snapped]))
-
-# ======================================================
-# SECTION + PHRASE DETECTION
-# ======================================================
-def detect_sections(final_audio_path):
-    y, sr = librosa.load(final_audio_path, sr=None, mono=True)
-    rms = librosa.feature.rms(y=y)[0]
-    rms = medfilt(rms, kernel_size=31)
-    times = librosa.frames_to_time(np.arange(len(rms)), sr=sr)
-
-    thresh = np.percentile(rms, 70)
-    sections = []
-    current = None
-
-    for t, e in zip(times, rms):
-        label = "chorus" if e >= thresh else "verse"
-        if current is None or current["type"] != label:
-            current = {"start": t, "type": label}
-            sections.append(current)
-
-    for i in range(len(sections)):
-        sections[i]["end"] = sections[i + 1]["start"] if i + 1 < len(sections) else times[-1]
-
-    return sections
-
-def section_at_time(sections, t):
-    for s in sections:
-        if s["start"] <= t < s["end"]:
-            return s["type"]
-    return "verse"
-
-# ======================================================
-# FreeClipCycler
-# ======================================================
-class FreeClipCycler:
-    def __init__(self, clips):
-        self.clips = clips
-        self.idx = 0
-        self.phase = 0  # 0 = normal, 1 = mirrored+reversed
-
-    def next(self):
-        clip = self.clips[self.idx]
-
-        transform = []
-        if self.phase == 1:
-            transform = ["mirror", "reverse"]
-
-        self.idx += 1
-        if self.idx >= len(self.clips):
-            self.idx = 0
-            self.phase = (self.phase + 1) % 2
-
-        return clip, transform
-
-# ======================================================
-# BEAT-LOCKED TIMELINE
-# ======================================================
-def generate_timeline(
-    audio_files,
-    video_files,
-    beat_times,
-    sections,
-    cooldown,
-    song_length,
-    chorus_aggression,
-    phrase_beats,
-    downbeat_bias,
-    free_cycler,
-    free_clip_probability
-):
-    audio = {base(f.name): analyze_audio(f.name) for f in audio_files}
-    video_map = {base(f.name): f.name for f in video_files}
-    stems = [s for s in audio if s in video_map]
-
-    if not stems:
-        raise gr.Error("No matching audio/video stem names")
-
-    vocal_stem = next((s for s in stems if "voc" in s or "vox" in s), None)
-
-    timeline = []
-    current = stems[0]
-    last_used = {s: -999.0 for s in stems}
-    last_cut_beat = -999
-
-    for idx, t in enumerate(beat_times):
-        if t >= song_length:
-            break
-
-        # Downbeat emphasis (favor every N beats)
-        if downbeat_bias > 0 and idx % int(downbeat_bias) != 0:
-            continue
-
-        section = section_at_time(sections, t)
-
-        # Chorus aggression: lower = more cuts
-        min_beats = max(1, int(phrase_beats * (1 - chorus_aggression))) if section == "chorus" else phrase_beats
-
-        if idx - last_cut_beat < min_beats:
-            continue
-
-        energy = {}
-        active = []
-
-        for s in stems:
-            if t > audio[s]["duration"]:
-                e = 0.0
-            else:
-                e = np.interp(t, audio[s]["rms_times"], audio[s]["rms"])
-            energy[s] = e
-            if e > audio[s]["silence"]:
-                active.append(s)
-
-        candidates = []
-        for s in active:
-            if s == current:
-                continue
-            if t - last_used[s] < cooldown:
-                continue
-            if s == vocal_stem and s not in active:
-                continue
-            candidates.append(s)
-
-        if candidates:
-            stem = max(candidates, key=lambda s: energy[s])
-        elif len(active) == 0:
-            stem = np.random.choice([s for s in stems if s != current])
-        else:
-            continue
-        is_final_cut = (t >= song_length - 0.05)
-
-
-        use_free = (
-            free_cycler is not None
-            and not is_final_cut
-            and np.random.rand() < free_clip_probability
-        )
-
-
-        if use_free:
-            clip_path, transform = free_cycler.next()
-            timeline.append({
-                "time": t,
-                "type": "free",
-                "clip": clip_path,
-                "transform": transform,
-                "beat_idx": idx,
-                "section": section
-            })
-        else:
-            timeline.append({
-                "time": t,
-                "type": "stem",
-                "stem": stem,
-                "beat_idx": idx,
-                "section": section
-            })
-
-
-        last_used[stem] = t
-        current = stem
-        last_cut_beat = idx
-
-    if not timeline or timeline[-1]["time"] < song_length:
-        timeline.append({
-            "time": song_length,
-            "type": "stem",
-            "stem": current,
-            "beat_idx": len(beat_times),
-            "section": section_at_time(sections, song_length)
-        })
-
-    return timeline, stems, video_map
-
-
-def normalize_video(path, song_len, safe_start=0.05):
-    path = stabilize_video(path)
-    base = VideoFileClip(path, audio=False)
-
-    if base.duration <= safe_start:
-        raise RuntimeError(f"Video too short to use: {path}")
-
-    if base.duration >= song_len + safe_start:
-        # simple trim
-        return base.subclip(safe_start, safe_start + song_len)
-
-    # loop until long enough
-    loops = int(np.ceil((song_len + safe_start) / base.duration))
-    looped = concatenate_videoclips([base] * loops)
-
-    return looped.subclip(safe_start, safe_start + song_len)
-
-
-# ======================================================
-# write_edit_summary
-# ======================================================
-import json
-
-def write_edit_summary(timeline, output_path):
-    summary = []
-
-    for i in range(len(timeline) - 1):
-        start = timeline[i]["time"]
-        end = timeline[i + 1]["time"]
-
-        summary.append({
-            "clip": (
-                os.path.basename(timeline[i]["clip"])
-                if timeline[i].get("type") in ("free", "intro", "outro")
-                else f"{timeline[i]['stem']}.mp4"
-            ),
-
-            "timeline_start": round(start, 3),
-            "timeline_end": round(end, 3),
-            "source_start": (
-                0.0 if timeline[i].get("type") == "free"
-                else round(start, 3)
-            ),
-            "duration": round(end - start, 3)
-        })
-
-    json_path = os.path.splitext(output_path)[0] + ".json"
-    with open(json_path, "w") as f:
-        json.dump(summary, f, indent=2)
-
-    return json_path
-
-# ======================================================
-# VIDEO BUILD
-# ======================================================
-def build_video(timeline, stems, video_map, song_length, final_audio_path, output_path):
-    SAFE_START = 0.05  # never allow frame-0 access
-
-    videos = {
-        s: normalize_video(video_map[s], song_length)
-        for s in stems
-    }
-
-    segments = []
-    start = 0.0
-    free_clip_cache = {}
-
-    # for e in timeline:
-    #     end = e["time"]
-    #     if end <= start:
-    #         continue
-    for e in timeline:
-        end = e.get("end", e["time"])
-
-        # allow intro/outro at same timestamp as start
-        if e.get("type") not in ("intro", "outro") and end <= start:
-            continue
-
-
-        # 🔒 critical clamp
-        clip_start = max(start, SAFE_START)
-        clip_end = max(end, clip_start + 0.001)
-        duration = clip_end - clip_start
-
-        # intro/outro are standalone clips — do not clamp
-        if e.get("type") in ("intro", "outro"):
-            clip_start = 0.0
-            duration = end - start        
-
-     
-
-        if e.get("type") in ("intro", "outro"):
-            clip = VideoFileClip(e["clip"], audio=False)
-            clip = clip.subclip(0, duration)
-            segments.append(clip)
-            start = end
-            continue
-
-
-
-        if e.get("type") == "free":
-            if e["clip"] not in free_clip_cache:
-                free_clip_cache[e["clip"]] = VideoFileClip(e["clip"], audio=False)
-
-            base = free_clip_cache[e["clip"]]
-            base_dur = base.duration
-
-            if duration <= base_dur:
-                clip = base.subclip(0, duration)
-            else:
-                # 🔴 IMPORTANT: re-open the clip to get a fresh reader
-                SAFE = 0.05
-
-                forward = VideoFileClip(e["clip"], audio=False).subclip(SAFE, base_dur)
-                reverse = forward.fx(vfx.time_mirror)
-
-
-                combined = concatenate_videoclips([forward, reverse])
-                clip = combined.subclip(0, duration)
-
-
-            if "mirror" in e.get("transform", []):
-                clip = clip.fx(vfx.mirror_x)
-            if "reverse" in e.get("transform", []):
-                clip = clip.fx(vfx.time_mirror)
-
-            segments.append(clip)
-            # base.close()
-            # if duration > base_dur:
-            #     combined.close()
-
-
-
-        else:
-            segments.append(
-                videos[e["stem"]].subclip(clip_start, clip_end)
-            )
-
-
-
-        start = end
-
-    final = concatenate_videoclips(segments, method="compose")
-
-    audio = AudioFileClip(final_audio_path)
-    final = final.set_audio(audio).set_duration(audio.duration)
-
-    final.write_videofile(
-        output_path,
-        fps=24,
-        codec="libx264",
-        audio=True
-    )
-
-
-    for clip in free_clip_cache.values():
-        clip.close()
-
-    return output_path
-
 # ======================================================
 # GRADIO UI
+# the callbacks take the inputs in the order of the
+# *_edit functions in pipeline.py
 # ======================================================
-def render_action(
-    audio_files,
-    video_files,
-    free_video_files,
-    final_audio,
-    snap_window,
-    chorus_aggression,
-    phrase_beats,
-    downbeat_bias,
-    cooldown,
-    free_clip_probability,
-    intro_min,
-    outro_min,
-    output
-):
-
-    if not final_audio:
-        raise gr.Error("Final mix required")
-
-    if not output:
-        output = get_default_output_path()
-
-    beat_times = detect_snapped_beats(final_audio.name, snap_window)
-    sections = detect_sections(final_audio.name)
-    song_len = AudioFileClip(final_audio.name).duration
-    intro_clip = find_optional_clip("intro.mp4")
-    outro_clip = find_optional_clip("outro.mp4")
-    INTRO_MIN = intro_min
-    OUTRO_MIN = outro_min
-
-
-
-
-    free_cycler = (
-        FreeClipCycler([f.name for f in free_video_files])
-        if free_video_files else None
-    )
-
-    timeline, stems, video_map = generate_timeline(
-        audio_files,
-        video_files,
-        beat_times,
-        sections,
-        cooldown,
-        song_len,
-        chorus_aggression,
-        phrase_beats,
-        downbeat_bias,
-        free_cycler,
-        free_clip_probability
-    )
-
-    if intro_clip:
-        intro_end = next_beat_after(beat_times, INTRO_MIN)
-
-        # remove anything that would play during intro
-        timeline = [
-            e for e in timeline
-            if e["time"] >= intro_end
-        ]
-
-        # intro behaves exactly like b-roll, but fixed at start
-        timeline.append({
-            "time": 0.0,
-            "end": intro_end,
-            "type": "free",
-            "clip": intro_clip,
-            "transform": []
-        })
-
-    if outro_clip:
-        outro_start = next_beat_after(
-            beat_times,
-            song_len - OUTRO_MIN
-        )
-
-        timeline.append({
-            "time": outro_start,
-            "end": song_len,
-            "type": "free",
-            "clip": outro_clip,
-            "transform": []
-        })
-
-    # ✅ ensure intro/outro and beat cuts are in correct order
-    timeline = sorted(timeline, key=lambda e: e["time"])
-    path = build_video(timeline, stems, video_map, song_len, final_audio.name, output)
-    write_edit_summary(timeline, output)
-
-
-    return f"Render complete: {path}"
+def queue_proxies(video_files, free_video_files, use_proxies, stabilize, encoding_profile):
+    # at the frame rate and size the render will use, stabilized first when stabilization is on
+    if not use_proxies:
+        return
+    videos = [file_path(f) for f in video_files or []]
+    settings = resolve_profile(encoding_profile)
+    fps = output_fps(settings, videos)
+    prepare_proxies(videos + [file_path(f) for f in free_video_files or []], fps, stabilize, settings["height"])
+
+def queue_scenes(files):
+    prepare_scenes([file_path(f) for f in files or []])
+
+# every action is a job on the shared render queue; the job id is
+# sent to the page first so the Cancel button can find it
+def follow(job, progress):
+    try:
+        return wait_job(job, lambda fraction, desc: progress(fraction, desc=desc))
+    except EditError as e:
+        raise gr.Error(str(e))
+
+def render_action(*inputs, progress=gr.Progress()):
+    job = get_queue().submit(render_edit, *inputs, label="Render")
+    try:
+        yield "Render queued", job.id
+        path = follow(job, progress)
+    except JobCancelled:
+        yield "Render cancelled", None
+        return
+    finally:
+        # the page went away mid-job
+        if not job.future.done():
+            job.cancel()
+
+    yield f"Render complete: {path}", None
+
+def preview_action(*inputs, progress=gr.Progress()):
+    job = get_queue().submit(preview_edit, *inputs, label="Preview")
+    try:
+        yield gr.skip(), "Preview queued", gr.skip(), job.id
+        path, cuts, seed = follow(job, progress)
+    except JobCancelled:
+        yield gr.skip(), "Preview cancelled", gr.skip(), None
+        return
+    finally:
+        if not job.future.done():
+            job.cancel()
+
+    yield path, f"Preview ready ({cuts} cuts, seed {seed})", seed, None
+
+def timeline_action(*inputs, progress=gr.Progress()):
+    job = get_queue().submit(timeline_edit, *inputs, label="Timeline")
+    try:
+        yield gr.skip(), "Timeline queued", gr.skip(), job.id
+        paths, cuts, seed = follow(job, progress)
+    except JobCancelled:
+        yield gr.skip(), "Timeline cancelled", gr.skip(), None
+        return
+    finally:
+        if not job.future.done():
+            job.cancel()
+
+    yield paths, f"Timeline written ({cuts} cuts, seed {seed}): {paths[0]}", seed, None
+
+def sweep_action(*inputs, progress=gr.Progress()):
+    job = get_queue().submit(sweep_edit, *inputs, label="Sweep")
+    try:
+        yield gr.skip(), gr.skip(), "Sweep queued", job.id
+        table, paths, combinations, variants = follow(job, progress)
+    except JobCancelled:
+        yield gr.skip(), gr.skip(), "Sweep cancelled", None
+        return
+    finally:
+        if not job.future.done():
+            job.cancel()
+
+    yield table, paths, f"Sweep complete: {combinations} combinations, {variants} distinct timelines", None
+
+def cancel_action(job_id):
+    if job_id is None or not get_queue().cancel(job_id):
+        return "Nothing to cancel"
+    return "Cancelling…"
 
 # with gr.Blocks() as app:
 #     gr.Markdown("## 🎬 Stem-Sync Video Editor")
@@ -585,11 +163,11 @@ with gr.Blocks() as app:
             label="Downbeat Emphasis"
         )
         gr.Markdown(
-            "- **What it does:** Restricts cuts to every N beats.\n"
+            "- **What it does:** Restricts cuts to every N beats, counted from the bar starts found in the final mix.\n"
             "- **0:** Off (can cut on any beat).\n"
             "- **2:** Cuts favor every 2 beats.\n"
-            "- **4:** Bar-level feel in 4/4.\n"
-            "- **8:** Even fewer cut opportunities."
+            "- **4:** Cuts on the first beat of every bar (4/4), even after a pickup or a short bar.\n"
+            "- **8:** Even fewer cut opportunities (every other bar)."
         )
 
     with gr.Accordion("Camera Cooldown (seconds) — click for details", open=False):
@@ -640,31 +218,297 @@ with gr.Blocks() as app:
             "- **10:** Outro starts earlier so it can run at least 10s to the song end."
         )
 
+    with gr.Accordion("Analysis Workers — click for details", open=False):
+        analysis_workers = gr.Slider(
+            1, max(2, ANALYSIS_WORKERS), ANALYSIS_WORKERS, step=1,
+            label="Analysis Workers"
+        )
+        gr.Markdown(
+            "- **What it does:** How many processes analyse stems and the final mix at the same time.\n"
+            "- **1:** One file after another (lowest memory use).\n"
+            "- **Default:** One per CPU core.\n"
+            "- Lower it if the machine runs out of memory on long songs with many stems."
+        )
+
+    with gr.Accordion("Analysis Sample Rate — click for details", open=False):
+        analysis_sr = gr.Dropdown(
+            [("Native", 0), ("22050 Hz", 22050), ("11025 Hz", 11025)], value=0,
+            label="Analysis Sample Rate"
+        )
+        gr.Markdown(
+            "- **What it does:** Sample rate the stems and final mix are resampled to before beat, onset and energy analysis.\n"
+            "- **Native:** Each file is analysed at its own rate (original behaviour).\n"
+            "- **22050 / 11025:** Faster analysis of long songs; detected beats, and so the cuts, can differ from Native.\n"
+            "- Audio is read in blocks either way, memory use does not grow with song length."
+        )
+
+    with gr.Accordion("Source Scene Cuts — click for details", open=False):
+        scene_mode = gr.Dropdown(
+            [("Ignore", "off"), ("Avoid", "avoid"), ("Prefer (hide them)", "prefer")], value="off",
+            label="Hard Cuts Inside Videos"
+        )
+        scene_window = gr.Slider(
+            0.1, 2.0, 0.5, step=0.1,
+            label="Scene Cut Window (seconds)"
+        )
+        gr.Markdown(
+            "- **What it does:** Finds hard cuts inside each camera video (e.g. between generated sets,\n"
+            "  or where a short video loops) and keeps them away from camera switches.\n"
+            "- **Ignore:** Original behaviour, videos are not scanned.\n"
+            "- **Avoid:** Never switches to a camera that jumps within the window of the cut.\n"
+            "- **Prefer:** Same, and also cuts away from a camera right where it jumps, so the jump is never seen\n"
+            "  (even between the usual beats, phrase length and downbeat emphasis are ignored for that cut).\n"
+            "- Videos are scanned at low resolution in the background as soon as they are uploaded, and cached."
+        )
+
+    with gr.Accordion("Camera Choice — click for details", open=False):
+        energy_metric = gr.Dropdown(
+            [("Loudness (RMS)", "rms"), ("Spectral flux", "flux"), ("Onset density", "onsets"),
+             ("Brightness (spectral centroid)", "centroid")], value="rms",
+            label="Camera Choice Metric"
+        )
+        gr.Markdown(
+            "- **What it does:** At each cut, the playing stem scoring highest on this metric gets the camera.\n"
+            "- **Loudness (RMS):** Original behaviour, the loudest stem wins (bass and pads often do).\n"
+            "- **Spectral flux:** How much the sound is changing, favours busy, moving parts.\n"
+            "- **Onset density:** Notes / hits per second, a vocal line or hi-hats beat a held bass note.\n"
+            "- **Brightness:** Favours higher-pitched stems (vocals, leads, cymbals).\n"
+            "- Whether a stem is playing at all is always decided by loudness. All metrics come from one analysis pass."
+        )
+
+    with gr.Accordion("Render Backend — click for details", open=False):
+        render_backend = gr.Dropdown(
+            RENDER_BACKENDS, value="moviepy",
+            label="Render Backend"
+        )
+        gr.Markdown(
+            "- **What it does:** Chooses how the final video is assembled and encoded.\n"
+            "- **moviepy:** Original renderer, every frame goes through Python.\n"
+            "- **ffmpeg:** Builds the whole edit as one ffmpeg filter graph. Much faster, same cuts.\n"
+            "- **stream:** Walks the edit cut by cut through a few open readers into one encoder.\n"
+            "  Memory stays flat however long the song or however many cuts, same cuts as the others.\n"
+            "- **smart:** Copies the middle of each cut straight out of the proxies and only encodes the few\n"
+            "  frames around every cut. Fastest on long shots, same cuts; the file is larger (proxy quality).\n"
+            "  Needs **Render from mezzanine proxies** on, otherwise it renders like ffmpeg.\n"
+            "- The edit summary `.json` is identical for all of them."
+        )
+
+    with gr.Accordion("Parallel Render (ffmpeg backend) — click for details", open=False):
+        render_workers = gr.Slider(
+            1, max(2, RENDER_WORKERS), 1, step=1,
+            label="Render Workers"
+        )
+        chunk_seconds = gr.Slider(
+            0, 120, 0, step=5,
+            label="Chunk Length (seconds, 0 = auto)"
+        )
+        gr.Markdown(
+            "- **What it does:** Splits the edit into chunks on cut boundaries and encodes them side by side,\n"
+            "  then joins them without re-encoding. Timing is the same as a single render.\n"
+            "- **1 worker:** One encoder for the whole song.\n"
+            "- **Chunk Length 0:** One chunk per worker. Shorter chunks balance better when cuts are uneven."
+        )
+
+    with gr.Accordion("Incremental Re-render — click for details", open=False):
+        incremental = gr.Checkbox(
+            value=False,
+            label="Reuse unchanged segments (ffmpeg backend)"
+        )
+        seed = gr.Number(
+            value=-1, precision=0,
+            label="Random Seed (-1 = new random edit every render)"
+        )
+        gr.Markdown(
+            "- **What it does:** Encodes every cut on its own and keeps it in `cache/segments`.\n"
+            "  On the next render only cuts that changed are encoded again.\n"
+            "- **Random Seed:** Fix it (e.g. 1) so B-roll picks and random camera choices stay the same\n"
+            "  between renders. Otherwise almost every cut changes and nothing can be reused.\n"
+            "- **Preview / Timeline Only:** Fill in a seed when it is -1, so the next Render cuts exactly like them.\n"
+            "  Set it back to -1 to get new random edits again."
+        )
+
+    with gr.Accordion("Mezzanine Proxies — click for details", open=False):
+        use_proxies = gr.Checkbox(
+            value=True,
+            label="Render from mezzanine proxies"
+        )
+        gr.Markdown(
+            "- **What it does:** Each video is transcoded once (at the output frame rate and height, keyframe\n"
+            "  every 12 frames) into `cache/proxies` as soon as it is uploaded. Renders then seek in the proxy,\n"
+            "  which is much faster for long AI-generated videos with few keyframes.\n"
+            "- **Off:** Renders read the original files directly."
+        )
+
+    with gr.Accordion("Encoding Profile — click for details", open=False):
+        encoding_profile = gr.Dropdown(
+            list(ENCODING_PROFILES), value=DEFAULT_PROFILE,
+            label="Encoding Profile"
+        )
+        gr.Markdown(
+            "- **What it does:** Frame rate, quality and file type of the render.\n"
+            "- **standard:** 24 fps, x264 medium, CRF 23, MP4 (original behaviour).\n"
+            "- **draft:** 24 fps, faster encode, lower quality, at most 720 pixels tall.\n"
+            "- **match source:** Like standard, at the frame rate most camera videos share (e.g. 30 or 60 fps).\n"
+            "- **high quality:** Source frame rate, slower encode, CRF 18.\n"
+            "- **master:** Source frame rate, near-lossless 10-bit 4:2:2 MOV for grading or further editing.\n"
+            "- The final song is copied into the video as it is when the file type allows it\n"
+            "  (e.g. AAC/MP3 into MP4, WAV into MOV), otherwise it is encoded to AAC.\n"
+            "- The Smart backend copies video straight from the proxies, so it keeps their quality settings\n"
+            "  (a warning says so) and stops with an error on 10-bit / 4:2:2 profiles unless proxies are off.\n"
+            "  MoviePy only writes 8-bit 4:2:0 and stops with an error on those profiles too."
+        )
+
+    with gr.Accordion("Stabilization — click for details", open=False):
+        stabilize = gr.Dropdown(
+            [("Off", "off"), ("Auto", "auto"), ("Deshake", "deshake"), ("vid.stab (two-pass)", "vidstab")],
+            value="off",
+            label="Stabilize Videos"
+        )
+        gr.Markdown(
+            "- **What it does:** Smooths out camera shake in every camera video and free clip before cutting.\n"
+            "- **Off:** Original behaviour, videos are used as they are.\n"
+            "- **Auto:** vid.stab when this ffmpeg was built with it, Deshake otherwise.\n"
+            "- **Deshake:** ffmpeg's built-in single-pass stabilizer, quicker but less smooth.\n"
+            "- **vid.stab:** Measures the camera path over the whole video first, then smooths it. Best result, slowest.\n"
+            "- Videos are stabilized in the background as soon as they are uploaded (or this is changed),\n"
+            "  and kept in `cache/stabilized`, so a render only waits for files that are not done yet."
+        )
+
 
     output_path = gr.Textbox(label="Save Final As")
 
-    render_btn = gr.Button("Render")
+    with gr.Tab("Edit"):
+        with gr.Row():
+            timeline_btn = gr.Button("Timeline Only")
+            preview_btn = gr.Button("Preview")
+            render_btn = gr.Button("Render")
+        preview = gr.Video(label="Preview (360p, 12 fps)")
+        edit_files = gr.File(label="Edit Summary / EDL / OTIO", file_count="multiple")
+
+    with gr.Tab("Parameter Sweep"):
+        with gr.Row():
+            sweep_chorus = gr.Textbox(label="Chorus Aggression values", placeholder="e.g. 0.2, 0.5, 0.9")
+            sweep_phrase = gr.Textbox(label="Phrase Length values", placeholder="e.g. 2, 4, 8")
+            sweep_cooldown = gr.Textbox(label="Camera Cooldown values", placeholder="e.g. 1.5, 3, 6")
+            sweep_seeds = gr.Textbox(label="Seeds", placeholder="e.g. 1, 2, 3")
+        with gr.Row():
+            sweep_mode = gr.Dropdown(
+                [("Timelines only", "timeline"), ("Previews", "preview"), ("Full renders", "render")],
+                value="preview", label="Sweep Output"
+            )
+            sweep_jobs = gr.Slider(
+                1, max(2, RENDER_WORKERS), 2, step=1,
+                label="Variants rendered at once"
+            )
+        gr.Markdown(
+            "- **What it does:** Tries every combination of the values above. The audio is analysed once,\n"
+            "  combinations that cut exactly alike are rendered once, and a table compares the results.\n"
+            "- **Empty field:** Uses the slider (or the Random Seed; a random one when it is -1).\n"
+            "- **Previews / Full renders:** Saved next to **Save Final As** as `<name>_v01.mp4`, `<name>_v02.mp4`, …\n"
+            "  with their edit summaries, plus `<name>_sweep.csv`. Full renders use the Render Backend setting.\n"
+            "- **Variants rendered at once:** More finishes sooner on a big machine, each render also uses several cores."
+        )
+        sweep_btn = gr.Button("Run Sweep")
+        sweep_table = gr.Dataframe(label="Cuts and screen time per variant", interactive=False)
+        sweep_files = gr.File(label="Variants / Sweep Table", file_count="multiple")
+
+    cancel_btn = gr.Button("Cancel", variant="stop")
+    gr.Markdown(
+        f"Renders from every open tab share one queue, {RENDER_JOBS} at a time "
+        "(set `STEMSYNC_RENDER_JOBS` before starting the app to change it); the rest wait their turn."
+    )
     status = gr.Textbox()
+    job_id = gr.State(None)
+
+    timeline_inputs = [
+        audio_files,
+        video_files,
+        free_video_files,
+        final_audio,
+        snap_window,
+        chorus_aggression,
+        phrase_beats,
+        downbeat_bias,
+        cooldown,
+        free_clip_probability,
+        intro_min,
+        outro_min,
+        analysis_workers,
+        analysis_sr,
+        scene_mode,
+        scene_window,
+        energy_metric,
+    ]
+
+    # no video at all, just the cut list for checking or conforming in an NLE
+    # the render queue limits how many jobs run, not Gradio
+    timeline_btn.click(
+        timeline_action,
+        inputs=timeline_inputs + [seed, encoding_profile, output_path],
+        outputs=[edit_files, status, seed, job_id],
+        concurrency_limit=None
+    )
+
+    preview_btn.click(
+        preview_action,
+        inputs=timeline_inputs + [render_workers, seed, use_proxies, stabilize, encoding_profile],
+        outputs=[preview, status, seed, job_id],
+        concurrency_limit=None
+    )
 
     render_btn.click(
         render_action,
-        inputs=[
-            audio_files,
-            video_files,
-            free_video_files,
-            final_audio,
-            snap_window,
-            chorus_aggression,
-            phrase_beats,
-            downbeat_bias,
-            cooldown,
-            free_clip_probability,
-            intro_min,
-            outro_min,
+        inputs=timeline_inputs + [
+            render_backend,
+            render_workers,
+            chunk_seconds,
+            incremental,
+            seed,
+            use_proxies,
+            stabilize,
+            encoding_profile,
+            output_path
+        ],
+        outputs=[status, job_id],
+        concurrency_limit=None
+    )
+
+    # one job for the whole grid, cancelled as one
+    sweep_btn.click(
+        sweep_action,
+        inputs=timeline_inputs + [
+            sweep_chorus,
+            sweep_phrase,
+            sweep_cooldown,
+            sweep_seeds,
+            sweep_mode,
+            sweep_jobs,
+            render_backend,
+            render_workers,
+            incremental,
+            seed,
+            use_proxies,
+            stabilize,
+            encoding_profile,
             output_path
         ],
-        outputs=status
+        outputs=[sweep_table, sweep_files, status, job_id],
+        concurrency_limit=None
     )
-app.launch()
+
+    cancel_btn.click(cancel_action, inputs=job_id, outputs=status, concurrency_limit=None)
+
+    # start transcoding proxies while the user is still setting sliders
+    sources = [video_files, free_video_files, use_proxies, stabilize, encoding_profile]
+    for uploads in (video_files, free_video_files):
+        uploads.upload(queue_proxies, inputs=sources, outputs=None)
+    for setting in (use_proxies, stabilize, encoding_profile):
+        setting.change(queue_proxies, inputs=sources, outputs=None)
+    # and scanning the camera videos for hard cuts
+    video_files.upload(queue_scenes, inputs=video_files, outputs=None)
+
+if __name__ == "__main__":
+    setup_logging()
+    app.launch()
 ##app.launch(allowed_paths=["."])
 
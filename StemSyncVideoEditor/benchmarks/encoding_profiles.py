@@ -0,0 +1,265 @@
+# End-to-end checks of the encoding profiles on a short synthetic project
+# (the pipeline_stages inputs, 30 fps camera videos), driven through the
+# headless CLI the way a project file would be. Exits non-zero when any
+# check fails, so it can gate a commit.
+#
+#   python benchmarks/encoding_profiles.py --profile "match source"
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+from fractions import Fraction
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import cache
+from encoding import ENCODING_PROFILES, resolve_profile
+from media import FFMPEG_BIN, FFPROBE_BIN, run_ffmpeg
+from metrics import log
+from pipeline import EditError
+from pipeline_stages import make_project
+from stemsync import load_project, render_project, sweep_project, timeline_project
+
+
+def probe_stream(path):
+    # (frame rate, frames, pixel format) of the first video stream
+    out = subprocess.run(
+        [FFPROBE_BIN, "-v", "error", "-show_entries", "stream=codec_type,r_frame_rate,pix_fmt,nb_frames",
+         "-of", "json", path],
+        capture_output=True, text=True, check=True
+    ).stdout
+    video = next(st for st in json.loads(out)["streams"] if st["codec_type"] == "video")
+    return video["r_frame_rate"], int(video["nb_frames"]), video["pix_fmt"]
+
+
+def check(results, name, ok, detail=""):
+    results.append(ok)
+    print(f"{'ok  ' if ok else 'FAIL'} {name}" + (f"  ({detail})" if detail else ""))
+
+
+# ======================================================
+# CHECKS
+# ======================================================
+def check_sweep(results, project, tmp, profile):
+    # a sweep through a non-default profile, every mode
+    for mode in ("timeline", "preview", "render"):
+        s = load_project(dict(
+            project, encoding_profile=profile, sweep_mode=mode, sweep_seeds=[1, 2], sweep_jobs=2,
+            output=os.path.join(tmp, f"sweep_{mode}.mp4")
+        ), tmp)
+        try:
+            csv_path = sweep_project(s)
+        except Exception as e:
+            check(results, f"sweep {mode}", False, f"{type(e).__name__}: {e}")
+            continue
+        with open(csv_path[:-len(".csv")] + ".json") as f:
+            variants = json.load(f)["variants"]
+        outputs = [v["output"] for v in variants]
+        if mode == "timeline":
+            missing = [p for p in outputs if not os.path.exists(os.path.splitext(p)[0] + ".edl")]
+        else:
+            missing = [p for p in outputs if not os.path.exists(p)]
+        if mode == "render":
+            container = resolve_profile(profile)["container"]
+            missing += [p for p in outputs if not p.endswith("." + container)]
+        check(results, f"sweep {mode}", outputs and not missing, f"{len(outputs)} variants")
+
+        # every variant's own stages, measured on the sweep's worker threads
+        timed = "exports" if mode == "timeline" else "render"
+        with open(csv_path[:-len("_sweep.csv")] + "_sweep.metrics.json") as f:
+            merged = json.load(f)["metrics"]["stages"].get(f"sweep.{timed}", {}).get("calls", 0)
+        untimed = [v["output"] for v in variants if timed not in v.get("stages", {})]
+        check(
+            results, f"sweep {mode} timings", not untimed and merged == len(variants),
+            f"{timed} measured {merged} times"
+        )
+
+
+def edl_frames(path, fps):
+    # record-out of the last event (the final mix), in frames
+    last = [line.split() for line in open(path) if line[:3].isdigit()][-1]
+    h, m, sec, f = (int(v) for v in last[-1].split(":"))
+    return ((h * 60 + m) * 60 + sec) * round(fps) + f
+
+
+def otio_rates(path):
+    import opentimelineio as otio
+
+    edit = otio.adapters.read_from_file(path)
+    return {clip.source_range.duration.rate for clip in edit.find_clips()}
+
+
+def check_exports(results, project, tmp, profile):
+    # the EDL / OTIO of a render run on the rendered video's own frame grid,
+    # the same for a timeline-only run
+    s = load_project(dict(project, encoding_profile=profile, output=os.path.join(tmp, "export.mp4")), tmp)
+    video = render_project(s)
+    rate, frames, _ = probe_stream(video)
+    fps = Fraction(rate)
+    prefix = os.path.splitext(video)[0]
+    check(results, "render EDL length", edl_frames(prefix + ".edl", fps) == frames, f"{rate} fps, {frames} frames")
+    check(results, "render OTIO rate", otio_rates(prefix + ".otio") == {float(fps)}, rate)
+
+    s = load_project(dict(project, encoding_profile=profile, output=os.path.join(tmp, "dry.mp4")), tmp)
+    timeline_project(s)
+    prefix = os.path.join(tmp, "dry")
+    check(results, "timeline EDL length", edl_frames(prefix + ".edl", fps) == frames)
+    check(results, "timeline OTIO rate", otio_rates(prefix + ".otio") == {float(fps)})
+
+
+def chroma_psnr(video, reference, pix_fmt):
+    # PSNR of the chroma planes against the reference in the same pixel format
+    err = subprocess.run(
+        [FFMPEG_BIN, "-hide_banner", "-i", video, "-i", reference,
+         "-lavfi", f"[1:v]format={pix_fmt}[ref];[0:v][ref]psnr", "-frames:v", "60", "-f", "null", "-"],
+        capture_output=True, text=True, check=True
+    ).stderr
+    line = [line for line in err.splitlines() if "PSNR" in line][-1]
+    values = dict(field.split(":") for field in line.split("]", 1)[1].split() if ":" in field)
+    return min(float(values["u"]), float(values["v"]))
+
+
+def check_pixel_format(results, project, tmp, profile):
+    # a still 10-bit 4:4:4 camera video whose chroma flips every line, rendered
+    # from the original: squeezing the frames through 8-bit 4:2:0 anywhere on
+    # the way averages the lines away, even when the file is labelled 4:2:2
+    pix_fmt = resolve_profile(profile)["pix_fmt"]
+    video = os.path.join(tmp, "detail", os.path.basename(project["videos"][0]))
+    os.makedirs(os.path.dirname(video), exist_ok=True)
+    run_ffmpeg([
+        "-f", "lavfi", "-i", "color=gray:size=320x180:rate=30:duration=30,format=yuv444p10le,"
+        "geq=lum=512:cb='if(mod(Y,2),900,100)':cr='if(mod(Y,2),100,900)'",
+        "-c:v", "libx264", "-crf", "0", "-pix_fmt", "yuv444p10le", video,
+    ], what="chroma test video")
+
+    for backend in ("ffmpeg", "stream"):
+        s = load_project(dict(
+            project, videos=[video], stems=project["stems"][:1], free_clips=[], use_proxies=False,
+            encoding_profile=profile, render_backend=backend, output=os.path.join(tmp, f"pix_{backend}.mp4")
+        ), tmp)
+        output = render_project(s)
+        _, _, found = probe_stream(output)
+        db = chroma_psnr(output, video, pix_fmt)
+        check(results, f"{backend} pixel format", found == pix_fmt and db > 40, f"{found}, chroma PSNR {db:.1f} dB")
+
+
+def check_backend_limits(results, project, tmp, profile):
+    # a backend that cannot honour the profile stops or says so, it never
+    # hands back a file that quietly ignores it
+    pix_fmt = resolve_profile(profile)["pix_fmt"]
+    for backend, use_proxies in (("moviepy", True), ("smart", True)):
+        s = load_project(dict(
+            project, encoding_profile=profile, render_backend=backend, use_proxies=use_proxies,
+            output=os.path.join(tmp, f"limits_{backend}.mp4")
+        ), tmp)
+        warnings = []
+        handler = logging.Handler(logging.WARNING)
+        handler.emit = lambda record: warnings.append(record.getMessage())
+        log.addHandler(handler)
+        try:
+            render_project(s)
+            outcome = "rendered" + (f", warned: {warnings[-1]}" if warnings else "")
+            ok = pix_fmt == "yuv420p" and (backend != "smart" or bool(warnings))
+        except EditError as e:
+            outcome = f"refused: {e}"
+            ok = pix_fmt != "yuv420p"
+        finally:
+            log.removeHandler(handler)
+        check(results, f"{backend} with {profile}", ok, outcome)
+
+
+def read_frames(video, size=(160, 90)):
+    # every frame, shrunk and grey
+    raw = subprocess.run(
+        [FFMPEG_BIN, "-v", "error", "-i", video, "-s", f"{size[0]}x{size[1]}",
+         "-f", "rawvideo", "-pix_fmt", "gray", "-"],
+        capture_output=True, check=True
+    ).stdout
+    return np.frombuffer(raw, np.uint8).reshape(-1, size[1], size[0]).astype(np.float32)
+
+
+def wrong_frames(video, reference):
+    # frames that look far more like the reference's previous or next frame
+    # than like the same one; colour conversion noise hits all three alike
+    a, b = read_frames(video), read_frames(reference)
+    n = min(len(a), len(b))
+
+    def err(k, j):
+        return float(np.abs(a[k] - b[j]).mean())
+
+    return len(a), [
+        k for k in range(n)
+        if any(2 * err(k, j) < err(k, k) for j in (k - 1, k + 1) if 0 <= j < n)
+    ]
+
+
+def check_backend_frames(results, project, tmp, profile):
+    # every backend shows the same source frame on every output frame as the
+    # ffmpeg backend: a frame from the wrong side of a cut, a frame one early
+    # or late, or a held frame where the others are black
+    settings = resolve_profile(profile)
+    backends = ["stream", "smart", "moviepy"] if settings["pix_fmt"] == "yuv420p" else ["stream"]
+    videos = {}
+    for backend in ["ffmpeg"] + backends:
+        s = load_project(dict(
+            project, encoding_profile=profile, render_backend=backend,
+            output=os.path.join(tmp, f"frames_{backend}.mp4")
+        ), tmp)
+        videos[backend] = render_project(s)
+
+    _, total, _ = probe_stream(videos["ffmpeg"])
+    for backend in backends:
+        frames, wrong = wrong_frames(videos[backend], videos["ffmpeg"])
+        check(
+            results, f"{backend} frames match ffmpeg", frames == total and not wrong,
+            f"{frames}/{total} frames" + (f", differ at {wrong[:10]}" if wrong else "")
+        )
+
+
+CHECKS = {
+    "sweep": check_sweep,
+    "exports": check_exports,
+    "pixel_format": check_pixel_format,
+    "backend_limits": check_backend_limits,
+    "frames": check_backend_frames,
+}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--profile", default="match source", choices=list(ENCODING_PROFILES))
+    # not a whole second, or 24 and 30 fps timecodes of the song end would agree
+    ap.add_argument("--minutes", type=float, default=0.2525)
+    ap.add_argument("--source-fps", type=int, default=30, help="test video frame rate")
+    ap.add_argument("--backend", default="ffmpeg")
+    ap.add_argument("--checks", default=",".join(CHECKS), help="comma separated, any of " + ", ".join(CHECKS))
+    args = ap.parse_args()
+
+    inputs = SimpleNamespace(
+        minutes=args.minutes, stems=2, free_clips=1, free_seconds=4.0, bpm=120.0, seed=0,
+        size="320x180", source_fps=args.source_fps
+    )
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        cache.CACHE_ROOT = os.path.join(tmp, "cache")
+        stem_paths, video_paths, free_paths, mix_path, _ = make_project(tmp, inputs)
+        project = {
+            "stems": stem_paths, "videos": video_paths, "free_clips": free_paths, "final_audio": mix_path,
+            "render_backend": args.backend, "analysis_workers": 1, "seed": 0,
+        }
+        for name in args.checks.split(","):
+            CHECKS[name](results, project, tmp, args.profile)
+
+    print(f"{sum(results)}/{len(results)} checks passed")
+    raise SystemExit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
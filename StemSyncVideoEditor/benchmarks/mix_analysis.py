@@ -0,0 +1,92 @@
+# Times the final-mix analysis: three separate decodes (old render_action path)
+# against a single MixAnalysis pass.
+#
+#   python benchmarks/mix_analysis.py --minutes 7
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import librosa
+import numpy as np
+import soundfile as sf
+from moviepy.editor import AudioFileClip
+from scipy.signal import medfilt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analysis import MixAnalysis, detect_snapped_beats
+
+
+def synth_song(path, minutes, sr=48000, bpm=120):
+    n = int(minutes * 60 * sr)
+    t = np.arange(n) / sr
+    rng = np.random.default_rng(0)
+    y = 0.05 * rng.standard_normal(n).astype(np.float32)
+    y += 0.2 * np.sin(2 * np.pi * 110 * t).astype(np.float32)
+    click = np.exp(-np.arange(int(0.03 * sr)) / (0.005 * sr)).astype(np.float32)
+    for b in np.arange(0, n, int(sr * 60 / bpm)):
+        seg = y[b:b + len(click)]
+        seg += click[:len(seg)]
+    # louder "chorus" every other 30 seconds
+    y *= np.where((t // 30) % 2 == 1, 1.0, 0.4).astype(np.float32)
+    sf.write(path, y, sr)
+
+
+def old_path(path, snap_window):
+    y, sr = librosa.load(path, sr=None, mono=True)
+    _, beats = librosa.beat.beat_track(y=y, sr=sr)
+    beat_times = librosa.frames_to_time(beats, sr=sr)
+    onset_env = librosa.onset.onset_strength(y=y, sr=sr)
+    onset_frames = librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr)
+    onset_times = librosa.frames_to_time(onset_frames, sr=sr)
+    snapped = []
+    for b in beat_times:
+        nearest = min(onset_times, key=lambda o: abs(o - b)) if len(onset_times) else b
+        snapped.append(nearest if abs(nearest - b) <= snap_window else b)
+    beats = sorted(set([float(t) for t in snapped]))
+
+    y, sr = librosa.load(path, sr=None, mono=True)
+    rms = medfilt(librosa.feature.rms(y=y)[0], kernel_size=31)
+
+    song_len = AudioFileClip(path).duration
+    return beats, rms, song_len
+
+
+def new_path(path, snap_window):
+    mix = MixAnalysis(path)
+    return detect_snapped_beats(mix, snap_window), mix.sections, mix.duration
+
+
+def best_of(fn, repeat, *args):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        times.append(time.perf_counter() - t0)
+    return min(times), result
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--minutes", type=float, default=7.0)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--snap-window", type=float, default=0.08)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        wav = os.path.join(tmp, "mix.wav")
+        synth_song(wav, args.minutes)
+
+        # warm numba / ffmpeg caches so neither side pays first-call cost
+        new_path(wav, args.snap_window)
+
+        t_old, (old_beats, _, old_len) = best_of(old_path, args.repeat, wav, args.snap_window)
+        t_new, (new_beats, _, new_len) = best_of(new_path, args.repeat, wav, args.snap_window)
+
+    print(f"song length     : {args.minutes:.1f} min")
+    print(f"three decodes   : {t_old:.2f} s")
+    print(f"MixAnalysis     : {t_new:.2f} s  ({t_old / t_new:.2f}x)")
+    print(f"beats identical : {old_beats == new_beats}")
+    print(f"duration delta  : {abs(old_len - new_len) * 1000:.1f} ms")
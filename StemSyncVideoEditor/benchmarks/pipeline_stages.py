@@ -0,0 +1,335 @@
+# End-to-end stage timings on synthetic inputs, for comparing commits.
+# Stems are click tracks / gated tones / noise beds with known beats (NumPy),
+# videos are ffmpeg lavfi test patterns, so nothing has to be checked in.
+# Every stage runs against an empty cache in a temp dir and reports wall
+# time and peak RSS of this process plus its ffmpeg children.
+#
+#   python benchmarks/pipeline_stages.py --minutes 3 --stems 6 --free-clips 4 --output head.json
+#   python benchmarks/pipeline_stages.py --minutes 3 --stems 6 --free-clips 4 --compare head.json
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+import soundfile as sf
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import cache
+from analysis import MixAnalysis, analyze_audio, detect_sections, detect_snapped_beats
+from encoding import ENCODING_PROFILES, container_path, output_fps, resolve_profile
+from media import FFMPEG_BIN, run_ffmpeg
+from metrics import tree_rss_mb
+from pipeline import RENDER_BACKENDS, FreeClipCycler, build_video, generate_timeline
+from proxies import free_clip_sources, prepare_proxies
+from scenes import prepare_scenes
+from segments import plan_segments
+from stabilize import STABILIZE_MODES, prepare_stabilized
+
+PATTERNS = ["testsrc2", "smptebars", "rgbtestsrc", "testsrc", "smptehdbars", "yuvtestsrc"]
+BEAT_TOLERANCE = 0.07
+
+
+# ======================================================
+# SYNTHETIC INPUTS
+# ======================================================
+def synth_stems(minutes, count, sr=44100, bpm=120, seed=0):
+    rng = np.random.default_rng(seed)
+    n = int(minutes * 60 * sr)
+    t = np.arange(n) / sr
+    beats = np.arange(0.5, n / sr - 0.1, 60 / bpm)
+    click = np.exp(-np.arange(int(0.03 * sr)) / (0.005 * sr)).astype(np.float32)
+
+    stems = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            # click track on every beat, accented downbeats
+            y = 0.01 * rng.standard_normal(n).astype(np.float32)
+            for k, b in enumerate(beats):
+                s = int(b * sr)
+                seg = y[s:s + len(click)]
+                seg += (0.9 if k % 4 == 0 else 0.5) * click[:len(seg)]
+        elif kind == 1:
+            # tone gated on each beat
+            y = (0.3 * np.sin(2 * np.pi * (55 * (i + 1)) * t)).astype(np.float32)
+            y *= ((t - beats[0]) % (60 / bpm) < 0.2).astype(np.float32)
+        else:
+            # noise bed with a slow swell
+            y = 0.1 * rng.standard_normal(n).astype(np.float32)
+            y *= (0.5 + 0.5 * np.sin(2 * np.pi * t / (20 + 7 * i) + i)).astype(np.float32)
+
+        # every stem drops out for a stretch of its own, so the edit has something to follow
+        y *= ((t // (15 + 5 * i)) % 4 != 3).astype(np.float32)
+        stems.append(y)
+
+    mix = np.sum(stems, axis=0)
+    # louder "chorus" every other 30 seconds
+    mix *= np.where((t // 30) % 2 == 1, 1.0, 0.5).astype(np.float32)
+    mix /= max(1.0, float(np.abs(mix).max()) / 0.95)
+    return stems, mix, beats
+
+
+def synth_video(path, seconds, index, size, fps):
+    pattern = PATTERNS[index % len(PATTERNS)]
+    run_ffmpeg([
+        "-f", "lavfi", "-i", f"{pattern}=size={size}:rate={fps}:duration={seconds:.3f}",
+        "-vf", f"hue=h={37 * index}", "-c:v", "libx264", "-preset", "ultrafast",
+        "-pix_fmt", "yuv420p", path,
+    ], what=f"test video {os.path.basename(path)}")
+
+
+def make_project(tmp, args):
+    stems, mix, beats = synth_stems(args.minutes, args.stems, bpm=args.bpm, seed=args.seed)
+    sr = 44100
+    duration = len(mix) / sr
+
+    names = [f"stem{i:02d}" for i in range(args.stems)]
+    stem_paths = [os.path.join(tmp, name + ".wav") for name in names]
+    video_paths = [os.path.join(tmp, name + ".mp4") for name in names]
+    free_paths = [os.path.join(tmp, f"free{i}.mp4") for i in range(args.free_clips)]
+
+    for path, y in zip(stem_paths, stems):
+        sf.write(path, y, sr)
+
+    # stem videos run a second past the song, free clips are short so they loop
+    videos = [(p, duration + 1.0) for p in video_paths] + [(p, args.free_seconds) for p in free_paths]
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+        list(pool.map(
+            lambda job: synth_video(job[1][0], job[1][1], job[0], args.size, args.source_fps),
+            enumerate(videos)
+        ))
+
+    mix_path = os.path.join(tmp, "mix.wav")
+    sf.write(mix_path, mix, sr)
+    return stem_paths, video_paths, free_paths, mix_path, beats
+
+
+# ======================================================
+# MEASUREMENT
+# ======================================================
+class PeakRSS:
+    # samples the process tree in the background while a stage runs
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.enabled = os.path.isdir("/proc")
+
+    def __enter__(self):
+        self.peak = tree_rss_mb() if self.enabled else 0.0
+        self.done = threading.Event()
+        if self.enabled:
+            self.thread = threading.Thread(target=self.sample, daemon=True)
+            self.thread.start()
+        return self
+
+    def sample(self):
+        while not self.done.wait(self.interval):
+            self.peak = max(self.peak, tree_rss_mb())
+
+    def __exit__(self, *exc):
+        self.done.set()
+        if self.enabled:
+            self.thread.join()
+            self.peak = max(self.peak, tree_rss_mb())
+
+
+def run_stage(results, name, fn):
+    with PeakRSS() as rss:
+        t0 = time.perf_counter()
+        cpu0 = time.process_time()
+        value = fn()
+        wall = time.perf_counter() - t0
+        cpu = time.process_time() - cpu0
+    results[name] = {"wall_s": round(wall, 4), "cpu_s": round(cpu, 4), "peak_rss_mb": round(rss.peak, 1)}
+    print(f"{name:24s} {wall:8.2f} s  peak RSS {rss.peak:7.0f} MB")
+    return value
+
+
+def beat_scores(detected, truth, tolerance=BEAT_TOLERANCE):
+    detected = np.asarray(detected, dtype=float)
+    if not len(detected) or not len(truth):
+        return {"precision": 0.0, "recall": 0.0}
+    hit = lambda a, b: float(np.mean(np.min(np.abs(a[:, None] - b[None, :]), axis=1) <= tolerance))
+    return {"precision": round(hit(detected, truth), 4), "recall": round(hit(truth, detected), 4)}
+
+
+def environment():
+    def version(module):
+        try:
+            return __import__(module).__version__
+        except Exception:
+            return None
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip() or None
+        ffmpeg = subprocess.run([FFMPEG_BIN, "-version"], capture_output=True, text=True).stdout.split("\n")[0]
+    except OSError:
+        commit, ffmpeg = None, None
+
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": version("numpy"),
+        "librosa": version("librosa"),
+        "ffmpeg": ffmpeg,
+    }
+
+
+# ======================================================
+# BENCHMARK
+# ======================================================
+def run(args):
+    stages = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        # cold cache, inside the temp dir, so every stage does its full work
+        cache.CACHE_ROOT = os.path.join(tmp, "cache")
+
+        t0 = time.perf_counter()
+        stem_paths, video_paths, free_paths, mix_path, true_beats = make_project(tmp, args)
+        generate_s = time.perf_counter() - t0
+        print(f"{'generate inputs':24s} {generate_s:8.2f} s")
+
+        # numba compiles librosa's kernels on first call, that is not a pipeline cost
+        warm = os.path.join(tmp, "warm.wav")
+        sf.write(warm, sf.read(mix_path, frames=5 * 44100)[0], 44100)
+        MixAnalysis(warm, use_cache=False)
+
+        stem_analysis = run_stage(stages, "analyze_audio", lambda: {
+            p: analyze_audio(p, use_cache=False) for p in stem_paths
+        })
+        mix = run_stage(stages, "MixAnalysis", lambda: MixAnalysis(mix_path, use_cache=False))
+        beats = run_stage(stages, "detect_snapped_beats", lambda: detect_snapped_beats(mix, args.snap_window))
+        sections = run_stage(stages, "detect_sections", lambda: detect_sections(mix))
+
+        # runs beside the audio analysis in the pipeline, timed alone here
+        run_stage(stages, "scene_cuts", lambda: [job.result() for job in prepare_scenes(video_paths)])
+
+        # cut density is cuts per bar of four beats
+        phrase_beats = max(1, int(round(4 / args.cut_density)))
+        timeline, stems, video_map = run_stage(stages, "generate_timeline", lambda: generate_timeline(
+            [SimpleNamespace(name=p) for p in stem_paths],
+            [SimpleNamespace(name=p) for p in video_paths],
+            beats, sections, 0.0, mix.duration, 0.5, phrase_beats, 0,
+            FreeClipCycler(free_paths) if free_paths else None,
+            args.free_clip_probability if free_paths else 0.0,
+            stem_analysis, seed=args.seed
+        ))
+
+        plan = plan_segments(timeline)
+        profile = resolve_profile(args.profile)
+        fps = output_fps(profile, video_paths)
+        if args.stabilize != "off":
+            # at upload time in the app, before any render
+            run_stage(stages, "stabilize", lambda: [
+                job.result() for job in prepare_stabilized(video_paths + free_paths, args.stabilize)
+            ])
+        if not args.no_proxies:
+            run_stage(stages, "prepare_proxies", lambda: [
+                job.result()
+                for job in prepare_proxies(video_paths + free_paths, fps, args.stabilize, profile["height"])
+            ])
+        run_stage(stages, "free_clip_variants", lambda: free_clip_sources(
+            [seg for seg in plan if seg["type"] != "stem"], not args.no_proxies, fps, args.stabilize,
+            profile["height"]
+        ))
+
+        for backend in args.backends:
+            output = container_path(os.path.join(tmp, f"render_{backend}.mp4"), profile)
+            run_stage(stages, f"build_video[{backend}]", lambda: build_video(
+                timeline, stems, video_map, mix.duration, mix_path, output,
+                backend, args.render_workers, use_proxies=not args.no_proxies, stabilize=args.stabilize,
+                profile=args.profile
+            ))
+
+    return {
+        "params": vars(args).copy(),
+        "environment": environment(),
+        "inputs": {
+            "song_seconds": round(mix.duration, 3),
+            "generate_s": round(generate_s, 3),
+            "true_beats": len(true_beats),
+            "detected_beats": len(beats),
+            "beat_accuracy": beat_scores(beats, true_beats),
+            "sections": len(sections),
+            "cuts": len(timeline) - 1,
+            "free_cuts": sum(e["type"] == "free" for e in timeline),
+        },
+        "stages": stages,
+    }
+
+
+def compare(report, baseline):
+    ignore = {"output", "compare"}
+    changed = sorted(
+        k for k in set(report["params"]) | set(baseline.get("params", {}))
+        if k not in ignore and report["params"].get(k) != baseline.get("params", {}).get(k)
+    )
+    if changed:
+        print(f"\nwarning: inputs differ from the baseline ({', '.join(changed)})")
+
+    print(f"\n{'stage':24s} {'baseline':>10s} {'this run':>10s} {'ratio':>7s}")
+    for name, stage in report["stages"].items():
+        old = baseline.get("stages", {}).get(name)
+        if old is None:
+            print(f"{name:24s} {'-':>10s} {stage['wall_s']:9.2f}s")
+            continue
+        ratio = f"{stage['wall_s'] / old['wall_s']:6.2f}x" if old["wall_s"] else "-"
+        print(f"{name:24s} {old['wall_s']:9.2f}s {stage['wall_s']:9.2f}s {ratio:>7s}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--minutes", type=float, default=1.0, help="song length")
+    ap.add_argument("--stems", type=int, default=4, help="stem count (one video per stem)")
+    ap.add_argument("--free-clips", type=int, default=2, help="free b-roll clip count")
+    ap.add_argument("--free-seconds", type=float, default=6.0, help="length of each free clip")
+    ap.add_argument("--cut-density", type=float, default=1.0, help="cuts per bar (4 beats), at most 4")
+    ap.add_argument("--free-clip-probability", type=float, default=0.2)
+    ap.add_argument("--snap-window", type=float, default=0.08)
+    ap.add_argument("--bpm", type=float, default=120.0)
+    ap.add_argument("--size", default="640x360", help="test video size")
+    ap.add_argument("--source-fps", type=int, default=30, help="test video frame rate")
+    ap.add_argument("--backends", default="ffmpeg,stream",
+                    help="comma separated, any of " + ", ".join(RENDER_BACKENDS))
+    ap.add_argument("--render-workers", type=int, default=1)
+    ap.add_argument("--no-proxies", action="store_true")
+    ap.add_argument("--stabilize", default="off", choices=STABILIZE_MODES)
+    ap.add_argument("--profile", default="standard", choices=list(ENCODING_PROFILES), help="encoding profile")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--output", help="write the JSON report here")
+    ap.add_argument("--compare", help="JSON report of an earlier run to compare against")
+    args = ap.parse_args()
+
+    args.backends = [b for b in args.backends.split(",") if b]
+    unknown = set(args.backends) - set(RENDER_BACKENDS)
+    if unknown:
+        ap.error(f"unknown backend(s): {', '.join(sorted(unknown))}")
+
+    report = run(args)
+    print(json.dumps(report["inputs"]))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# Times and scores the structure analysis (sections + downbeats) of the final mix
+# on a synthetic song with known bars and sections: chords change every bar, a
+# kick marks the downbeats, verses / choruses / a bridge repeat with their own
+# progressions and the choruses are louder. Compares with the old RMS-percentile
+# sections and every-Nth-beat "downbeats".
+#
+#   python benchmarks/song_structure.py --minutes 12
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analysis import MixAnalysis, frame_times, sections_from_rms
+from metrics import collect
+
+# semitones above A of the triads of each part
+PROGRESSIONS = {
+    "intro": [0, 0, 5, 5],
+    "verse": [0, 8, 3, 10],
+    "chorus": [5, 0, 7, 3],
+    "bridge": [10, 5, 8, 7],
+    "outro": [0, 5, 0, 5],
+}
+FORM = ["intro", "verse", "chorus", "verse", "chorus", "bridge", "chorus", "chorus"]
+BARS = {"intro": 8, "verse": 16, "chorus": 16, "bridge": 8, "outro": 8}
+TOLERANCE = 0.07  # seconds, downbeat hit window
+BOUNDARY_TOLERANCE = 2.0  # seconds, section boundary hit window
+
+
+def synth_song(path, minutes, sr=22050, bpm=120, pickup=2):
+    beat = 60.0 / bpm
+    form = []
+    while sum(BARS[p] for p in form) * 4 * beat < minutes * 60 - BARS["outro"] * 4 * beat:
+        form += FORM if not form else FORM[1:]
+    form.append("outro")
+    # one bar of two beats before the first bridge shifts every bar after it
+    short = form.index("bridge")
+
+    rng = np.random.default_rng(0)
+    n = int((pickup + sum(BARS[p] for p in form) * 4) * beat * sr) + sr
+    y = np.zeros(n, dtype=np.float32)
+    t_beat = np.arange(int(beat * sr)) / sr
+    kick = (np.sin(2 * np.pi * 55 * t_beat) * np.exp(-t_beat / 0.08)).astype(np.float32)
+    tick = (rng.standard_normal(len(t_beat)) * np.exp(-t_beat / 0.01)).astype(np.float32)
+
+    # pickup beats before the first bar
+    for b in range(pickup):
+        s = int(b * beat * sr)
+        y[s:s + len(t_beat)] += 0.25 * tick
+
+    downbeats, sections = [], []
+    t = pickup * beat
+    for k, part in enumerate(form):
+        if k == short:
+            s = int(t * sr)
+            for b in range(2):
+                seg = y[s + int(b * beat * sr):s + int(b * beat * sr) + len(t_beat)]
+                seg += (0.45 * (0.9 * kick if b == 0 else 0.25 * tick))[:len(seg)]
+            downbeats.append(t)
+            t += 2 * beat
+        start = t
+        gain = 1.0 if part == "chorus" else 0.45
+        for bar in range(BARS[part]):
+            root = 220.0 * 2 ** (PROGRESSIONS[part][bar % 4] / 12)
+            minor = part in ("verse", "bridge")
+            chord = [root, root * 2 ** ((3 if minor else 4) / 12), root * 2 ** (7 / 12)]
+            for b in range(4):
+                s = int((t + b * beat) * sr)
+                tone = sum(np.sin(2 * np.pi * f * t_beat) for f in chord) / 3
+                seg = y[s:s + len(t_beat)]
+                seg += (gain * 0.25 * tone)[:len(seg)].astype(np.float32)
+                seg += (gain * (0.9 * kick if b == 0 else 0.25 * tick))[:len(seg)]
+                if part == "chorus":
+                    seg += (0.05 * rng.standard_normal(len(seg))).astype(np.float32)
+            downbeats.append(t)
+            t += 4 * beat
+        sections.append({"start": start, "end": t, "type": part})
+
+    y /= max(1.0, float(np.abs(y).max()) / 0.95)
+    sf.write(path, y, sr)
+    return np.array(downbeats), sections
+
+
+def f_measure(found, truth, tolerance):
+    found, truth = np.asarray(found, dtype=float), np.asarray(truth, dtype=float)
+    if len(found) == 0 or len(truth) == 0:
+        return 0.0
+    hits = sum(np.min(np.abs(truth - f)) <= tolerance for f in found)
+    precision, recall = hits / len(found), min(hits, len(truth)) / len(truth)
+    return 0.0 if hits == 0 else 2 * precision * recall / (precision + recall)
+
+
+def label_accuracy(sections, truth, duration, step=0.1):
+    # share of the song where "chorus or not" matches
+    def chorus_at(secs, t):
+        return any(s["start"] <= t < s["end"] and s["type"] == "chorus" for s in secs)
+
+    times = np.arange(0, duration, step)
+    return float(np.mean([chorus_at(sections, t) == chorus_at(truth, t) for t in times]))
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--minutes", type=float, default=12.0)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        wav = os.path.join(tmp, "mix.wav")
+        true_downbeats, true_sections = synth_song(wav, args.minutes)
+
+        # numba compiles librosa's kernels on first call, that is not an analysis cost
+        sf.write(os.path.join(tmp, "warm.wav"), sf.read(wav, frames=10 * 22050)[0], 22050)
+        MixAnalysis(os.path.join(tmp, "warm.wav"), use_cache=False)
+
+        t0 = time.perf_counter()
+        with collect() as metrics:
+            mix = MixAnalysis(wav, use_cache=False)
+        total = time.perf_counter() - t0
+        stages = metrics.as_dict()["stages"]
+
+    true_bounds = [s["start"] for s in true_sections[1:]]
+    found_bounds = [s["start"] for s in mix.sections[1:]]
+    old_sections = sections_from_rms(mix.rms, frame_times(len(mix.rms), mix.sr))
+    old_downbeats = mix.beat_times[::4]
+
+    print(f"song length      : {mix.duration / 60:.1f} min, {len(mix.beat_times)} beats, {len(true_sections)} sections")
+    print(f"MixAnalysis      : {total:.2f} s (structure {stages['mix.sections']['wall_s']:.3f} s)")
+    print(f"downbeat F       : {f_measure(mix.downbeats, true_downbeats, TOLERANCE):.3f}"
+          f"  (every 4th beat: {f_measure(old_downbeats, true_downbeats, TOLERANCE):.3f})")
+    print(f"boundary F       : {f_measure(found_bounds, true_bounds, BOUNDARY_TOLERANCE):.3f}"
+          f"  ({len(mix.sections)} sections; RMS percentile: "
+          f"{f_measure([s['start'] for s in old_sections[1:]], true_bounds, BOUNDARY_TOLERANCE):.3f},"
+          f" {len(old_sections)} sections)")
+    print(f"chorus labels    : {label_accuracy(mix.sections, true_sections, mix.duration):.3f}"
+          f"  (RMS percentile: {label_accuracy(old_sections, true_sections, mix.duration):.3f})")
@@ -0,0 +1,53 @@
+# Process startup cost of each entry point, every run in a fresh interpreter:
+# importing app.py (Gradio UI) against the headless CLI and the pipeline it
+# drives. "pipeline + cached analysis" is what a re-render of an already
+# analysed song pays before the first frame is encoded.
+#
+#   python benchmarks/startup.py --runs 5
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = [
+    ("import app (Gradio UI)", ["-c", "import app"]),
+    ("python -m stemsync --help", ["-m", "stemsync", "--help"]),
+    ("import pipeline", ["-c", "import pipeline"]),
+    ("pipeline + cached analysis", ["-c", "import pipeline; pipeline.analyze_all([{song!r}], {song!r}, workers=1)"]),
+]
+
+
+def timed(args):
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable] + args, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        song = os.path.join(tmp, "song.wav")
+        sr = 22050
+        sf.write(song, 0.1 * np.random.default_rng(0).standard_normal(30 * sr).astype(np.float32), sr)
+
+        for name, case in CASES:
+            case = [a.format(song=song) for a in case]
+            timed(case)  # warm the OS file cache (and the analysis cache)
+            times = [timed(case) for _ in range(args.runs)]
+            print(f"{name:30s} median {statistics.median(times):6.2f}s  min {min(times):6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
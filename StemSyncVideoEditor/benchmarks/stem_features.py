@@ -0,0 +1,78 @@
+# Times stem analysis: the old RMS-only pass against analyze_audio, which adds
+# spectral flux, onset density and centroid from one small STFT per stem.
+# CPU time, so the number holds on a busy machine too.
+#
+#   python benchmarks/stem_features.py --minutes 4 --channels 2
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import analysis
+from analysis import ANALYSIS_RATES, AudioStream, analyze_audio, centered_frames
+
+
+def synth_stem(path, minutes, channels, sr=44100, bpm=120):
+    n = int(minutes * 60 * sr)
+    t = np.arange(n) / sr
+    rng = np.random.default_rng(0)
+    y = 0.05 * rng.standard_normal(n).astype(np.float32)
+    y += 0.2 * np.sin(2 * np.pi * 110 * t).astype(np.float32)
+    click = np.exp(-np.arange(int(0.03 * sr)) / (0.005 * sr)).astype(np.float32)
+    for b in np.arange(0, n, int(sr * 60 / bpm)):
+        seg = y[b:b + len(click)]
+        seg += click[:len(seg)]
+    sf.write(path, np.repeat(y[:, None], channels, axis=1), sr)
+
+
+def rms_only(path, sr):
+    # analyze_audio before the spectral features (and before the faster downmix)
+    fast = analysis.downmix
+    analysis.downmix = lambda block: block.mean(axis=1, dtype=np.float32)
+    try:
+        frames = centered_frames(AudioStream(path, sr))
+        return np.concatenate([np.sqrt(np.mean(f ** 2, axis=1)) for f in frames])
+    finally:
+        analysis.downmix = fast
+
+
+def features(path, sr):
+    return analyze_audio(path, use_cache=False, sr=sr)["rms"]
+
+
+def best_of(fn, repeat, *args):
+    times = []
+    for _ in range(repeat):
+        t0 = time.process_time()
+        result = fn(*args)
+        times.append(time.process_time() - t0)
+    return min(times), result
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--minutes", type=float, default=4.0)
+    ap.add_argument("--channels", type=int, default=2)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        wav = os.path.join(tmp, "stem.wav")
+        synth_stem(wav, args.minutes, args.channels)
+
+        print(f"stem            : {args.minutes:.1f} min, {args.channels} channel(s)")
+        for sr in ANALYSIS_RATES:
+            features(wav, sr)
+            t_old, old_rms = best_of(rms_only, args.repeat, wav, sr)
+            t_new, new_rms = best_of(features, args.repeat, wav, sr)
+            label = f"{sr} Hz" if sr else "native"
+            print(
+                f"{label:<15} : rms only {t_old:.3f} s, all features {t_new:.3f} s "
+                f"({t_new / t_old:.2f}x), rms max diff {np.abs(old_rms - new_rms).max():.1e}"
+            )
@@ -0,0 +1,171 @@
+# Micro-benchmark for the timeline engine: the old per-beat loop (np.interp per
+# stem per beat, linear section scan, O(beats x onsets) snapping) against the
+# precomputed beats x stems matrices. Inputs are synthetic, no audio is decoded.
+#
+#   python benchmarks/timeline_engine.py --minutes 10 --stems 12
+
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analysis import MixAnalysis, detect_snapped_beats, sections_from_rms
+from pipeline import FreeClipCycler, generate_timeline, section_at_time
+
+
+def synth_inputs(minutes, stems, sr=44100, hop=512, bpm=120, seed=0):
+    rng = np.random.default_rng(seed)
+    duration = minutes * 60
+    frames = int(duration * sr / hop)
+    rms_times = np.arange(frames) * hop / sr
+
+    audio = {}
+    for i in range(stems):
+        # slow swells plus noise, with stretches of silence so the
+        # "no active stem" branch is exercised as well
+        swell = 0.5 + 0.5 * np.sin(2 * np.pi * rms_times / (20 + 7 * i) + i)
+        rms = (swell * rng.uniform(0.5, 1.0, frames)).astype(np.float32)
+        rms[(rms_times // (45 + 5 * i)) % 4 == 3] = 0.0
+        audio[f"stem{i:02d}.wav"] = {
+            "sr": sr,
+            "rms": rms,
+            "rms_times": rms_times,
+            "silence": float(np.percentile(rms, 10) * 1.5),
+            "duration": duration - i * 0.5,
+        }
+
+    beat_times = np.arange(0.3, duration, 60 / bpm)
+    beat_times = beat_times + rng.normal(0, 0.01, len(beat_times))
+    onset_times = np.sort(rng.uniform(0, duration, int(duration * 5)))
+
+    mix_rms = np.mean([a["rms"] for a in audio.values()], axis=0)
+    mix = MixAnalysis.__new__(MixAnalysis)
+    mix.beat_times = beat_times
+    mix.onset_times = onset_times
+    sections = sections_from_rms(mix_rms, rms_times)
+    return audio, mix, sections, duration
+
+
+def legacy_snapped_beats(beat_times, onset_times, snap_window):
+    snapped = []
+    for b in beat_times:
+        nearest = min(onset_times, key=lambda o: abs(o - b)) if len(onset_times) else b
+        snapped.append(nearest if abs(nearest - b) <= snap_window else b)
+    return sorted(set([float(t) for t in snapped]))
+
+
+def legacy_timeline(audio, stems, beat_times, sections, cooldown, song_length,
+                    chorus_aggression, phrase_beats, downbeat_bias, free_cycler,
+                    free_clip_probability):
+    # the pre-engine generate_timeline loop, kept for comparison
+    timeline = []
+    current = stems[0]
+    last_used = {s: -999.0 for s in stems}
+    last_cut_beat = -999
+
+    for idx, t in enumerate(beat_times):
+        if t >= song_length:
+            break
+        if downbeat_bias > 0 and idx % int(downbeat_bias) != 0:
+            continue
+        section = section_at_time(sections, t)
+        min_beats = max(1, int(phrase_beats * (1 - chorus_aggression))) if section == "chorus" else phrase_beats
+        if idx - last_cut_beat < min_beats:
+            continue
+
+        energy = {}
+        active = []
+        for s in stems:
+            if t > audio[s]["duration"]:
+                e = 0.0
+            else:
+                e = np.interp(t, audio[s]["rms_times"], audio[s]["rms"])
+            energy[s] = e
+            if e > audio[s]["silence"]:
+                active.append(s)
+
+        candidates = [s for s in active if s != current and t - last_used[s] >= cooldown]
+        if candidates:
+            stem = max(candidates, key=lambda s: energy[s])
+        elif len(active) == 0:
+            stem = np.random.choice([s for s in stems if s != current])
+        else:
+            continue
+
+        use_free = (
+            free_cycler is not None
+            and not t >= song_length - 0.05
+            and np.random.rand() < free_clip_probability
+        )
+        if use_free:
+            clip_path, transform = free_cycler.next()
+            timeline.append({"time": t, "type": "free", "clip": clip_path,
+                             "transform": transform, "beat_idx": idx, "section": section})
+        else:
+            timeline.append({"time": t, "type": "stem", "stem": stem,
+                             "beat_idx": idx, "section": section})
+        last_used[stem] = t
+        current = stem
+        last_cut_beat = idx
+
+    if not timeline or timeline[-1]["time"] < song_length:
+        timeline.append({"time": song_length, "type": "stem", "stem": current,
+                         "beat_idx": len(beat_times),
+                         "section": section_at_time(sections, song_length)})
+    return timeline
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--minutes", type=float, default=10.0)
+    ap.add_argument("--stems", type=int, default=12)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=1234)
+    args = ap.parse_args()
+
+    audio, mix, sections, song_length = synth_inputs(args.minutes, args.stems)
+    files = [SimpleNamespace(name=p) for p in audio]
+    free = [f"free{i}.mp4" for i in range(5)]
+    stems = [os.path.splitext(p)[0] for p in audio]
+    by_stem = {os.path.splitext(p)[0]: a for p, a in audio.items()}
+
+    t_old_snap, old_beats = timed(lambda: legacy_snapped_beats(mix.beat_times, mix.onset_times, 0.08), args.repeat)
+    t_new_snap, new_beats = timed(lambda: detect_snapped_beats(mix, 0.08), args.repeat)
+
+    settings = dict(cooldown=3.0, song_length=song_length, chorus_aggression=0.5,
+                    phrase_beats=1, downbeat_bias=0, free_clip_probability=0.2)
+
+    def run_old():
+        np.random.seed(args.seed)
+        return legacy_timeline(by_stem, stems, new_beats, sections,
+                               free_cycler=FreeClipCycler(free), **settings)
+
+    def run_new():
+        np.random.seed(args.seed)
+        timeline, _, _ = generate_timeline(files, [SimpleNamespace(name=f"{s}.mp4") for s in stems],
+                                           new_beats, sections, free_cycler=FreeClipCycler(free),
+                                           stem_analysis=audio, **settings)
+        return timeline
+
+    t_old_tl, old_tl = timed(run_old, args.repeat)
+    t_new_tl, new_tl = timed(run_new, args.repeat)
+
+    print(f"input            : {args.minutes:.0f} min, {args.stems} stems, "
+          f"{len(mix.beat_times)} beats, {len(mix.onset_times)} onsets, {len(sections)} sections")
+    print(f"onset snapping   : {t_old_snap * 1000:8.1f} ms -> {t_new_snap * 1000:6.2f} ms  "
+          f"({t_old_snap / t_new_snap:.0f}x)  identical={old_beats == new_beats}")
+    print(f"generate_timeline: {t_old_tl * 1000:8.1f} ms -> {t_new_tl * 1000:6.2f} ms  "
+          f"({t_old_tl / t_new_tl:.0f}x)  identical={old_tl == new_tl}  cuts={len(new_tl)}")
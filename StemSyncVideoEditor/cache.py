@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import threading
+import zipfile
+
+import numpy as np
+
+
+# ======================================================
+# content-addressed on-disk cache
+# ======================================================
+CACHE_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+
+# per-kind size budgets, least recently used entries are evicted first
+CACHE_MAX_BYTES = {
+    "analysis": 256 * 1024 * 1024,
+    "segments": 4 * 1024 * 1024 * 1024,
+    "proxies": 20 * 1024 * 1024 * 1024,
+    "stabilized": 20 * 1024 * 1024 * 1024,
+    "variants": 4 * 1024 * 1024 * 1024,
+    "keyframes": 64 * 1024 * 1024,
+    "probes": 16 * 1024 * 1024,
+}
+
+_hash_memo = {}
+
+
+def file_hash(path):
+    # hashing a multi-GB source is not free, remember it while the file is unchanged
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    if memo_key in _hash_memo:
+        return _hash_memo[memo_key]
+
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+
+    digest = h.hexdigest()
+    _hash_memo[memo_key] = digest
+    return digest
+
+
+def cache_key(path, **params):
+    parts = [file_hash(path)] + [f"{k}={params[k]}" for k in sorted(params)]
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
+def cache_dir(kind):
+    d = os.path.join(CACHE_ROOT, kind)
+    os.makedirs(d, exist_ok=True)
+    return d
+
+
+def touch(path):
+    # mtime doubles as the LRU clock
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def evict(kind, max_bytes=None):
+    if max_bytes is None:
+        max_bytes = CACHE_MAX_BYTES.get(kind)
+    if max_bytes is None:
+        return
+
+    d = cache_dir(kind)
+    entries = []
+    for name in os.listdir(d):
+        if ".tmp" in name:
+            continue
+        p = os.path.join(d, name)
+        try:
+            st = os.stat(p)
+        except OSError:
+            continue
+        if os.path.isfile(p):
+            entries.append((st.st_mtime, st.st_size, p))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, p in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(p)
+            total -= size
+        except OSError:
+            pass
+
+
+# ======================================================
+# .npz entries
+# ======================================================
+def has_npz(kind, key):
+    return os.path.exists(os.path.join(cache_dir(kind), key + ".npz"))
+
+
+def load_npz(kind, key):
+    path = os.path.join(cache_dir(kind), key + ".npz")
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {k: data[k] for k in data.files}
+    except (OSError, ValueError, zipfile.BadZipFile):
+        # truncated or foreign file, drop it and recompute
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+
+    touch(path)
+    return arrays
+
+
+def save_npz(kind, key, **arrays):
+    path = os.path.join(cache_dir(kind), key + ".npz")
+    tmp = path + f".{os.getpid()}.{threading.get_ident()}.tmp"
+
+    # write then rename so a crashed render never leaves a half entry behind
+    with open(tmp, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp, path)
+
+    evict(kind)
+    return path
+
+
+# ======================================================
+# .json entries
+# ======================================================
+def load_json(kind, key):
+    path = os.path.join(cache_dir(kind), key + ".json")
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        # truncated or foreign file, drop it and recompute
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+
+    touch(path)
+    return data
+
+
+def save_json(kind, key, data):
+    path = os.path.join(cache_dir(kind), key + ".json")
+    tmp = path + f".{os.getpid()}.{threading.get_ident()}.tmp"
+
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+    evict(kind)
+    return path
@@ -0,0 +1,178 @@
+import os
+from fractions import Fraction
+
+from media import probe_video
+from segments import OUTPUT_FPS
+
+
+# ======================================================
+# ENCODING PROFILES
+# named output settings shared by every render backend:
+# frame rate (a number, or "source" for the camera
+# videos' own rate), x264 preset / CRF, encoder threads
+# (0 = ffmpeg decides), pixel format, container and an
+# optional output height taller sources are shrunk to. The
+# final mix is copied into the output untouched whenever
+# the container can hold its codec
+# ======================================================
+ENCODING_PROFILES = {
+    # what every render did before profiles existed
+    "standard": {
+        "fps": OUTPUT_FPS, "preset": "medium", "crf": 23, "threads": 0, "pix_fmt": "yuv420p", "container": "mp4",
+        "height": None,
+    },
+    "draft": {
+        "fps": OUTPUT_FPS, "preset": "veryfast", "crf": 26, "threads": 0, "pix_fmt": "yuv420p", "container": "mp4",
+        "height": 720,
+    },
+    "match source": {
+        "fps": "source", "preset": "medium", "crf": 23, "threads": 0, "pix_fmt": "yuv420p", "container": "mp4",
+        "height": None,
+    },
+    "high quality": {
+        "fps": "source", "preset": "slow", "crf": 18, "threads": 0, "pix_fmt": "yuv420p", "container": "mp4",
+        "height": None,
+    },
+    # for grading / further editing, the final mix usually goes in as PCM
+    "master": {
+        "fps": "source", "preset": "slow", "crf": 12, "threads": 0, "pix_fmt": "yuv422p10le", "container": "mov",
+        "height": None,
+    },
+}
+DEFAULT_PROFILE = "standard"
+
+X264_PRESETS = [
+    "ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow", "placebo",
+]
+# planar YUV formats as (chroma width divisor, chroma height divisor, bytes per sample)
+PIXEL_FORMATS = {
+    "yuv420p": (2, 2, 1), "yuv422p": (2, 1, 1), "yuv444p": (1, 1, 1),
+    "yuv420p10le": (2, 2, 2), "yuv422p10le": (2, 1, 2), "yuv444p10le": (1, 1, 2),
+}
+
+# audio codecs each container takes as they are, anything else is encoded to AAC
+AUDIO_COPY_CODECS = {
+    "mp4": {"aac", "mp3", "alac", "ac3", "eac3"},
+    "mov": {
+        "aac", "mp3", "alac", "ac3",
+        "pcm_s16le", "pcm_s24le", "pcm_s32le", "pcm_f32le", "pcm_s16be", "pcm_s24be",
+    },
+    "mkv": {
+        "aac", "mp3", "alac", "ac3", "eac3", "flac", "opus", "vorbis",
+        "pcm_s16le", "pcm_s24le", "pcm_s32le", "pcm_f32le",
+    },
+}
+AUDIO_ENCODE_ARGS = ["-c:a", "aac", "-b:a", "192k"]
+
+
+def resolve_profile(profile=DEFAULT_PROFILE):
+    # a profile name, or a dict of settings (a project file) on top of
+    # the "base" profile (default standard); raises ValueError.
+    # NTSC rates are written as fractions, "30000/1001"
+    if isinstance(profile, dict):
+        settings = dict(profile)
+        base = settings.pop("base", DEFAULT_PROFILE)
+    else:
+        settings, base = {}, profile
+    if base not in ENCODING_PROFILES:
+        raise ValueError(f"Unknown encoding profile {base!r}, expected one of {', '.join(ENCODING_PROFILES)}")
+
+    resolved = dict(ENCODING_PROFILES[base])
+    unknown = set(settings) - set(resolved)
+    if unknown:
+        raise ValueError(f"Unknown encoding settings: {', '.join(sorted(unknown))}")
+    resolved.update(settings)
+
+    if resolved["fps"] != "source":
+        try:
+            fps = Fraction(str(resolved["fps"])).limit_denominator(1001)
+        except (TypeError, ValueError, ZeroDivisionError):
+            fps = 0
+        if not 1 <= fps <= 240:
+            raise ValueError(f"Frame rate must be \"source\" or between 1 and 240, got {resolved['fps']!r}")
+        resolved["fps"] = whole(fps)
+    if resolved["preset"] not in X264_PRESETS:
+        raise ValueError(f"Unknown x264 preset {resolved['preset']!r}")
+    if not 0 <= float(resolved["crf"]) <= 51:
+        raise ValueError(f"CRF must be between 0 and 51, got {resolved['crf']!r}")
+    if int(resolved["threads"]) < 0:
+        raise ValueError(f"Threads must be 0 (automatic) or more, got {resolved['threads']!r}")
+    if resolved["pix_fmt"] not in PIXEL_FORMATS:
+        raise ValueError(f"Unsupported pixel format {resolved['pix_fmt']!r}")
+    if resolved["container"] not in AUDIO_COPY_CODECS:
+        raise ValueError(
+            f"Unsupported container {resolved['container']!r}, expected one of {', '.join(AUDIO_COPY_CODECS)}"
+        )
+    if resolved["height"] is not None:
+        try:
+            height = int(resolved["height"])
+        except (TypeError, ValueError):
+            height = 0
+        if height < 16 or height % 2:
+            raise ValueError(
+                f"Height must be None or an even number of pixels from 16 up, got {resolved['height']!r}"
+            )
+        resolved["height"] = height
+    return resolved
+
+
+def output_fps(profile, video_paths):
+    # "source": the rate most camera videos share (the higher one on a tie),
+    # as an exact fraction so 29.97 stays 30000/1001
+    if profile["fps"] != "source":
+        return profile["fps"]
+    rates = [Fraction(probe_video(p)["fps"]).limit_denominator(1001) for p in video_paths]
+    rates = [r for r in rates if 1 <= r <= 240]
+    if not rates:
+        return OUTPUT_FPS
+    return whole(max(set(rates), key=lambda r: (rates.count(r), r)))
+
+
+def whole(fps):
+    # 24 rather than Fraction(24), so whole rates format exactly as before
+    return int(fps) if fps.denominator == 1 else fps
+
+
+def video_codec_args(profile):
+    return [
+        "-c:v", "libx264", "-preset", profile["preset"], "-crf", f"{float(profile['crf']):g}",
+        "-pix_fmt", profile["pix_fmt"],
+    ]
+
+
+def audio_codec_args(final_audio_path, profile):
+    # stream copy when the container takes the final mix as it is
+    codec = probe_video(final_audio_path)["audio_codec"]
+    if codec in AUDIO_COPY_CODECS[profile["container"]]:
+        return ["-c:a", "copy"]
+    return AUDIO_ENCODE_ARGS
+
+
+def container_path(path, profile):
+    # the output file name with the profile's container as extension
+    return os.path.splitext(path)[0] + "." + profile["container"]
+
+
+def fitted_size(width, height, max_height=None):
+    # the size a source is drawn at: shrunk to the profile's height (aspect
+    # kept, even width), never enlarged; proxies are built at this size
+    if not max_height or height <= max_height:
+        return width, height
+    w = round(width * max_height / height)
+    return w + w % 2, max_height
+
+
+def frame_bytes(pix_fmt, width, height):
+    # size of one raw frame: the luma plane plus two chroma planes
+    cw, ch, depth = PIXEL_FORMATS[pix_fmt]
+    return (width * height + 2 * (width // cw) * (height // ch)) * depth
+
+
+def black_frame(pix_fmt, width, height):
+    # video-range black: luma 16, chroma 128 (64 / 512 at 10 bits, little endian)
+    cw, ch, depth = PIXEL_FORMATS[pix_fmt]
+    if depth == 1:
+        y, c = bytes([16]), bytes([128])
+    else:
+        y, c = (64).to_bytes(2, "little"), (512).to_bytes(2, "little")
+    return y * (width * height) + c * (2 * (width // cw) * (height // ch))
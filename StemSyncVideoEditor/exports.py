@@ -0,0 +1,143 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from media import probe_video
+from metrics import log
+from segments import OUTPUT_FPS, frame_count, plan_segments, segment_frames, stem_source_time
+
+
+# ======================================================
+# NLE EXPORTS
+# the edit as CMX3600 EDL / OpenTimelineIO, cut on the
+# same output frame grid the renderers use (the encoding
+# profile's frame rate, non-drop timecode at the nearest
+# whole rate), with source times in the original (not
+# proxy) files
+# ======================================================
+def source_durations(paths):
+    # ffprobe every source side by side, a dry run should not wait on them one by one
+    paths = list(dict.fromkeys(paths))
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(paths)))) as pool:
+        return dict(zip(paths, [info["duration"] for info in pool.map(probe_video, paths)]))
+
+
+def conform_events(plan, video_map, song_length, fps=OUTPUT_FPS):
+    paths = [video_map[seg["stem"]] if seg["type"] == "stem" else seg["clip"] for seg in plan]
+    durations = source_durations(paths)
+
+    events = []
+    for seg, path in zip(plan, paths):
+        f0, f1 = segment_frames(seg, fps)
+        if f1 <= f0:
+            continue
+
+        # output frame k is sampled at k / fps
+        offsets = np.arange(f0, f1) / float(fps) - seg["out_start"]
+
+        if seg["type"] == "stem":
+            times = stem_source_time(seg["source_start"] + offsets, durations[path], song_length)
+        else:
+            times = seg["source_start"] + offsets
+
+        src = np.round(times * float(fps)).astype(int)
+        # a looping stem wraps back to the start of its file, that is a new event
+        breaks = np.flatnonzero(np.diff(src) < 0) + 1
+        for a, b in zip(np.r_[0, breaks], np.r_[breaks, len(src)]):
+            events.append({
+                "path": path,
+                "type": seg["type"],
+                "transform": seg["transform"],
+                "looped": seg["type"] != "stem" and seg["duration"] > durations[path],
+                "record_in": f0 + int(a),
+                "record_out": f0 + int(b),
+                "source_in": int(src[a]),
+                "source_out": int(src[a]) + int(b - a),
+            })
+
+    return events
+
+
+def timecode(frames, fps=OUTPUT_FPS):
+    fps = int(round(fps))
+    s, f = divmod(int(frames), fps)
+    m, s = divmod(s, 60)
+    h, m = divmod(m, 60)
+    return f"{h:02d}:{m:02d}:{s:02d}:{f:02d}"
+
+
+def edl_event(n, track, path, src_in, src_out, rec_in, rec_out, fps, notes=()):
+    line = (
+        f"{n:03d}  AX       {track:<5} C        "
+        f"{timecode(src_in, fps)} {timecode(src_out, fps)} {timecode(rec_in, fps)} {timecode(rec_out, fps)}"
+    )
+    return [
+        line,
+        f"* FROM CLIP NAME: {os.path.basename(path)}",
+        f"* SOURCE FILE: {os.path.abspath(path)}",
+    ] + [f"* {note}" for note in notes] + [""]
+
+
+def write_edl(timeline, video_map, song_length, final_audio_path, output_path, fps=OUTPUT_FPS):
+    events = conform_events(plan_segments(timeline), video_map, song_length, fps)
+    title = os.path.splitext(os.path.basename(output_path))[0]
+    lines = [f"TITLE: {title}", "FCM: NON-DROP FRAME", ""]
+
+    for n, e in enumerate(events, 1):
+        # mirror / reverse / ping-pong have no CMX3600 equivalent, they are noted for the editor
+        notes = [f"STEMSYNC {t.upper()}" for t in e["transform"]]
+        if e["looped"]:
+            notes.append("STEMSYNC PING-PONG LOOP")
+        lines += edl_event(
+            n, "V", e["path"], e["source_in"], e["source_out"], e["record_in"], e["record_out"], fps, notes
+        )
+
+    total = frame_count(song_length, fps)
+    lines += edl_event(len(events) + 1, "AA", final_audio_path, 0, total, 0, total, fps)
+
+    edl_path = os.path.splitext(output_path)[0] + ".edl"
+    with open(edl_path, "w") as f:
+        f.write("\n".join(lines))
+    return edl_path
+
+
+def write_otio(timeline, video_map, song_length, final_audio_path, output_path, fps=OUTPUT_FPS):
+    try:
+        import opentimelineio as otio
+    except ImportError:
+        log.warning("opentimelineio not installed, skipping .otio export")
+        return None
+
+    # NTSC rates come in as fractions, OTIO keeps its rate as a float
+    rate = float(fps)
+
+    def clip(path, start, frames, metadata=None):
+        return otio.schema.Clip(
+            name=os.path.basename(path),
+            media_reference=otio.schema.ExternalReference(
+                target_url=otio.url_utils.url_from_filepath(os.path.abspath(path))
+            ),
+            source_range=otio.opentime.TimeRange(
+                otio.opentime.RationalTime(start, rate), otio.opentime.RationalTime(frames, rate)
+            ),
+            metadata=metadata or {},
+        )
+
+    video = otio.schema.Track(name="Video", kind=otio.schema.TrackKind.Video)
+    for e in conform_events(plan_segments(timeline), video_map, song_length, fps):
+        video.append(clip(
+            e["path"], e["source_in"], e["record_out"] - e["record_in"],
+            {"stemsync": {"type": e["type"], "transform": list(e["transform"]), "looped": e["looped"]}}
+        ))
+
+    audio = otio.schema.Track(name="Audio", kind=otio.schema.TrackKind.Audio)
+    audio.append(clip(final_audio_path, 0, frame_count(song_length, fps)))
+
+    edit = otio.schema.Timeline(name=os.path.splitext(os.path.basename(output_path))[0])
+    edit.tracks.append(video)
+    edit.tracks.append(audio)
+
+    otio_path = os.path.splitext(output_path)[0] + ".otio"
+    otio.adapters.write_to_file(edit, otio_path)
+    return otio_path
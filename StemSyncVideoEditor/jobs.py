@@ -0,0 +1,235 @@
+import contextvars
+import itertools
+import os
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+
+# ======================================================
+# RENDER JOB QUEUE
+# renders, previews and dry runs from every browser tab go
+# through one queue: at most RENDER_JOBS run at a time, the
+# rest wait their turn instead of fighting over the CPU.
+# A job can be cancelled while it waits or while it runs,
+# its ffmpeg processes are killed and the pipeline stops at
+# the next check
+# ======================================================
+RENDER_JOBS = max(1, int(os.environ.get("STEMSYNC_RENDER_JOBS", 1)))
+
+# (stage, where it starts as a fraction of the job, label)
+STAGE_PROGRESS = [
+    ("preflight", 0.0, "Checking files"),
+    ("analysis", 0.02, "Analysing audio"),
+    ("beat_snap", 0.30, "Snapping beats"),
+    ("timeline", 0.32, "Building timeline"),
+    ("render.sources", 0.35, "Preparing sources"),
+    ("render.encode", 0.45, "Encoding"),
+    ("sweep", 0.35, "Rendering variants"),
+    ("exports", 0.95, "Writing edit files"),
+]
+
+POLL_SECONDS = 0.25
+
+_current = contextvars.ContextVar("stemsync_job", default=None)
+_quiet = contextvars.ContextVar("stemsync_quiet", default=False)
+_ids = itertools.count(1)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, fn, args, label):
+        self.id = next(_ids)
+        self.fn = fn
+        self.args = args
+        self.label = label
+        self.state = "queued"
+        self.stage = "Queued"
+        self.progress = 0.0
+        self.span = (0.0, 0.0)
+        self.cancelled = threading.Event()
+        self.procs = set()
+        self.lock = threading.Lock()
+        self.queue = None
+        self.future = None
+
+    def run(self):
+        if self.cancelled.is_set():
+            raise JobCancelled(f"{self.label} cancelled")
+        self.state = "running"
+        token = _current.set(self)
+        try:
+            return self.fn(*self.args)
+        except Exception:
+            # a killed ffmpeg shows up as a failed render, report it as what it was
+            if self.cancelled.is_set():
+                raise JobCancelled(f"{self.label} cancelled") from None
+            raise
+        finally:
+            _current.reset(token)
+            self.state = "cancelled" if self.cancelled.is_set() else "done"
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.future is not None and self.future.cancel():
+            self.state = "cancelled"
+        with self.lock:
+            procs = list(self.procs)
+        for proc in procs:
+            try:
+                proc.kill()
+            except OSError:
+                pass
+
+    def enter_stage(self, name):
+        for i, (stage, start, label) in enumerate(STAGE_PROGRESS):
+            if stage == name:
+                end = STAGE_PROGRESS[i + 1][1] if i + 1 < len(STAGE_PROGRESS) else 1.0
+                self.stage = label
+                self.span = (start, end)
+                self.progress = max(self.progress, start)
+
+    def advance(self, done, total):
+        start, end = self.span
+        if total > 0:
+            self.progress = max(self.progress, start + (end - start) * min(done / total, 1.0))
+
+
+class RenderQueue:
+    def __init__(self, workers=RENDER_JOBS):
+        self.pool = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="stemsync_job")
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args, label="Render"):
+        job = Job(fn, args, label)
+        job.queue = self
+        with self.lock:
+            self.jobs[job.id] = job
+        job.future = self.pool.submit(job.run)
+        job.future.add_done_callback(lambda _: self.forget(job))
+        return job
+
+    def forget(self, job):
+        with self.lock:
+            self.jobs.pop(job.id, None)
+
+    def position(self, job):
+        # jobs running or waiting ahead of this one
+        with self.lock:
+            return sum(1 for j in self.jobs.values() if j.state != "cancelled" and j.id < job.id)
+
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job is not None
+
+    def cancel_all(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            job.cancel()
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_queue():
+    # one queue per process, shared by every UI session
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = RenderQueue()
+        return _queue
+
+
+def wait_job(job, report=None):
+    # block until the job ends, report(fraction, label) in between
+    while True:
+        try:
+            return job.future.result(timeout=POLL_SECONDS)
+        except FutureTimeout:
+            pass
+        except CancelledError:
+            raise JobCancelled(f"{job.label} cancelled") from None
+
+        if report is not None:
+            if job.state == "queued":
+                ahead = job.queue.position(job)
+                report(0.0, f"Queued, {ahead} job(s) ahead")
+            else:
+                report(job.progress, job.stage)
+
+
+# ======================================================
+# hooks for the pipeline, all no-ops outside a job
+# ======================================================
+def current_job():
+    return _current.get()
+
+
+def check_cancelled():
+    job = _current.get()
+    if job is not None and job.cancelled.is_set():
+        raise JobCancelled(f"{job.label} cancelled")
+
+
+def stage_started(name):
+    job = _current.get()
+    if job is not None:
+        if not _quiet.get():
+            job.enter_stage(name)
+        check_cancelled()
+
+
+def advance(done, total):
+    job = _current.get()
+    if job is not None and not _quiet.get():
+        job.advance(done, total)
+
+
+def track(proc):
+    # a child process the job's cancel() has to kill
+    job = _current.get()
+    if job is not None:
+        with job.lock:
+            job.procs.add(proc)
+        if job.cancelled.is_set():
+            proc.kill()
+
+
+def untrack(proc):
+    job = _current.get()
+    if job is not None:
+        with job.lock:
+            job.procs.discard(proc)
+
+
+def wait_for(future):
+    # future.result() that gives up when the job is cancelled
+    while True:
+        check_cancelled()
+        try:
+            return future.result(timeout=POLL_SECONDS)
+        except FutureTimeout:
+            pass
+
+
+def in_job(fn, progress=True):
+    # for thread pools: the workers see the job of the thread that submits.
+    # progress=False: they can still be cancelled, but leave the progress
+    # bar to the submitting thread (e.g. several renders inside one sweep)
+    ctx = contextvars.copy_context()
+
+    def run(*args):
+        worker = ctx.copy()
+        if not progress:
+            worker.run(_quiet.set, True)
+        return worker.run(fn, *args)
+
+    return run
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import subprocess
+from fractions import Fraction
+from functools import lru_cache
+
+from cache import load_json, save_json
+from jobs import track, untrack
+
+
+FFMPEG_BIN = "ffmpeg"
+FFPROBE_BIN = "ffprobe"
+
+
+# ======================================================
+# ffmpeg / ffprobe helpers
+# ======================================================
+def run_ffmpeg(args, what="ffmpeg"):
+    cmd = [FFMPEG_BIN, "-hide_banner", "-nostdin", "-y", "-loglevel", "error"] + list(args)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    # cancelling the render job kills it
+    track(proc)
+    try:
+        out, err = proc.communicate()
+    finally:
+        untrack(proc)
+    if proc.returncode != 0:
+        tail = err.decode(errors="replace").strip().splitlines()[-20:]
+        raise RuntimeError(f"{what} failed ({proc.returncode}):\n" + "\n".join(tail))
+    return subprocess.CompletedProcess(cmd, proc.returncode, out, err)
+
+
+def parse_rate(rate):
+    try:
+        r = Fraction(rate)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return 0.0
+    return float(r) if r > 0 else 0.0
+
+
+def probe_video(path):
+    st = os.stat(path)
+    return dict(_probe(os.path.abspath(path), st.st_size, st.st_mtime_ns))
+
+
+@lru_cache(maxsize=512)
+def _probe(path, size, mtime_ns):
+    # kept on disk for the same file (path, size, mtime), so a fresh process,
+    # e.g. a timeline dry run from the command line, does not probe every camera again
+    key = hashlib.sha1(f"{path}|{size}|{mtime_ns}".encode()).hexdigest()
+    info = load_json("probes", key)
+    if info is None:
+        info = run_probe(path)
+        save_json("probes", key, info)
+    return info
+
+
+def run_probe(path):
+    proc = subprocess.run(
+        [FFPROBE_BIN, "-v", "error", "-print_format", "json",
+         "-show_format", "-show_streams", path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffprobe failed on {path}: {proc.stderr.decode(errors='replace').strip()}")
+
+    info = json.loads(proc.stdout or b"{}")
+    streams = info.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+
+    duration = info.get("format", {}).get("duration")
+    if duration in (None, "N/A") and video is not None:
+        duration = video.get("duration")
+    try:
+        duration = float(duration)
+    except (TypeError, ValueError):
+        duration = 0.0
+
+    return {
+        "path": path,
+        "duration": duration,
+        "has_video": video is not None,
+        "has_audio": audio is not None,
+        "width": int(video.get("width", 0)) if video else 0,
+        "height": int(video.get("height", 0)) if video else 0,
+        "fps": parse_rate(video.get("r_frame_rate")) if video else 0.0,
+        "avg_fps": parse_rate(video.get("avg_frame_rate")) if video else 0.0,
+        "codec": video.get("codec_name") if video else None,
+        "pix_fmt": video.get("pix_fmt") if video else None,
+        "audio_codec": audio.get("codec_name") if audio else None,
+        "sample_rate": int(audio.get("sample_rate", 0)) if audio else 0,
+        "channels": int(audio.get("channels", 0)) if audio else 0,
+    }
@@ -0,0 +1,316 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from jobs import stage_started, wait_for
+
+# metrics are best effort: resource is POSIX only, psutil is optional
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+log = logging.getLogger("stemsync")
+
+
+# ======================================================
+# LOGGING
+# ======================================================
+class JsonFormatter(logging.Formatter):
+    # one JSON object per line, stage metrics ride along as fields
+    def format(self, record):
+        entry = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def setup_logging(level="INFO", json_lines=False):
+    handler = logging.StreamHandler()
+    handler.setFormatter(
+        JsonFormatter() if json_lines else logging.Formatter("%(asctime)s %(levelname)s %(message)s")
+    )
+    log.handlers[:] = [handler]
+    log.setLevel(level.upper() if isinstance(level, str) else level)
+    log.propagate = False
+
+
+# ======================================================
+# STAGE METRICS
+# wall / CPU time and peak memory per pipeline stage, plus
+# counters (segments, seeks, frames). Collected per thread,
+# so renders running side by side keep their own numbers
+# (CPU time is process-wide, it includes the neighbours)
+# ======================================================
+SAMPLE_INTERVAL = 0.1
+# whether memory can be sampled while a stage runs (without it only the process peak, if that)
+CAN_SAMPLE_RSS = os.path.isdir("/proc") or psutil is not None
+
+_local = threading.local()
+
+
+def tree_rss_mb():
+    # RSS of this process and every descendant (ffmpeg, analysis workers),
+    # 0 where the platform cannot tell
+    if not os.path.isdir("/proc"):
+        return fallback_rss_mb()
+
+    parents = {}
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                parents[int(pid)] = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            pass
+
+    tree, grew = {os.getpid()}, True
+    while grew:
+        children = {p for p, pp in parents.items() if pp in tree} - tree
+        tree |= children
+        grew = bool(children)
+
+    total = 0
+    for pid in tree:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                total += next((int(l.split()[1]) for l in f if l.startswith("VmRSS")), 0)
+        except OSError:
+            pass
+    return total / 1024
+
+
+def fallback_rss_mb():
+    # no /proc (Windows, macOS): psutil walks the tree, else the peak of this process
+    if psutil is not None:
+        try:
+            root = psutil.Process()
+            procs = [root] + root.children(recursive=True)
+        except psutil.Error:
+            procs = []
+        total = 0
+        for proc in procs:
+            try:
+                total += proc.memory_info().rss
+            except psutil.Error:
+                pass
+        return total / (1024 * 1024)
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return 0.0
+
+
+def cpu_seconds():
+    # this process plus finished child processes (ffmpeg encodes); os.times
+    # is coarser and leaves the children out on Windows
+    if resource is None:
+        t = os.times()
+        return t.user + t.system + t.children_user + t.children_system
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+class RunMetrics:
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+        self.prefix = []
+        self.open = []
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+
+    def sample(self):
+        # one sampler for the whole run, every open stage keeps its own peak
+        while not self.done.wait(SAMPLE_INTERVAL):
+            rss = tree_rss_mb()
+            with self.lock:
+                for rec in self.open:
+                    rec["peak"] = max(rec["peak"], rss)
+
+    def record(self, name, wall, cpu, peak, calls=1):
+        rec = self.stages.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": 0.0, "calls": 0})
+        rec["wall_s"] += wall
+        rec["cpu_s"] += cpu
+        rec["peak_rss_mb"] = max(rec["peak_rss_mb"], peak)
+        rec["calls"] += calls
+
+    def merge(self, stages, counts):
+        # stages measured elsewhere (an analysis worker process, a sweep variant's thread)
+        for name, rec in stages.items():
+            self.record(
+                ".".join(self.prefix + [name]),
+                rec["wall_s"], rec["cpu_s"], rec["peak_rss_mb"], rec["calls"]
+            )
+        for key, n in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + n
+
+    def as_dict(self):
+        stages = {
+            name: {
+                "wall_s": round(rec["wall_s"], 4),
+                "cpu_s": round(rec["cpu_s"], 4),
+                "peak_rss_mb": round(rec["peak_rss_mb"], 1),
+                "calls": rec["calls"],
+            }
+            for name, rec in self.stages.items()
+        }
+        counts = dict(self.counts)
+        encode = self.stages.get("render.encode")
+        if encode and counts.get("frames_encoded") and encode["wall_s"] > 0:
+            counts["encode_fps"] = round(counts["frames_encoded"] / encode["wall_s"], 2)
+        return {"stages": stages, "counts": counts}
+
+
+def current():
+    return getattr(_local, "metrics", None)
+
+
+@contextmanager
+def collect():
+    # everything measured in this thread until the block ends
+    outer = current()
+    metrics = RunMetrics()
+    _local.metrics = metrics
+    if CAN_SAMPLE_RSS:
+        metrics.sampler.start()
+    try:
+        yield metrics
+    finally:
+        metrics.done.set()
+        _local.metrics = outer
+
+
+@contextmanager
+def stage(name):
+    metrics = current()
+    if metrics is None:
+        stage_started(name)
+        yield
+        return
+
+    full = ".".join(metrics.prefix + [name])
+    # a running job reports progress here and stops here when cancelled
+    stage_started(full)
+    metrics.prefix.append(name)
+    rec = {"peak": tree_rss_mb()}
+    with metrics.lock:
+        metrics.open.append(rec)
+    t0 = time.perf_counter()
+    cpu0 = cpu_seconds()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - t0
+        cpu = cpu_seconds() - cpu0
+        with metrics.lock:
+            metrics.open = [r for r in metrics.open if r is not rec]
+        peak = max(rec["peak"], tree_rss_mb())
+        metrics.prefix.pop()
+        metrics.record(full, wall, cpu, peak)
+        log.debug(
+            f"{full}: {wall:.2f}s wall, {cpu:.2f}s cpu, peak {peak:.0f} MB",
+            extra={"fields": {"stage": full, "wall_s": wall, "cpu_s": cpu, "peak_rss_mb": peak}}
+        )
+
+
+def count(key, n=1):
+    metrics = current()
+    if metrics is not None:
+        metrics.counts[key] = metrics.counts.get(key, 0) + n
+
+
+def measured(fn, *args):
+    # run in a worker process: the result plus the stages it went through
+    with collect() as metrics:
+        result = fn(*args)
+    return result, metrics.stages, metrics.counts
+
+
+def merged(job):
+    # the result of a measured() job, its numbers added to this thread's run
+    result, stages, counts = wait_for(job)
+    metrics = current()
+    if metrics is not None:
+        metrics.merge(stages, counts)
+    return result
+
+
+def write_metrics(metrics, output_path):
+    data = metrics.as_dict()
+    for name, rec in data["stages"].items():
+        log.info(
+            f"{name}: {rec['wall_s']:.2f}s wall, {rec['cpu_s']:.2f}s cpu, peak {rec['peak_rss_mb']:.0f} MB",
+            extra={"fields": dict(rec, stage=name)}
+        )
+    log.info(
+        ", ".join(f"{k} {v}" for k, v in data["counts"].items()) or "no counters",
+        extra={"fields": data["counts"]}
+    )
+
+    metrics_path = os.path.splitext(output_path)[0] + ".metrics.json"
+    with open(metrics_path, "w") as f:
+        json.dump({"metrics": data}, f, indent=2)
+    return metrics_path
+
+
+# ======================================================
+# PROFILING
+# STEMSYNC_PROFILE=cprofile or pyinstrument profiles a run
+# (the calling thread) next to its output
+# ======================================================
+@contextmanager
+def profiled(output_path):
+    kind = os.environ.get("STEMSYNC_PROFILE", "").lower()
+    if not kind:
+        yield
+        return
+
+    stem = os.path.splitext(output_path)[0]
+    if kind == "cprofile":
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(stem + ".prof")
+            log.info(f"cProfile stats written to {stem}.prof")
+        return
+
+    if kind == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            log.warning("pyinstrument not installed, not profiling")
+            yield
+            return
+
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(stem + ".profile.html", "w") as f:
+                f.write(profiler.output_html())
+            log.info(f"pyinstrument profile written to {stem}.profile.html")
+        return
+
+    log.warning(f"Unknown STEMSYNC_PROFILE {kind!r}, expected cprofile or pyinstrument")
+    yield
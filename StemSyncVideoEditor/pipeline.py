@@ -0,0 +1,1177 @@
+import csv
+import itertools
+import json
+import os
+import re
+import tempfile
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+from analysis import STEM_FEATURES, analyze_all, detect_snapped_beats
+from encoding import (
+    DEFAULT_PROFILE, audio_codec_args, container_path, output_fps, resolve_profile, video_codec_args
+)
+from exports import write_edl, write_otio
+from jobs import advance, check_cancelled, current_job, in_job
+from media import probe_video
+from metrics import collect, count, log, measured, profiled, stage, write_metrics
+from proxies import PROXY_CRF, PROXY_PIX_FMT, PROXY_PRESET, free_clip_sources, prepare_proxies, render_source
+from render_ffmpeg import (
+    AUDIO_CODEC_ARGS, VIDEO_CODEC_ARGS, build_preview, build_video_ffmpeg, canvas_size, concat_and_mux, drawn_size
+)
+from render_smart import build_video_smart
+from render_stream import build_video_stream
+from scenes import prepare_scenes, scene_cuts
+from segments import (
+    OUTPUT_FPS, SAFE_START, frame_count, frame_index, plan_segments, segment_frames, snap_to_frames,
+    stem_needs_loop, stem_source_time
+)
+from stabilize import STABILIZE_MODES, prepare_stabilized
+from timeline import (
+    bar_counts, cut_horizon, cut_opportunities, energy_matrix, min_beats_per_beat, scene_matrix, section_labels
+)
+
+
+# ======================================================
+# EDIT PIPELINE
+# everything render_action does, without Gradio, so it can
+# be driven from the UI, the command line or a batch job.
+# moviepy is only imported by the moviepy backend
+# ======================================================
+class EditError(Exception):
+    pass
+
+def file_path(f):
+    # Gradio hands over file objects, the CLI plain paths
+    return getattr(f, "name", f)
+
+def base(path):
+    return os.path.splitext(os.path.basename(path))[0].lower()
+
+def get_default_output_path(container="mp4"):
+    # first render_NNN no file starts with (video in any container, summary,
+    # EDL, sweep variants), with the extension the render will be written in
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    out = os.path.join(script_dir, "output")
+    os.makedirs(out, exist_ok=True)
+    taken = {m.group() for m in map(re.compile(r"render_\d+").match, os.listdir(out)) if m}
+    i = 1
+    while f"render_{i:03d}" in taken:
+        i += 1
+    return os.path.join(out, f"render_{i:03d}.{container}")
+
+
+# ======================================================
+# intro / outro clips
+# ======================================================        
+def find_optional_clip(name):
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    path = os.path.join(script_dir, name)
+    return path if os.path.exists(path) else None
+
+# ======================================================
+# next beat after
+# ======================================================
+def next_beat_after(beats, t):
+    for b in beats:
+        if b >= t:
+            return b
+    return t
+
+def section_at_time(sections, t):
+    for s in sections:
+        if s["start"] <= t < s["end"]:
+            return s["type"]
+    return "verse"
+
+# ======================================================
+# FreeClipCycler
+# ======================================================
+class FreeClipCycler:
+    def __init__(self, clips):
+        self.clips = clips
+        self.idx = 0
+        self.phase = 0  # 0 = normal, 1 = mirrored+reversed
+
+    def next(self):
+        clip = self.clips[self.idx]
+
+        transform = []
+        if self.phase == 1:
+            transform = ["mirror", "reverse"]
+
+        self.idx += 1
+        if self.idx >= len(self.clips):
+            self.idx = 0
+            self.phase = (self.phase + 1) % 2
+
+        return clip, transform
+
+# ======================================================
+# PREFLIGHT
+# every input file is probed side by side before anything
+# is decoded or analysed, and every problem found is
+# reported at once instead of one per failed run
+# ======================================================
+PREFLIGHT_WORKERS = 16
+VFR_TOLERANCE = 0.01  # average vs nominal frame rate
+STEM_SHORTFALL = 1.0  # seconds a stem may end before the mix without a warning
+
+def probe_all(paths):
+    def probe(p):
+        try:
+            return probe_video(p)
+        except (OSError, RuntimeError) as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(PREFLIGHT_WORKERS, len(paths)))) as pool:
+        return dict(zip(paths, pool.map(probe, paths)))
+
+def preflight(audio_files, video_files, free_video_files, final_audio, intro_clip=None, outro_clip=None):
+    # (errors, warnings); errors stop the edit, warnings are only logged
+    stems = [file_path(f) for f in audio_files or []]
+    videos = [file_path(f) for f in video_files or []]
+    free = [file_path(f) for f in free_video_files or []]
+    mix = file_path(final_audio) if final_audio else None
+    clips = [p for p in (intro_clip, outro_clip) if p]
+
+    infos = probe_all(list(dict.fromkeys(stems + videos + free + clips + ([mix] if mix else []))))
+    errors, warnings = [], []
+
+    def readable(p, label, stream):
+        info = infos[p]
+        name = os.path.basename(p)
+        if isinstance(info, Exception):
+            reason = str(info).strip().splitlines()[-1] if str(info).strip() else type(info).__name__
+            errors.append(f"{label} {name}: cannot be read ({reason})")
+            return None
+        if not info[f"has_{stream}"]:
+            errors.append(f"{label} {name}: no {stream} stream")
+            return None
+        return info
+
+    def check_audio(p, label):
+        info = readable(p, label, "audio")
+        if info is not None and info["duration"] <= 0:
+            errors.append(f"{label} {os.path.basename(p)}: has no length")
+        return info
+
+    def check_video(p, label):
+        info = readable(p, label, "video")
+        if info is None:
+            return None
+        name = os.path.basename(p)
+        if info["duration"] <= SAFE_START:
+            errors.append(f"{label} {name}: only {info['duration']:.2f}s long, needs more than {SAFE_START}s")
+        if not info["width"] or not info["height"]:
+            errors.append(f"{label} {name}: no picture size")
+        fps, avg = info["fps"], info["avg_fps"]
+        if not fps:
+            warnings.append(f"{label} {name}: unknown frame rate, rendered at {OUTPUT_FPS} fps")
+        elif not 10 <= fps <= 120:
+            warnings.append(f"{label} {name}: unusual frame rate {fps:g} fps, rendered at {OUTPUT_FPS} fps")
+        if fps and avg and abs(avg - fps) > VFR_TOLERANCE * fps:
+            warnings.append(
+                f"{label} {name}: variable frame rate ({avg:.3f} average vs {fps:g} fps), "
+                "cuts and loops can drift unless rendered from proxies"
+            )
+        return info
+
+    if mix is None:
+        errors.append("Final mix required")
+    else:
+        mix_info = check_audio(mix, "Final mix")
+
+    stem_infos = {p: check_audio(p, "Stem") for p in stems}
+    video_infos = {p: check_video(p, "Video") for p in videos}
+    for p in free:
+        check_video(p, "Free clip")
+    for p in clips:
+        check_video(p, "Intro/outro clip")
+
+    # stems and videos are paired by file name, see generate_timeline
+    stem_names = {base(p): p for p in stems}
+    video_names = {}
+    for p in videos:
+        if base(p) in video_names:
+            warnings.append(
+                f"Videos {os.path.basename(video_names[base(p)])} and {os.path.basename(p)} "
+                "share a name, only the last is used"
+            )
+        video_names[base(p)] = p
+
+    matched = [n for n in stem_names if n in video_names]
+    if stems and videos and not matched:
+        errors.append(
+            "No matching audio/video stem names "
+            f"(stems: {', '.join(sorted(stem_names))}; videos: {', '.join(sorted(video_names))})"
+        )
+    elif not stems or not videos:
+        errors.append("At least one audio stem and one video with the same name are required")
+    else:
+        for n in sorted(set(stem_names) - set(video_names)):
+            warnings.append(f"Stem {os.path.basename(stem_names[n])} has no video named {n}.*, it is left out")
+        for n in sorted(set(video_names) - set(stem_names)):
+            warnings.append(f"Video {os.path.basename(video_names[n])} has no stem named {n}.*, it is never shown")
+
+    if mix is not None and mix_info is not None:
+        for n in matched:
+            info = stem_infos[stem_names[n]]
+            if info is not None and info["duration"] < mix_info["duration"] - STEM_SHORTFALL:
+                warnings.append(
+                    f"Stem {os.path.basename(stem_names[n])} ends {mix_info['duration'] - info['duration']:.1f}s "
+                    "before the final mix, it counts as silent after that"
+                )
+
+    sizes = {(i["width"], i["height"]) for i in video_infos.values() if i is not None and i["width"]}
+    if len(sizes) > 1:
+        W, H = max(w for w, _ in sizes), max(h for _, h in sizes)
+        warnings.append(
+            f"Videos differ in size ({', '.join(f'{w}x{h}' for w, h in sorted(sizes))}), "
+            f"smaller ones are centred on a {W}x{H} black canvas"
+        )
+
+    return errors, warnings
+
+def check_edit(audio_files, video_files, free_video_files, final_audio):
+    # raises EditError listing every problem, returns the warnings
+    errors, warnings = preflight(
+        audio_files, video_files, free_video_files, final_audio,
+        find_optional_clip("intro.mp4"), find_optional_clip("outro.mp4")
+    )
+    for w in warnings:
+        log.warning(w)
+    if errors:
+        raise EditError("\n".join(errors))
+    return warnings
+
+def check_stabilize(stabilize):
+    if stabilize not in STABILIZE_MODES:
+        raise EditError(f"Unknown stabilization {stabilize!r}, expected one of {', '.join(STABILIZE_MODES)}")
+
+def check_profile(profile, backend=None, use_proxies=True):
+    # the resolved encoding settings of a profile name (or project dict),
+    # turned away when the render backend cannot write its pixel format
+    try:
+        settings = resolve_profile(profile)
+    except (TypeError, ValueError) as e:
+        raise EditError(str(e))
+
+    pix_fmt = settings["pix_fmt"]
+    if backend == "moviepy" and pix_fmt != "yuv420p":
+        raise EditError(
+            f"The moviepy backend always writes yuv420p, render {pix_fmt} with the ffmpeg or stream backend"
+        )
+    if backend == "smart" and use_proxies and pix_fmt != PROXY_PIX_FMT:
+        raise EditError(
+            f"The smart backend copies {PROXY_PIX_FMT} proxy frames, render {pix_fmt} with the ffmpeg or "
+            "stream backend, or without proxies"
+        )
+    return settings
+
+def ignored_settings(settings, backend, use_proxies):
+    # profile settings a backend renders past (its output is still valid, just not as asked)
+    if backend != "smart" or not use_proxies:
+        return []
+    ignored = []
+    if settings["preset"] != PROXY_PRESET:
+        ignored.append(f"preset {settings['preset']} (proxies are {PROXY_PRESET})")
+    if float(settings["crf"]) != PROXY_CRF:
+        ignored.append(f"CRF {float(settings['crf']):g} (proxies are CRF {PROXY_CRF})")
+    return ignored
+
+
+# ======================================================
+# BEAT-LOCKED TIMELINE
+# ======================================================
+def generate_timeline(
+    audio_files,
+    video_files,
+    beat_times,
+    sections,
+    cooldown,
+    song_length,
+    chorus_aggression,
+    phrase_beats,
+    downbeat_bias,
+    free_cycler,
+    free_clip_probability,
+    stem_analysis=None,
+    scenes=None,
+    scene_mode="off",
+    scene_window=0.5,
+    energy_metric="rms",
+    downbeats=None,
+    seed=None
+):
+    if energy_metric not in STEM_FEATURES:
+        raise EditError(f"Unknown energy metric {energy_metric!r}, expected one of {', '.join(STEM_FEATURES)}")
+    if stem_analysis is None:
+        stem_analysis, _ = analyze_all([file_path(f) for f in audio_files])
+    audio = {base(file_path(f)): stem_analysis[file_path(f)] for f in audio_files}
+    video_map = {base(file_path(f)): file_path(f) for f in video_files}
+    stems = [s for s in audio if s in video_map]
+
+    if not stems:
+        raise EditError("No matching audio/video stem names")
+
+    # a fixed seed keeps unchanged regions identical between renders
+    rng = np.random if seed is None else np.random.RandomState(int(seed))
+
+    times = np.asarray(beat_times, dtype=float)
+    times = times[:cut_horizon(times, song_length)]
+
+    labels = section_labels(sections, times)
+    min_beats = min_beats_per_beat(labels, phrase_beats, chorus_aggression)
+    energy, active = energy_matrix(times, stems, audio, energy_metric)
+
+    # stems whose source video jumps near a beat (scene cuts found by scenes.py)
+    if scene_mode != "off" and scenes:
+        near = scene_matrix(times, stems, scenes, song_length, scene_window)
+    else:
+        near = np.zeros((len(times), len(stems)), dtype=bool)
+    allowed = np.zeros(len(times), dtype=bool)
+    allowed[cut_opportunities(len(times), downbeat_bias, bar_counts(times, downbeats))] = True
+
+    timeline = []
+    current = 0
+    showing = None
+    last_used = np.full(len(stems), -999.0)
+    last_cut_beat = -999
+
+    for idx in range(len(times)):
+        # prefer: cut away from a camera right where its own source jumps, hiding the jump
+        hide = scene_mode == "prefer" and showing is not None and near[idx, showing]
+        if not (allowed[idx] or hide):
+            continue
+        if idx - last_cut_beat < (1 if hide else min_beats[idx]):
+            continue
+
+        t = float(times[idx])
+        section = labels[idx]
+
+        # never switch to a camera that is about to jump
+        candidates = active[idx] & (t - last_used >= cooldown) & ~near[idx]
+        candidates[current] = False
+
+        if candidates.any():
+            stem = int(np.argmax(np.where(candidates, energy[idx], -np.inf)))
+        elif not active[idx].any():
+            others = [s for j, s in enumerate(stems) if j != current and not near[idx, j]]
+            if not others:
+                continue
+            stem = stems.index(rng.choice(others))
+        else:
+            continue
+        is_final_cut = (t >= song_length - 0.05)
+
+
+        use_free = (
+            free_cycler is not None
+            and not is_final_cut
+            and rng.rand() < free_clip_probability
+        )
+
+
+        if use_free:
+            clip_path, transform = free_cycler.next()
+            timeline.append({
+                "time": t,
+                "type": "free",
+                "clip": clip_path,
+                "transform": transform,
+                "beat_idx": int(idx),
+                "section": section
+            })
+        else:
+            timeline.append({
+                "time": t,
+                "type": "stem",
+                "stem": stems[stem],
+                "beat_idx": int(idx),
+                "section": section
+            })
+
+
+        last_used[stem] = t
+        current = stem
+        showing = None if use_free else stem
+        last_cut_beat = idx
+
+    if not timeline or timeline[-1]["time"] < song_length:
+        timeline.append({
+            "time": song_length,
+            "type": "stem",
+            "stem": stems[current],
+            "beat_idx": len(beat_times),
+            "section": section_at_time(sections, song_length)
+        })
+
+    return timeline, stems, video_map
+
+
+# ======================================================
+# write_edit_summary
+# ======================================================
+def write_edit_summary(timeline, output_path):
+    summary = []
+
+    for i in range(len(timeline) - 1):
+        start = timeline[i]["time"]
+        end = timeline[i + 1]["time"]
+
+        summary.append({
+            "clip": (
+                os.path.basename(timeline[i]["clip"])
+                if timeline[i].get("type") in ("free", "intro", "outro")
+                else f"{timeline[i]['stem']}.mp4"
+            ),
+
+            "timeline_start": round(start, 3),
+            "timeline_end": round(end, 3),
+            "source_start": (
+                0.0 if timeline[i].get("type") == "free"
+                else round(start, 3)
+            ),
+            "duration": round(end - start, 3)
+        })
+
+    json_path = os.path.splitext(output_path)[0] + ".json"
+    with open(json_path, "w") as f:
+        json.dump(summary, f, indent=2)
+
+    return json_path
+
+def write_edit_files(timeline, video_map, song_len, final_audio_path, output_path, fps=OUTPUT_FPS):
+    # .json summary plus EDL / OTIO so the edit can be conformed in an NLE,
+    # at the frame rate the video is (or would be) rendered at
+    paths = [
+        write_edit_summary(timeline, output_path),
+        write_edl(timeline, video_map, song_len, final_audio_path, output_path, fps),
+        write_otio(timeline, video_map, song_len, final_audio_path, output_path, fps),
+    ]
+    return [p for p in paths if p]
+
+# ======================================================
+# VIDEO BUILD
+# ======================================================
+RENDER_BACKENDS = ["moviepy", "ffmpeg", "stream", "smart"]
+RENDER_WORKERS = os.cpu_count() or 1
+
+def build_video(
+    timeline, stems, video_map, song_length, final_audio_path, output_path,
+    backend="moviepy", render_workers=1, chunk_seconds=0, incremental=False, use_proxies=True,
+    stabilize="off", profile=DEFAULT_PROFILE
+):
+    # the profile decides the frame rate, x264 settings and whether the final mix is copied
+    settings = check_profile(profile, backend, use_proxies)
+    ignored = ignored_settings(settings, backend, use_proxies)
+    if ignored:
+        log.warning(f"The {backend} backend copies proxy frames, not applied: {', '.join(ignored)}")
+    encoding = {
+        "fps": output_fps(settings, [video_map[s] for s in stems]),
+        "codec_args": video_codec_args(settings),
+        "audio_args": audio_codec_args(final_audio_path, settings),
+        "threads": int(settings["threads"]),
+        "pix_fmt": settings["pix_fmt"],
+        "max_height": settings["height"],
+    }
+
+    with stage("render"), removed_if_cancelled(output_path):
+        if backend == "ffmpeg":
+            return build_video_ffmpeg(
+                timeline, stems, video_map, song_length, final_audio_path, output_path,
+                workers=int(render_workers), chunk_seconds=chunk_seconds, incremental=incremental,
+                use_proxies=use_proxies, stabilize=stabilize, **encoding
+            )
+
+        if backend == "stream":
+            return build_video_stream(
+                timeline, stems, video_map, song_length, final_audio_path, output_path,
+                use_proxies=use_proxies, stabilize=stabilize, **encoding
+            )
+
+        if backend == "smart":
+            return build_video_smart(
+                timeline, stems, video_map, song_length, final_audio_path, output_path,
+                use_proxies=use_proxies, stabilize=stabilize, **encoding
+            )
+
+        return build_video_moviepy(
+            timeline, stems, video_map, song_length, final_audio_path, output_path, use_proxies, stabilize,
+            **encoding
+        )
+
+
+@contextmanager
+def removed_if_cancelled(path):
+    # a cancelled render leaves a truncated file behind
+    try:
+        yield
+    except Exception:
+        job = current_job()
+        if job is not None and job.cancelled.is_set() and os.path.exists(path):
+            os.remove(path)
+        raise
+
+
+def moviepy_logger():
+    # moviepy's progress bars drive the job's progress, and let it be cancelled mid-encode
+    if current_job() is None:
+        return "bar"
+
+    from proglog import ProgressBarLogger
+
+    class JobLogger(ProgressBarLogger):
+        def bars_callback(self, bar, attr, value, old_value=None):
+            check_cancelled()
+            if bar == "t" and attr == "index":
+                advance(value, self.bars[bar]["total"])
+
+    return JobLogger()
+
+
+def build_video_moviepy(
+    timeline, stems, video_map, song_length, final_audio_path, output_path, use_proxies=True, stabilize="off",
+    fps=OUTPUT_FPS, codec_args=VIDEO_CODEC_ARGS, audio_args=AUDIO_CODEC_ARGS, threads=0, pix_fmt="yuv420p",
+    max_height=None
+):
+    # moviepy always writes yuv420p, check_profile turns other pixel formats away
+    # cut on the same output frames, from the same source frames, as the ffmpeg backends
+    plan = snap_to_frames(plan_segments(timeline), fps)
+    count("segments", len(plan))
+
+    # every reader opened for this render is closed again, also when the job is cancelled
+    opened = []
+    try:
+        return write_moviepy(
+            plan, stems, video_map, song_length, final_audio_path, output_path, use_proxies, stabilize, opened,
+            fps, codec_args, audio_args, threads, max_height
+        )
+    finally:
+        for clip in opened:
+            clip.close()
+
+
+def write_moviepy(
+    plan, stems, video_map, song_length, final_audio_path, output_path, use_proxies, stabilize, opened,
+    fps, codec_args, audio_args, threads, max_height=None
+):
+    from moviepy.editor import VideoClip, VideoFileClip
+
+    clips = {}
+
+    def open_clip(path):
+        if path not in clips:
+            # read at the size the profile's height draws it at (proxies already are)
+            info = probe_video(path)
+            w, h = drawn_size(info, max_height)
+            size = (h, w) if (w, h) != (info["width"], info["height"]) else None
+            clips[path] = VideoFileClip(path, audio=False, target_resolution=size)
+            opened.append(clips[path])
+        return clips[path]
+
+    with stage("sources"):
+        paths = [video_map[s] for s in stems] + [seg["clip"] for seg in plan if seg["type"] != "stem"]
+        prepare_stabilized(paths, stabilize)
+        if use_proxies:
+            prepare_proxies(paths, fps, stabilize, max_height)
+
+        # free / intro / outro clips are read from pre-mirrored, pre-reversed and
+        # pre-looped variants, front to back, instead of time_mirror per frame
+        free_sources = iter(free_clip_sources(
+            [seg for seg in plan if seg["type"] != "stem"], use_proxies, fps, stabilize, max_height
+        ))
+
+        # (first frame, end frame, clip, source time, loops) per segment, read
+        # the way the ffmpeg backends seek into it
+        cuts = []
+        for seg in plan:
+            f0, f1 = segment_frames(seg, fps)
+            if seg["type"] == "stem":
+                clip = open_clip(render_source(video_map[seg["stem"]], use_proxies, fps, stabilize, max_height))
+                if clip.duration <= SAFE_START:
+                    raise RuntimeError(f"Video too short to use: {clip.filename}")
+                t0 = stem_source_time(seg["source_start"], clip.duration, song_length)
+                loop = stem_needs_loop(clip.duration, song_length)
+            else:
+                path, offset = next(free_sources)
+                clip = open_clip(path)
+                t0 = offset + seg["source_start"]
+                loop = False
+            cuts.append((f0, f1, clip, t0, loop))
+
+    # every segment is a seek into its source
+    count("seeks", len(cuts))
+    count("frames_encoded", frame_count(song_length, fps))
+
+    W, H = canvas_size([{"width": c.w, "height": c.h} for c in clips.values()])
+    starts = [cut[0] for cut in cuts]
+
+    def make_frame(t):
+        # output frame k shows the source frame the ffmpeg backends put there:
+        # the first one at or after the seek, then one per output frame (nearest
+        # when the rates differ), wrapping when the stem loops and holding the
+        # last when a free clip runs short. Sources are read at exact frame
+        # times, where moviepy's reader gives the same frame whether it seeks
+        # or reads on; past the last cut the frame is black
+        k = int(round(t * float(fps)))
+        canvas = np.zeros((H, W, 3), dtype=np.uint8)
+        n = bisect_right(starts, k) - 1
+        if n < 0 or k >= cuts[n][1]:
+            return canvas
+
+        f0, _, clip, t0, loop = cuts[n]
+        rate = clip.fps
+        frames = frame_count(clip.duration, rate)
+        j = frame_index(t0, rate) + int((k - f0) * rate / float(fps) + 0.5)
+        j = j % frames if loop else min(j, frames - 1)
+
+        frame = clip.get_frame(j / rate)
+        h, w = frame.shape[:2]
+        y, x = (H - h) // 2, (W - w) // 2
+        canvas[y:y + h, x:x + w] = frame[:, :, :3]
+        return canvas
+
+    final = VideoClip(make_frame, duration=song_length)
+
+    # moviepy only writes the picture, the final mix is muxed in afterwards
+    # without decoding it (stream copy when the container takes its codec)
+    with stage("encode"), tempfile.TemporaryDirectory(prefix="stemsync_moviepy_") as tmp:
+        video_path = os.path.join(tmp, "video.mp4")
+        final.write_videofile(
+            video_path,
+            fps=fps,
+            codec="libx264",
+            audio=False,
+            threads=threads or None,
+            # moviepy appends its own -pix_fmt yuv420p after these
+            ffmpeg_params=codec_args,
+            logger=moviepy_logger()
+        )
+        concat_and_mux([video_path], final_audio_path, song_length, output_path, tmp, audio_args)
+
+    return output_path
+
+def build_timeline(
+    audio_files,
+    video_files,
+    free_video_files,
+    final_audio,
+    snap_window,
+    chorus_aggression,
+    phrase_beats,
+    downbeat_bias,
+    cooldown,
+    free_clip_probability,
+    intro_min,
+    outro_min,
+    analysis_workers,
+    analysis_sr,
+    scene_mode,
+    scene_window,
+    energy_metric,
+    seed
+):
+    analysed = analyse_edit(
+        audio_files, video_files, free_video_files, final_audio,
+        snap_window, analysis_workers, analysis_sr, scene_mode
+    )
+    return cut_edit(
+        analysed, audio_files, video_files, free_video_files,
+        chorus_aggression, phrase_beats, downbeat_bias, cooldown, free_clip_probability,
+        intro_min, outro_min, scene_mode, scene_window, energy_metric, seed
+    )
+
+def analyse_edit(
+    audio_files, video_files, free_video_files, final_audio,
+    snap_window, analysis_workers, analysis_sr, scene_mode
+):
+    # everything a timeline needs that does not depend on the cutting sliders
+    # a missing stem video or an unreadable file fails here, in well under a second
+    with stage("preflight"):
+        check_edit(audio_files, video_files, free_video_files, final_audio)
+
+    # the videos are scanned for hard cuts while the audio is analysed
+    video_paths = [file_path(f) for f in video_files or []]
+    if scene_mode != "off":
+        prepare_scenes(video_paths)
+
+    # stems and the final mix are analysed side by side
+    with stage("analysis"):
+        stem_analysis, mix = analyze_all(
+            [file_path(f) for f in audio_files or []],
+            file_path(final_audio),
+            workers=int(analysis_workers),
+            sr=int(analysis_sr) or None
+        )
+    with stage("beat_snap"):
+        beat_times = detect_snapped_beats(mix, snap_window)
+
+    scenes = {}
+    if scene_mode != "off":
+        with stage("scenes"):
+            scenes = {base(p): (scene_cuts(p), probe_video(p)["duration"]) for p in video_paths}
+
+    return {
+        "stem_analysis": stem_analysis,
+        "beat_times": beat_times,
+        "sections": mix.sections,
+        "downbeats": mix.downbeats,
+        "song_len": mix.duration,
+        "scenes": scenes,
+    }
+
+def cut_edit(
+    analysed, audio_files, video_files, free_video_files,
+    chorus_aggression, phrase_beats, downbeat_bias, cooldown, free_clip_probability,
+    intro_min, outro_min, scene_mode, scene_window, energy_metric, seed
+):
+    beat_times = analysed["beat_times"]
+    sections = analysed["sections"]
+    song_len = analysed["song_len"]
+    intro_clip = find_optional_clip("intro.mp4")
+    outro_clip = find_optional_clip("outro.mp4")
+    INTRO_MIN = intro_min
+    OUTRO_MIN = outro_min
+
+
+
+
+    # a fresh cycler per timeline, it remembers which clip comes next
+    free_cycler = (
+        FreeClipCycler([file_path(f) for f in free_video_files])
+        if free_video_files else None
+    )
+
+    with stage("timeline"):
+        timeline, stems, video_map = generate_timeline(
+            audio_files,
+            video_files,
+            beat_times,
+            sections,
+            cooldown,
+            song_len,
+            chorus_aggression,
+            phrase_beats,
+            downbeat_bias,
+            free_cycler,
+            free_clip_probability,
+            analysed["stem_analysis"],
+            scenes=analysed["scenes"],
+            scene_mode=scene_mode,
+            scene_window=scene_window,
+            energy_metric=energy_metric,
+            downbeats=analysed["downbeats"],
+            seed=None if seed is None or seed < 0 else int(seed)
+        )
+
+    if intro_clip:
+        intro_end = next_beat_after(beat_times, INTRO_MIN)
+
+        # remove anything that would play during intro
+        timeline = [
+            e for e in timeline
+            if e["time"] >= intro_end
+        ]
+
+        # intro behaves exactly like b-roll, but fixed at start
+        timeline.append({
+            "time": 0.0,
+            "end": intro_end,
+            "type": "free",
+            "clip": intro_clip,
+            "transform": []
+        })
+
+    if outro_clip:
+        outro_start = next_beat_after(
+            beat_times,
+            song_len - OUTRO_MIN
+        )
+
+        timeline.append({
+            "time": outro_start,
+            "end": song_len,
+            "type": "free",
+            "clip": outro_clip,
+            "transform": []
+        })
+
+    # ✅ ensure intro/outro and beat cuts are in correct order
+    timeline = sorted(timeline, key=lambda e: e["time"])
+    return timeline, stems, video_map, song_len
+
+
+def render_edit(
+    audio_files,
+    video_files,
+    free_video_files,
+    final_audio,
+    snap_window,
+    chorus_aggression,
+    phrase_beats,
+    downbeat_bias,
+    cooldown,
+    free_clip_probability,
+    intro_min,
+    outro_min,
+    analysis_workers,
+    analysis_sr,
+    scene_mode,
+    scene_window,
+    energy_metric,
+    render_backend,
+    render_workers,
+    chunk_seconds,
+    incremental,
+    seed,
+    use_proxies,
+    stabilize,
+    encoding_profile,
+    output
+):
+    check_stabilize(stabilize)
+    settings = check_profile(encoding_profile, render_backend, use_proxies)
+
+    if not output:
+        output = get_default_output_path(settings["container"])
+    output = container_path(output, settings)
+
+    # per-stage timings land next to the edit summary as <name>.metrics.json
+    with collect() as metrics, profiled(output):
+        timeline, stems, video_map, song_len = build_timeline(
+            audio_files, video_files, free_video_files, final_audio,
+            snap_window, chorus_aggression, phrase_beats, downbeat_bias, cooldown,
+            free_clip_probability, intro_min, outro_min, analysis_workers, analysis_sr,
+            scene_mode, scene_window, energy_metric, seed
+        )
+        path = build_video(
+            timeline, stems, video_map, song_len, file_path(final_audio), output,
+            render_backend, render_workers, chunk_seconds, incremental, use_proxies, stabilize, encoding_profile
+        )
+        fps = output_fps(settings, [video_map[s] for s in stems])
+        with stage("exports"):
+            write_edit_files(timeline, video_map, song_len, file_path(final_audio), output, fps)
+    write_metrics(metrics, output)
+
+    return path
+
+
+def timeline_edit(
+    audio_files,
+    video_files,
+    free_video_files,
+    final_audio,
+    snap_window,
+    chorus_aggression,
+    phrase_beats,
+    downbeat_bias,
+    cooldown,
+    free_clip_probability,
+    intro_min,
+    outro_min,
+    analysis_workers,
+    analysis_sr,
+    scene_mode,
+    scene_window,
+    energy_metric,
+    seed,
+    encoding_profile,
+    output
+):
+    # dry run: cut list only, nothing is decoded or encoded once analysis is cached
+    settings = check_profile(encoding_profile)
+    if seed is None or seed < 0:
+        seed = int(np.random.randint(0, 2**31 - 1))
+
+    if not output:
+        output = get_default_output_path(settings["container"])
+
+    with collect() as metrics, profiled(output):
+        timeline, stems, video_map, song_len = build_timeline(
+            audio_files, video_files, free_video_files, final_audio,
+            snap_window, chorus_aggression, phrase_beats, downbeat_bias, cooldown,
+            free_clip_probability, intro_min, outro_min, analysis_workers, analysis_sr,
+            scene_mode, scene_window, energy_metric, seed
+        )
+        fps = output_fps(settings, [video_map[s] for s in stems])
+        with stage("exports"):
+            paths = write_edit_files(timeline, video_map, song_len, file_path(final_audio), output, fps)
+    paths.append(write_metrics(metrics, output))
+
+    return paths, len(timeline) - 1, seed
+
+
+PREVIEW_PATH = os.path.join(tempfile.gettempdir(), "stemsync_preview.mp4")
+
+def preview_edit(
+    audio_files,
+    video_files,
+    free_video_files,
+    final_audio,
+    snap_window,
+    chorus_aggression,
+    phrase_beats,
+    downbeat_bias,
+    cooldown,
+    free_clip_probability,
+    intro_min,
+    outro_min,
+    analysis_workers,
+    analysis_sr,
+    scene_mode,
+    scene_window,
+    energy_metric,
+    render_workers,
+    seed,
+    use_proxies,
+    stabilize,
+    encoding_profile,
+    output=PREVIEW_PATH
+):
+    check_stabilize(stabilize)
+    settings = check_profile(encoding_profile)
+    # a random edit is pinned to a seed, so rendering afterwards
+    # with that seed produces exactly the cuts that were previewed
+    if seed is None or seed < 0:
+        seed = int(np.random.randint(0, 2**31 - 1))
+
+    with collect() as metrics, profiled(output):
+        timeline, stems, video_map, song_len = build_timeline(
+            audio_files, video_files, free_video_files, final_audio,
+            snap_window, chorus_aggression, phrase_beats, downbeat_bias, cooldown,
+            free_clip_probability, intro_min, outro_min, analysis_workers, analysis_sr,
+            scene_mode, scene_window, energy_metric, seed
+        )
+        with stage("render"), removed_if_cancelled(output):
+            path = build_preview(
+                timeline, stems, video_map, song_len, file_path(final_audio), output,
+                workers=int(render_workers), use_proxies=use_proxies, stabilize=stabilize,
+                fps=output_fps(settings, [video_map[s] for s in stems]), max_height=settings["height"]
+            )
+    write_metrics(metrics, output)
+
+    return path, len(timeline) - 1, seed
+
+
+# ======================================================
+# PARAMETER SWEEP
+# one analysis, a grid of cutting settings: every distinct
+# timeline is rendered (or previewed) once, several side by
+# side from the same proxies and caches, and a table
+# compares cuts and screen time per stem
+# ======================================================
+SWEEP_MODES = ["timeline", "preview", "render"]
+SWEEP_MAX_VARIANTS = 64
+
+def parse_values(values, cast, default):
+    # "0.3, 0.5 0.8" or a list -> [0.3, 0.5, 0.8]; nothing -> [default]
+    if isinstance(values, str):
+        values = values.replace(",", " ").split()
+    try:
+        parsed = [cast(float(v)) for v in values or []]
+    except (TypeError, ValueError):
+        raise EditError(f"Cannot read sweep values: {values!r}")
+    return list(dict.fromkeys(parsed)) or [default]
+
+def timeline_key(timeline):
+    # settings that cut the same way render the same video
+    return json.dumps([
+        [round(e["time"], 4), round(e.get("end", e["time"]), 4),
+         e.get("type"), e.get("stem"), e.get("clip"), e.get("transform")]
+        for e in timeline
+    ])
+
+def screen_time(timeline, stems):
+    # seconds on screen per stem, free clips / intro / outro together as b-roll
+    seconds = dict.fromkeys(stems, 0.0)
+    seconds["b-roll"] = 0.0
+    for seg in plan_segments(timeline):
+        key = seg["stem"] if seg["type"] == "stem" else "b-roll"
+        seconds[key] = seconds.get(key, 0.0) + seg["duration"]
+    return seconds
+
+def describe_settings(settings):
+    return ", ".join(
+        f"chorus {s['chorus_aggression']:g} / phrase {s['phrase_beats']} / "
+        f"cooldown {s['cooldown']:g} / seed {s['seed']}"
+        for s in settings
+    )
+
+def sweep_edit(
+    audio_files,
+    video_files,
+    free_video_files,
+    final_audio,
+    snap_window,
+    chorus_aggression,
+    phrase_beats,
+    downbeat_bias,
+    cooldown,
+    free_clip_probability,
+    intro_min,
+    outro_min,
+    analysis_workers,
+    analysis_sr,
+    scene_mode,
+    scene_window,
+    energy_metric,
+    sweep_chorus,
+    sweep_phrase,
+    sweep_cooldown,
+    sweep_seeds,
+    sweep_mode,
+    sweep_jobs,
+    render_backend,
+    render_workers,
+    incremental,
+    seed,
+    use_proxies,
+    stabilize,
+    encoding_profile,
+    output
+):
+    if sweep_mode not in SWEEP_MODES:
+        raise EditError(f"Unknown sweep mode {sweep_mode!r}, expected one of {', '.join(SWEEP_MODES)}")
+    check_stabilize(stabilize)
+    settings = check_profile(encoding_profile, render_backend if sweep_mode == "render" else None, use_proxies)
+    if seed is None or seed < 0:
+        seed = int(np.random.randint(0, 2**31 - 1))
+
+    grid = list(itertools.product(
+        parse_values(sweep_chorus, float, chorus_aggression),
+        parse_values(sweep_phrase, int, int(phrase_beats)),
+        parse_values(sweep_cooldown, float, cooldown),
+        parse_values(sweep_seeds, int, int(seed)),
+    ))
+    if len(grid) > SWEEP_MAX_VARIANTS:
+        raise EditError(f"{len(grid)} combinations, a sweep is limited to {SWEEP_MAX_VARIANTS}")
+
+    if not output:
+        output = get_default_output_path(settings["container"] if sweep_mode == "render" else "mp4")
+    prefix = os.path.splitext(output)[0]
+    final_audio_path = file_path(final_audio)
+
+    with collect() as metrics, profiled(prefix + "_sweep"):
+        # decoding, analysis and beat snapping happen once for the whole grid
+        analysed = analyse_edit(
+            audio_files, video_files, free_video_files, final_audio,
+            snap_window, analysis_workers, analysis_sr, scene_mode
+        )
+
+        variants = {}
+        for chorus, phrase, cool, s in grid:
+            timeline, stems, video_map, song_len = cut_edit(
+                analysed, audio_files, video_files, free_video_files,
+                chorus, phrase, downbeat_bias, cool, free_clip_probability,
+                intro_min, outro_min, scene_mode, scene_window, energy_metric, s
+            )
+            variant_settings = {"chorus_aggression": chorus, "phrase_beats": phrase, "cooldown": cool, "seed": s}
+            variant = variants.setdefault(timeline_key(timeline), {"timeline": timeline, "settings": []})
+            variant["settings"].append(variant_settings)
+        variants = list(variants.values())
+        for k, variant in enumerate(variants, 1):
+            variant["output"] = f"{prefix}_v{k:02d}.mp4"
+            if sweep_mode == "render":
+                variant["output"] = container_path(variant["output"], settings)
+        fps = output_fps(settings, [video_map[s] for s in stems])
+        count("variants", len(variants))
+        count("duplicate_timelines", len(grid) - len(variants))
+
+        def render_variant(variant):
+            path = variant["output"]
+            if sweep_mode == "preview":
+                with stage("render"), removed_if_cancelled(path):
+                    build_preview(
+                        variant["timeline"], stems, video_map, song_len, final_audio_path, path,
+                        use_proxies=use_proxies, stabilize=stabilize, fps=fps, max_height=settings["height"]
+                    )
+            elif sweep_mode == "render":
+                build_video(
+                    variant["timeline"], stems, video_map, song_len, final_audio_path, path,
+                    render_backend, render_workers, incremental=incremental, use_proxies=use_proxies,
+                    stabilize=stabilize, profile=encoding_profile
+                )
+            with stage("exports"):
+                return write_edit_files(variant["timeline"], video_map, song_len, final_audio_path, path, fps)
+
+        with stage("sweep"):
+            sources = list(video_map.values()) + [file_path(f) for f in free_video_files or []]
+            if sweep_mode != "timeline":
+                # every variant cuts from the same sources, stabilize / transcode them once up front
+                prepare_stabilized(sources, stabilize)
+                if use_proxies:
+                    prepare_proxies(sources, fps, stabilize, settings["height"])
+
+            paths = []
+            with ThreadPoolExecutor(max_workers=max(1, int(sweep_jobs))) as pool:
+                # the variants can be cancelled, the progress bar counts finished variants;
+                # each is measured in its own thread and its stages added to the sweep's
+                for done, (variant, (files, stages, counts)) in enumerate(zip(
+                    variants, pool.map(in_job(lambda v: measured(render_variant, v), progress=False), variants)
+                ), 1):
+                    metrics.merge(stages, counts)
+                    variant["stages"] = stages
+                    if sweep_mode != "timeline":
+                        paths.append(variant["output"])
+                    paths += files
+                    advance(done, len(variants))
+
+    table = sweep_table(variants, stems, song_len)
+    paths += write_sweep_table(table, variants, prefix)
+    paths.append(write_metrics(metrics, prefix + "_sweep"))
+
+    return table, paths, len(grid), len(variants)
+
+def variant_seconds(variant, name):
+    # wall time of one of the variant's own top level stages
+    return round(variant.get("stages", {}).get(name, {}).get("wall_s", 0.0), 2)
+
+def sweep_table(variants, stems, song_len):
+    headers = ["variant", "settings", "cuts", "b-roll cuts", "avg shot (s)"]
+    headers += [f"{s} %" for s in stems] + ["b-roll %", "render (s)", "exports (s)"]
+
+    rows = []
+    for variant in variants:
+        timeline = variant["timeline"]
+        shots = len(plan_segments(timeline))
+        seconds = screen_time(timeline, stems)
+        rows.append([
+            os.path.basename(variant["output"]),
+            describe_settings(variant["settings"]),
+            len(timeline) - 1,
+            sum(e.get("type") == "free" for e in timeline),
+            round(song_len / max(1, shots), 2),
+        ] + [round(100 * seconds[s] / song_len, 1) for s in stems + ["b-roll"]] + [
+            variant_seconds(variant, "render"),
+            variant_seconds(variant, "exports"),
+        ])
+
+    return {"headers": headers, "data": rows}
+
+def write_sweep_table(table, variants, prefix):
+    csv_path = prefix + "_sweep.csv"
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(table["headers"])
+        writer.writerows(table["data"])
+
+    json_path = prefix + "_sweep.json"
+    with open(json_path, "w") as f:
+        json.dump({
+            "headers": table["headers"],
+            "rows": table["data"],
+            "variants": [
+                {
+                    "output": v["output"], "settings": v["settings"], "cuts": len(v["timeline"]) - 1,
+                    "stages": v.get("stages", {}),
+                }
+                for v in variants
+            ],
+        }, f, indent=2)
+
+    return [csv_path, json_path]
@@ -0,0 +1,193 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import cache_dir, cache_key, evict, touch
+from encoding import fitted_size
+from media import probe_video, run_ffmpeg
+from jobs import wait_for
+from metrics import log
+from segments import OUTPUT_FPS, SAFE_START
+from stabilize import prepare_stabilized, stabilize_video
+
+
+# ======================================================
+# MEZZANINE PROXIES
+# every source is transcoded once to a short-GOP, B-frame
+# free file at the output fps and size (sources taller than
+# the profile's height shrunk to it), so the renderer's seeks
+# land on a nearby keyframe instead of re-decoding a long
+# AI-video GOP from the start
+# ======================================================
+PROXY_GOP = 12  # half a second at 24 fps
+PROXY_PRESET = "veryfast"
+PROXY_CRF = 16
+PROXY_PIX_FMT = "yuv420p"
+PROXY_ARGS = [
+    "-c:v", "libx264", "-preset", PROXY_PRESET, "-crf", str(PROXY_CRF),
+    "-g", str(PROXY_GOP), "-keyint_min", str(PROXY_GOP), "-sc_threshold", "0", "-bf", "0",
+    "-pix_fmt", PROXY_PIX_FMT, "-an",
+]
+PROXY_WORKERS = max(1, min(4, (os.cpu_count() or 1) // 2))
+
+_pool = ThreadPoolExecutor(max_workers=PROXY_WORKERS, thread_name_prefix="proxy")
+_jobs = {}
+_lock = threading.Lock()
+
+
+def proxy_path(path, fps=OUTPUT_FPS, max_height=None):
+    key = cache_key(path, kind="mezzanine", fps=fps, height=max_height, args=" ".join(PROXY_ARGS))
+    return os.path.join(cache_dir("proxies"), key + ".mp4")
+
+
+def proxy_filter(path, fps=OUTPUT_FPS, max_height=None):
+    info = probe_video(path)
+    size = fitted_size(info["width"], info["height"], max_height)
+    if size == (info["width"], info["height"]):
+        return f"fps={fps}"
+    return f"fps={fps},scale={size[0]}:{size[1]}"
+
+
+def make_proxy(path, fps=OUTPUT_FPS, stabilize="off", max_height=None):
+    # the proxy of a stabilized source is the proxy of the stabilized file
+    path = stabilize_video(path, stabilize)
+    out = proxy_path(path, fps, max_height)
+    if os.path.exists(out):
+        touch(out)
+        return out
+
+    tmp = out[:-len(".mp4")] + f".{os.getpid()}.{threading.get_ident()}.tmp.mp4"
+    try:
+        run_ffmpeg(["-i", path, "-map", "0:v:0", "-vf", proxy_filter(path, fps, max_height)] + PROXY_ARGS + [tmp],
+                   what=f"proxy for {os.path.basename(path)}")
+        os.replace(tmp, out)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    evict("proxies")
+    return out
+
+
+def submit(key, fn, *args):
+    # one background job per output file, resubmitted if it failed or was evicted
+    with _lock:
+        job = _jobs.get(key)
+        stale = job is not None and job.done() and (
+            job.exception() is not None or not os.path.exists(job.result())
+        )
+        if job is None or stale:
+            job = _pool.submit(fn, *args)
+            _jobs[key] = job
+    return job
+
+
+def prepare_proxies(paths, fps=OUTPUT_FPS, stabilize="off", max_height=None):
+    # start building in the background, e.g. as soon as files are uploaded;
+    # every stabilization is queued before a proxy worker waits on one
+    prepare_stabilized(paths, stabilize)
+    return [
+        submit(("proxy", p, fps, stabilize, max_height), make_proxy, p, fps, stabilize, max_height)
+        for p in dict.fromkeys(paths)
+    ]
+
+
+def render_source(path, use_proxies=True, fps=OUTPUT_FPS, stabilize="off", max_height=None):
+    # what the renderer should actually open for a source video
+    if not use_proxies:
+        return stabilize_video(path, stabilize)
+
+    job = prepare_proxies([path], fps, stabilize, max_height)[0]
+    try:
+        return wait_for(job)
+    except RuntimeError as e:
+        # a source ffmpeg cannot transcode is still rendered from the original
+        log.warning(f"Proxy failed, using original: {e}")
+        return stabilize_video(path, stabilize)
+
+# ======================================================
+# FREE-CLIP VARIANTS
+# mirrored / reversed / ping-pong versions of each free
+# clip are rendered once, so the renderer only ever reads
+# them front to back instead of seeking backwards per frame
+# ======================================================
+def free_variant_name(duration, source_duration, transform):
+    loop = duration > source_duration
+    name = "pingpong" if loop else "forward"
+    if "mirror" in transform:
+        name += "+mirror"
+    # the ping-pong loop is a palindrome, reversed it is itself
+    if "reverse" in transform and not loop:
+        name += "+reverse"
+    return name
+
+
+def variant_filter(name):
+    filters = []
+    if name.startswith("pingpong"):
+        # same as build_video's forward (from SAFE_START) + reversed loop
+        filters += [
+            f"trim=start={SAFE_START}",
+            "setpts=PTS-STARTPTS",
+            "split[fw][bw];[bw]reverse[rv];[fw][rv]concat=n=2:v=1:a=0",
+        ]
+    if "+mirror" in name:
+        filters.append("hflip")
+    if "+reverse" in name:
+        filters.append("reverse")
+    return "[0:v]" + ",".join(filters or ["null"]) + "[out]"
+
+
+def variant_path(path, name, fps=OUTPUT_FPS):
+    key = cache_key(path, kind="free_variant", variant=name, fps=fps, args=" ".join(PROXY_ARGS))
+    return os.path.join(cache_dir("variants"), key + ".mp4")
+
+
+def make_variant(path, name, fps=OUTPUT_FPS):
+    out = variant_path(path, name, fps)
+    if os.path.exists(out):
+        touch(out)
+        return out
+
+    tmp = out[:-len(".mp4")] + f".{os.getpid()}.{threading.get_ident()}.tmp.mp4"
+    try:
+        run_ffmpeg(
+            ["-i", path, "-filter_complex", variant_filter(name), "-map", "[out]", "-r", str(fps)]
+            + PROXY_ARGS + [tmp],
+            what=f"{name} variant of {os.path.basename(path)}"
+        )
+        os.replace(tmp, out)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    evict("variants")
+    return out
+
+
+def free_clip_sources(segs, use_proxies=True, fps=OUTPUT_FPS, stabilize="off", max_height=None):
+    # (file, offset) to read each free/intro/outro segment from, front to back
+    pending = []
+    for seg in segs:
+        src = render_source(seg["clip"], use_proxies, fps, stabilize, max_height)
+        name = free_variant_name(seg["duration"], probe_video(src)["duration"], seg["transform"])
+        if name == "forward":
+            pending.append((seg, src, None))
+        else:
+            # queue every variant before waiting on the first one
+            pending.append((seg, src, submit(("variant", src, name, fps), make_variant, src, name, fps)))
+
+    sources = []
+    for seg, src, job in pending:
+        if job is None:
+            sources.append((src, 0.0))
+            continue
+
+        path = wait_for(job)
+        offset = 0.0
+        if "reverse" in seg["transform"]:
+            # clip[0:d] reversed == the last d seconds of the reversed clip
+            offset = max(probe_video(path)["duration"] - seg["duration"], 0.0)
+        sources.append((path, offset))
+
+    return sources
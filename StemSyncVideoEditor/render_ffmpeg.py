@@ -0,0 +1,413 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+
+from cache import cache_dir, evict, file_hash, touch
+from encoding import fitted_size, whole
+from jobs import advance, in_job
+from media import probe_video, run_ffmpeg
+from metrics import count, log, stage
+from proxies import free_clip_sources, prepare_proxies, render_source
+from stabilize import prepare_stabilized
+from segments import (
+    OUTPUT_FPS, SAFE_START, frame_count, plan_segments, segment_frames,
+    stem_needs_loop, stem_source_time
+)
+
+
+# ======================================================
+# FFMPEG BACKEND
+# the whole timeline becomes one filter graph, frames
+# never pass through Python
+# ======================================================
+READ_MARGIN = 1.0  # extra seconds demuxed past each segment end
+
+# identical for every chunk so the parts can be joined without re-encoding
+VIDEO_CODEC_ARGS = ["-c:v", "libx264", "-preset", "medium", "-pix_fmt", "yuv420p"]
+AUDIO_CODEC_ARGS = ["-c:a", "aac", "-b:a", "192k"]
+
+PREVIEW_HEIGHT = 360
+PREVIEW_CODEC_ARGS = ["-c:v", "libx264", "-preset", "ultrafast", "-crf", "28", "-pix_fmt", "yuv420p"]
+
+
+def even(n):
+    return n + (n % 2)
+
+
+def preview_fps(fps):
+    # preview: every other output frame, so each preview frame is exactly the
+    # frame the full render shows at that time and every cut lands the same
+    return whole(Fraction(fps) / 2)
+
+
+def segment_path(seg, video_map):
+    return video_map[seg["stem"]] if seg["type"] == "stem" else seg["clip"]
+
+
+def resolve_sources(plan, video_map, use_proxies=True, fps=OUTPUT_FPS, stabilize="off", max_height=None):
+    # (file, offset) per segment, stems are positioned by stem_source_time instead
+    # every source is stabilized side by side before the first one is waited on
+    prepare_stabilized([segment_path(seg, video_map) for seg in plan], stabilize)
+    free = iter(free_clip_sources(
+        [seg for seg in plan if seg["type"] != "stem"], use_proxies, fps, stabilize, max_height
+    ))
+    return [
+        (render_source(video_map[seg["stem"]], use_proxies, fps, stabilize, max_height), None)
+        if seg["type"] == "stem" else next(free)
+        for seg in plan
+    ]
+
+
+def segment_input(seg, path, offset, info, song_length, lead):
+    # input options + the filters that turn the input into the
+    # segment's frames starting at pts 0
+    duration = seg["duration"]
+
+    if seg["type"] == "stem":
+        D = info["duration"]
+        if D <= SAFE_START:
+            raise RuntimeError(f"Video too short to use: {path}")
+        loop = stem_needs_loop(D, song_length)
+        t0 = stem_source_time(seg["source_start"] + lead, D, song_length)
+        opts = (["-stream_loop", "-1"] if loop else []) + [
+            "-ss", f"{t0:.6f}", "-t", f"{duration + READ_MARGIN:.6f}", "-i", path
+        ]
+        return opts, [f"trim=duration={duration - lead:.6f}"]
+
+    # free clips come pre-mirrored / pre-reversed / pre-looped, read straight through
+    opts = ["-ss", f"{offset + lead:.6f}", "-t", f"{duration + READ_MARGIN:.6f}", "-i", path]
+    return opts, [f"trim=duration={duration - lead:.6f}"]
+
+
+def drawn_size(info, max_height=None):
+    # a source's size in the edit, after the profile's height (already so for proxies)
+    return fitted_size(info["width"], info["height"], max_height)
+
+
+def canvas_size(infos, scale=1.0, max_height=None):
+    # concatenate_videoclips(method="compose") centres every clip on a
+    # canvas as large as the largest clip
+    sizes = [drawn_size(i, max_height) for i in infos]
+    W = even(round(max([w for w, _ in sizes] or [2]) * scale))
+    H = even(round(max([h for _, h in sizes] or [2]) * scale))
+    return W, H
+
+
+def canvas_scale(infos, height=None, max_height=None):
+    # shrink the whole edit so the canvas is at most `height` pixels tall
+    H = max([drawn_size(i, max_height)[1] for i in infos] or [0])
+    return height / H if height and H > height else 1.0
+
+
+def compile_filter_graph(
+    plan, sources, infos, song_length, canvas, total, fps=OUTPUT_FPS, scale=1.0, pix_fmt="yuv420p",
+    max_height=None
+):
+    # total = number of frames the graph emits, black is added after the last segment
+    W, H = canvas
+    inputs = []
+    chains = []
+    labels = []
+
+    for k, (seg, (path, offset), info) in enumerate(zip(plan, sources, infos)):
+        f0, f1 = segment_frames(seg, fps)
+        frames = f1 - f0
+        if frames <= 0:
+            continue
+
+        # output frame f0 is sampled slightly after out_start, start the
+        # source at the same offset so frames line up with the global grid
+        lead = min(max(f0 / fps - seg["out_start"], 0.0), seg["duration"])
+
+        opts, filters = segment_input(seg, path, offset, info, song_length, lead)
+        n = len(inputs)
+        inputs.append(opts)
+
+        filters += [
+            "setpts=PTS-STARTPTS",
+            f"fps={fps}",
+            # hold the last frame if the source runs short, then cut to
+            # exactly the frames this segment owns on the output grid
+            "tpad=stop_mode=clone:stop=-1",
+            f"trim=end_frame={frames}",
+            "setpts=PTS-STARTPTS",
+        ]
+        w, h = drawn_size(info, max_height)
+        if scale != 1.0 or (w, h) != (info["width"], info["height"]):
+            filters.append(f"scale={even(round(w * scale))}:{even(round(h * scale))}")
+        filters += [
+            f"pad={W}:{H}:(ow-iw)/2:(oh-ih)/2:color=black",
+            "setsar=1",
+            # the encoder gets frames in the profile's own pixel format, not relabelled 4:2:0
+            f"format={pix_fmt}",
+        ]
+        chains.append(f"[{n}:v]" + ",".join(filters) + f"[v{k}]")
+        labels.append(f"[v{k}]")
+
+    if labels:
+        chains.append(
+            "".join(labels) + f"concat=n={len(labels)}:v=1:a=0,"
+            # anything past the last cut is black, like set_duration(audio.duration)
+            f"tpad=stop_mode=add:stop=-1:color=black,trim=end_frame={total}[vout]"
+        )
+    else:
+        chains.append(f"color=c=black:s={W}x{H}:r={fps},format={pix_fmt},trim=end_frame={total}[vout]")
+
+    return inputs, ";\n".join(chains)
+
+
+def encode(
+    inputs, graph, total, output_path, fps=OUTPUT_FPS, audio_path=None, song_length=None, threads=0,
+    codec_args=VIDEO_CODEC_ARGS, audio_args=AUDIO_CODEC_ARGS
+):
+    fd, graph_path = tempfile.mkstemp(suffix=".ffgraph")
+    with os.fdopen(fd, "w") as f:
+        f.write(graph)
+
+    try:
+        args = []
+        for opts in inputs:
+            args += opts
+        if audio_path:
+            args += ["-i", audio_path]
+        args += [
+            "-filter_complex_script", graph_path,
+            "-map", "[vout]",
+        ]
+        if audio_path:
+            args += ["-map", f"{len(inputs)}:a:0", "-t", f"{song_length:.6f}"]
+        args += [
+            "-frames:v", str(total),
+            "-r", str(fps),
+        ] + codec_args + ["-threads", str(threads)]
+        args += audio_args if audio_path else ["-an"]
+        run_ffmpeg(args + [output_path], what="ffmpeg render")
+    finally:
+        os.remove(graph_path)
+
+    return output_path
+
+
+# ======================================================
+# SEGMENT-PARALLEL RENDER
+# contiguous chunks on cut boundaries, encoded side by side
+# and joined with the concat demuxer (no re-encode)
+# ======================================================
+def split_chunks(plan, workers, chunk_seconds=0, fps=OUTPUT_FPS):
+    if not plan:
+        return [plan]
+
+    total = segment_frames(plan[-1], fps)[1]
+    if chunk_seconds and chunk_seconds > 0:
+        target = max(1, int(chunk_seconds * fps))
+    else:
+        target = max(1, -(-total // max(1, workers)))
+
+    chunks = [[]]
+    filled = 0
+    for seg in plan:
+        if filled >= target:
+            chunks.append([])
+            filled = 0
+        f0, f1 = segment_frames(seg, fps)
+        chunks[-1].append(seg)
+        filled += f1 - f0
+
+    return chunks
+
+
+def concat_list_line(path):
+    return "file '" + path.replace("'", "'\\''") + "'\n"
+
+
+def concat_and_mux(parts, final_audio_path, song_length, output_path, tmp, audio_args=AUDIO_CODEC_ARGS):
+    list_path = os.path.join(tmp, "parts.txt")
+    with open(list_path, "w") as f:
+        for p in parts:
+            f.write(concat_list_line(p))
+
+    run_ffmpeg([
+        "-f", "concat", "-safe", "0", "-i", list_path,
+        "-i", final_audio_path,
+        "-map", "0:v:0", "-map", "1:a:0",
+        "-c:v", "copy",
+        "-t", f"{song_length:.6f}",
+    ] + audio_args + [output_path], what="ffmpeg concat")
+    return output_path
+
+
+# ======================================================
+# INCREMENTAL RENDER
+# every segment is encoded on its own and cached by a
+# fingerprint of exactly what ffmpeg would be asked to do
+# ======================================================
+def segment_fingerprint(inputs, graph, fps, codec_args=VIDEO_CODEC_ARGS):
+    described = []
+    for opts in inputs:
+        opts = list(opts)
+        # the source is identified by content, not by its (temp upload) path
+        i = opts.index("-i")
+        opts[i + 1] = file_hash(opts[i + 1])
+        described.append(opts)
+
+    blob = json.dumps([described, graph, fps, codec_args])
+    return hashlib.sha1(blob.encode()).hexdigest()
+
+
+def render_incremental(
+    plan, sources, infos, canvas, total, song_length, final_audio_path, output_path, fps, workers,
+    scale=1.0, codec_args=VIDEO_CODEC_ARGS, audio_args=AUDIO_CODEC_ARGS, threads=0, pix_fmt="yuv420p",
+    max_height=None
+):
+    d = cache_dir("segments")
+    parts = []
+    jobs = []
+
+    pieces = []
+    for seg, source, info in zip(plan, sources, infos):
+        f0, f1 = segment_frames(seg, fps)
+        if f1 > f0:
+            pieces.append(([seg], [source], [info], f1 - f0))
+    tail = total - (segment_frames(plan[-1], fps)[1] if plan else 0)
+    if tail > 0:
+        pieces.append(([], [], [], tail))
+
+    for segs, seg_sources, seg_infos, frames in pieces:
+        inputs, graph = compile_filter_graph(
+            segs, seg_sources, seg_infos, song_length, canvas, frames, fps, scale, pix_fmt, max_height
+        )
+        path = os.path.join(d, segment_fingerprint(inputs, graph, fps, codec_args) + ".mp4")
+        parts.append(path)
+        if os.path.exists(path):
+            touch(path)
+        elif path not in [job[3] for job in jobs]:
+            jobs.append((inputs, graph, frames, path))
+
+    count("seeks", sum(len(job[0]) for job in jobs))
+    count("frames_encoded", sum(job[2] for job in jobs))
+    count("segments_reencoded", len(jobs))
+
+    def encode_part(job):
+        inputs, graph, frames, path = job
+        # renders of a sweep can encode the same segment side by side
+        tmp_path = path[:-len(".mp4")] + f".{os.getpid()}.{threading.get_ident()}.tmp.mp4"
+        encode(inputs, graph, frames, tmp_path, fps=fps, threads=threads, codec_args=codec_args)
+        os.replace(tmp_path, path)
+
+    threads = threads or max(1, (os.cpu_count() or 1) // max(1, workers))
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for done, _ in enumerate(pool.map(in_job(encode_part), jobs), 1):
+            advance(done, len(jobs))
+
+    with tempfile.TemporaryDirectory(prefix="stemsync_concat_") as tmp:
+        concat_and_mux(parts, final_audio_path, song_length, output_path, tmp, audio_args)
+
+    evict("segments")
+    log.info(f"Incremental render: re-encoded {len(jobs)} of {len(parts)} segments")
+    return output_path
+
+
+def build_video_ffmpeg(
+    timeline, stems, video_map, song_length, final_audio_path, output_path,
+    fps=OUTPUT_FPS, workers=1, chunk_seconds=0, incremental=False, use_proxies=True,
+    height=None, codec_args=VIDEO_CODEC_ARGS, stabilize="off", source_fps=None, audio_args=AUDIO_CODEC_ARGS,
+    threads=0, pix_fmt="yuv420p", max_height=None
+):
+    # source_fps: the full render's frame rate, when this is a preview
+    # max_height: the profile's height, `height` the preview's on top of it
+    source_fps = source_fps or fps
+    plan = plan_segments(timeline)
+    count("segments", len(plan))
+    with stage("sources"):
+        if use_proxies:
+            # build any missing proxies side by side before the first one is waited on
+            prepare_proxies([segment_path(seg, video_map) for seg in plan], source_fps, stabilize, max_height)
+        # proxies / variants stay at the full render's rate and size so a preview reuses its files
+        sources = resolve_sources(plan, video_map, use_proxies, source_fps, stabilize, max_height)
+        infos = [probe_video(path) for path, _ in sources]
+    scale = canvas_scale(infos, height, max_height)
+    canvas = canvas_size(infos, scale, max_height)
+    total = frame_count(song_length, fps)
+
+    with stage("encode"):
+        return encode_video(
+            plan, sources, infos, canvas, scale, total, song_length, final_audio_path, output_path,
+            fps, workers, chunk_seconds, incremental, codec_args, audio_args, threads, pix_fmt, max_height
+        )
+
+
+def encode_video(
+    plan, sources, infos, canvas, scale, total, song_length, final_audio_path, output_path,
+    fps, workers, chunk_seconds, incremental, codec_args, audio_args=AUDIO_CODEC_ARGS, threads=0,
+    pix_fmt="yuv420p", max_height=None
+):
+    if incremental:
+        return render_incremental(
+            plan, sources, infos, canvas, total, song_length, final_audio_path, output_path, fps, workers,
+            scale, codec_args, audio_args, threads, pix_fmt, max_height
+        )
+
+    count("frames_encoded", total)
+    chunks = split_chunks(plan, workers, chunk_seconds, fps)
+    if workers <= 1 or len(chunks) <= 1:
+        inputs, graph = compile_filter_graph(
+            plan, sources, infos, song_length, canvas, total, fps, scale, pix_fmt, max_height
+        )
+        count("seeks", len(inputs))
+        return encode(
+            inputs, graph, total, output_path, fps, final_audio_path, song_length, threads,
+            codec_args=codec_args, audio_args=audio_args
+        )
+
+    resolved = {id(seg): (source, info) for seg, source, info in zip(plan, sources, infos)}
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+
+    with tempfile.TemporaryDirectory(prefix="stemsync_chunks_") as tmp:
+        jobs = []
+        first = 0
+        for i, chunk in enumerate(chunks):
+            # the last chunk also carries the black tail up to the song end
+            last = total if i == len(chunks) - 1 else segment_frames(chunk[-1], fps)[1]
+            frames = last - first
+            first = last
+            if frames <= 0:
+                continue
+
+            inputs, graph = compile_filter_graph(
+                chunk,
+                [resolved[id(seg)][0] for seg in chunk],
+                [resolved[id(seg)][1] for seg in chunk],
+                song_length, canvas, frames, fps, scale, pix_fmt, max_height
+            )
+            jobs.append((inputs, graph, frames, os.path.join(tmp, f"chunk_{i:04d}.mp4")))
+            count("seeks", len(inputs))
+
+        # every chunk is its own ffmpeg process, threads only wait on them
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            parts = []
+            for part in pool.map(
+                in_job(lambda job: encode(*job, fps=fps, threads=threads, codec_args=codec_args)), jobs
+            ):
+                parts.append(part)
+                advance(len(parts), len(jobs))
+
+        concat_and_mux(parts, final_audio_path, song_length, output_path, tmp, audio_args)
+
+    return output_path
+
+
+def build_preview(
+    timeline, stems, video_map, song_length, final_audio_path, output_path, workers=1, use_proxies=True,
+    stabilize="off", fps=OUTPUT_FPS, max_height=None
+):
+    # same segment plan as the full render (at `fps`), just smaller, at half the frame rate
+    return build_video_ffmpeg(
+        timeline, stems, video_map, song_length, final_audio_path, output_path,
+        fps=preview_fps(fps), workers=workers, use_proxies=use_proxies,
+        height=PREVIEW_HEIGHT, codec_args=PREVIEW_CODEC_ARGS, stabilize=stabilize, source_fps=fps,
+        max_height=max_height
+    )
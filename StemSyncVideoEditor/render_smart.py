@@ -0,0 +1,257 @@
+import json
+import math
+import os
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from cache import cache_key, load_npz, save_npz
+from jobs import advance, in_job
+from media import FFPROBE_BIN, probe_video, run_ffmpeg
+from metrics import count, log, stage
+from proxies import PROXY_ARGS, PROXY_PIX_FMT, prepare_proxies
+from render_ffmpeg import (
+    AUDIO_CODEC_ARGS, VIDEO_CODEC_ARGS, build_video_ffmpeg, canvas_size, compile_filter_graph,
+    concat_list_line, encode, resolve_sources, segment_path
+)
+from segments import (
+    OUTPUT_FPS, SAFE_START, frame_count, frame_index, plan_segments, segment_frames, stem_source_time
+)
+
+
+# ======================================================
+# SMART RENDER BACKEND
+# proxies and variants are already H.264 at the output
+# fps, so whole GOPs in the middle of a cut are copied
+# into the output as they are. Only the frames between a
+# cut and the nearest keyframe are encoded, with the same
+# settings the proxies were made with, so the pieces join
+# without touching the rest
+# ======================================================
+EDGE_WORKERS = os.cpu_count() or 1
+MAX_RUN_SECONDS = 10  # longer encoded stretches are split on cuts to spread them over the workers
+
+
+def keyframe_index(path):
+    # (frame numbers of the keyframes, frame count), from ffprobe's packet list, cached per file
+    key = cache_key(path, kind="keyframes")
+    cached = load_npz("keyframes", key)
+    if cached is not None:
+        return cached["keyframes"], int(cached["frames"])
+
+    proc = subprocess.run(
+        [FFPROBE_BIN, "-v", "error", "-select_streams", "v:0", "-print_format", "json",
+         "-show_entries", "packet=pts_time,flags", path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffprobe failed on {path}: {proc.stderr.decode(errors='replace').strip()}")
+
+    packets = [
+        p for p in json.loads(proc.stdout or b"{}").get("packets", [])
+        if p.get("pts_time") not in (None, "N/A")
+    ]
+    pts = np.array([float(p["pts_time"]) for p in packets])
+    key_mask = np.array(["K" in p.get("flags", "") for p in packets], dtype=bool)
+    fps = probe_video(path)["fps"] or OUTPUT_FPS
+    # frame numbers count from the first frame, like -ss does
+    frames = np.round((pts - (pts.min() if len(pts) else 0.0)) * fps).astype(np.int64)
+    keyframes = np.unique(frames[key_mask])
+
+    save_npz("keyframes", key, keyframes=keyframes, frames=np.int64(len(pts)))
+    return keyframes, len(pts)
+
+
+def copyable(info, canvas, fps):
+    # only files encoded exactly like the edges can be spliced: same size, same fps, no padding
+    return (
+        info["codec"] == "h264" and info["pix_fmt"] == PROXY_PIX_FMT
+        and (info["width"], info["height"]) == tuple(canvas)
+        and abs(info["fps"] - fps) < 1e-3 and abs(info["avg_fps"] - fps) < 1e-3
+    )
+
+
+def first_source_frame(seg, source, info, song_length, lead, fps):
+    # the source frame render_ffmpeg's segment_input starts this segment on
+    path, offset = source
+    if seg["type"] == "stem":
+        t0 = stem_source_time(seg["source_start"] + lead, info["duration"], song_length)
+    else:
+        t0 = offset + lead
+    return frame_index(t0, fps)
+
+
+def copy_span(seg, source, info, index, song_length, fps):
+    # (output frame, source frame, frames) of the whole GOPs inside the segment, or None
+    f0, f1 = segment_frames(seg, fps)
+    keyframes, frames = index
+    lead = min(max(f0 / fps - seg["out_start"], 0.0), seg["duration"])
+    j0 = first_source_frame(seg, source, info, song_length, lead, fps)
+    j1 = j0 + f1 - f0
+    if seg["type"] == "stem" and info["duration"] <= SAFE_START:
+        return None
+    # a looped stem wrapping around, or a source running short, is left to the filter graph
+    if j1 > frames:
+        return None
+
+    # the copy starts on a keyframe and stops right before one (or at the end of the file)
+    ends = np.append(keyframes, frames)
+    a = keyframes[np.searchsorted(keyframes, j0)] if np.any(keyframes >= j0) else None
+    b = ends[np.searchsorted(ends, j1, side="right") - 1] if np.any(ends <= j1) else None
+    if a is None or b is None or b <= a:
+        return None
+    return f0 + int(a) - j0, int(a), int(b - a)
+
+
+def sub_segment(seg, source, g0, g1, fps):
+    # output frames [g0, g1) of a segment as a segment of their own, the source shifted with it
+    shift = g0 / fps - seg["out_start"]
+    path, offset = source
+    sub = dict(
+        seg, out_start=g0 / fps, out_end=g1 / fps, duration=(g1 - g0) / fps,
+        source_start=seg["source_start"] + shift
+    )
+    return sub, (path, None if offset is None else offset + shift)
+
+
+def plan_pieces(plan, sources, infos, indexes, song_length, canvas, total, fps):
+    # the output as alternating ("copy", path, first frame, frames) and ("encode", parts, frames)
+    pieces = []
+    run = []
+    run_frames = 0
+
+    def flush():
+        nonlocal run, run_frames
+        if run_frames > 0:
+            pieces.append(("encode", run, run_frames))
+        run, run_frames = [], 0
+
+    def add(seg, source, info, g0, g1):
+        nonlocal run_frames
+        if g1 <= g0:
+            return
+        if run_frames >= MAX_RUN_SECONDS * fps:
+            flush()
+        sub, sub_source = sub_segment(seg, source, g0, g1, fps)
+        run.append((sub, sub_source, info))
+        run_frames += g1 - g0
+
+    for seg, source, info, index in zip(plan, sources, infos, indexes):
+        f0, f1 = segment_frames(seg, fps)
+        if f1 <= f0:
+            continue
+        span = copy_span(seg, source, info, index, song_length, fps) if index is not None else None
+        if span is None:
+            add(seg, source, info, f0, f1)
+            continue
+
+        g, j, n = span
+        add(seg, source, info, f0, g)
+        flush()
+        pieces.append(("copy", source[0], j, n))
+        add(seg, source, info, g + n, f1)
+
+    # black after the last cut rides along with the last encoded run
+    tail = total - (segment_frames(plan[-1], fps)[1] if plan else 0)
+    if tail > 0:
+        run_frames += tail
+    flush()
+    return pieces
+
+
+def join_pieces(parts, final_audio_path, song_length, output_path, fps, tmp, audio_args=AUDIO_CODEC_ARGS):
+    # the concat demuxer cuts the copied GOPs out of the proxies, setts puts every
+    # frame back on the output grid after the microsecond rounding of in/out points
+    list_path = os.path.join(tmp, "pieces.txt")
+    with open(list_path, "w") as f:
+        for part in parts:
+            if isinstance(part, str):
+                f.write(concat_list_line(part))
+                continue
+            path, j, n = part
+            f.write(concat_list_line(path))
+            f.write(f"inpoint {math.ceil(j / fps * 1e6) / 1e6:.6f}\n")
+            f.write(f"outpoint {math.floor((j + n) / fps * 1e6) / 1e6:.6f}\n")
+
+    run_ffmpeg([
+        "-f", "concat", "-safe", "0", "-i", list_path,
+        "-i", final_audio_path,
+        "-map", "0:v:0", "-map", "1:a:0",
+        "-c:v", "copy", "-bsf:v", f"setts=ts=N/({fps}*TB)",
+        "-r", str(fps),
+        "-t", f"{song_length:.6f}",
+    ] + audio_args + [output_path], what="ffmpeg smart join")
+    return output_path
+
+
+def build_video_smart(
+    timeline, stems, video_map, song_length, final_audio_path, output_path,
+    fps=OUTPUT_FPS, use_proxies=True, stabilize="off", codec_args=VIDEO_CODEC_ARGS, audio_args=AUDIO_CODEC_ARGS,
+    threads=0, pix_fmt="yuv420p", max_height=None
+):
+    # codec_args / threads / pix_fmt only apply without proxies: the copied GOPs
+    # and the edges in between are always encoded like the proxies
+    # (pipeline.check_profile turns away pixel formats the proxies do not have)
+    if not use_proxies:
+        # only proxies / variants are encoded like the edges, originals are rendered in full
+        log.info("Smart render needs proxies, rendering with the ffmpeg backend")
+        return build_video_ffmpeg(
+            timeline, stems, video_map, song_length, final_audio_path, output_path,
+            fps=fps, workers=EDGE_WORKERS, use_proxies=False, stabilize=stabilize,
+            codec_args=codec_args, audio_args=audio_args, threads=threads, pix_fmt=pix_fmt, max_height=max_height
+        )
+
+    plan = plan_segments(timeline)
+    count("segments", len(plan))
+    with stage("sources"):
+        prepare_proxies([segment_path(seg, video_map) for seg in plan], fps, stabilize, max_height)
+        sources = resolve_sources(plan, video_map, True, fps, stabilize, max_height)
+        infos = [probe_video(path) for path, _ in sources]
+        canvas = canvas_size(infos, max_height=max_height)
+
+        with stage("keyframes"):
+            paths = list(dict.fromkeys(
+                path for (path, _), info in zip(sources, infos) if copyable(info, canvas, fps)
+            ))
+            with ThreadPoolExecutor(max_workers=EDGE_WORKERS) as pool:
+                found = dict(zip(paths, pool.map(in_job(keyframe_index), paths)))
+            indexes = [found.get(path) for path, _ in sources]
+
+    total = frame_count(song_length, fps)
+    pieces = plan_pieces(plan, sources, infos, indexes, song_length, canvas, total, fps)
+    jobs = [piece for piece in pieces if piece[0] == "encode"]
+    count("frames_copied", sum(piece[3] for piece in pieces if piece[0] == "copy"))
+    count("frames_encoded", sum(piece[2] for piece in jobs))
+    count("segments_reencoded", len(jobs))
+
+    with stage("encode"), tempfile.TemporaryDirectory(prefix="stemsync_smart_") as tmp:
+        encodes = []
+        for k, (_, parts, frames) in enumerate(jobs):
+            inputs, graph = compile_filter_graph(
+                [p[0] for p in parts], [p[1] for p in parts], [p[2] for p in parts],
+                song_length, canvas, frames, fps, max_height=max_height
+            )
+            encodes.append((inputs, graph, frames, os.path.join(tmp, f"edge_{k:05d}.mp4")))
+            count("seeks", len(inputs))
+
+        # the proxies' own settings, so the encoded frames and the copied GOPs share one stream
+        def encode_piece(job):
+            return encode(*job, fps=fps, threads=1, codec_args=PROXY_ARGS)
+
+        encoded = []
+        with ThreadPoolExecutor(max_workers=EDGE_WORKERS) as pool:
+            for path in pool.map(in_job(encode_piece), encodes):
+                encoded.append(path)
+                advance(len(encoded), len(jobs) + 1)
+
+        encoded = iter(encoded)
+        parts = [next(encoded) if piece[0] == "encode" else piece[1:] for piece in pieces]
+        join_pieces(parts, final_audio_path, song_length, output_path, fps, tmp, audio_args)
+
+    log.info(
+        f"Smart render: {sum(1 for p in pieces if p[0] == 'copy')} GOP runs copied, "
+        f"{len(jobs)} edge pieces encoded"
+    )
+    return output_path
@@ -0,0 +1,209 @@
+import subprocess
+from collections import OrderedDict
+
+from jobs import advance, check_cancelled, track, untrack
+from encoding import black_frame, frame_bytes
+from media import FFMPEG_BIN, probe_video
+from metrics import count, stage
+from proxies import prepare_proxies
+from render_ffmpeg import (
+    AUDIO_CODEC_ARGS, VIDEO_CODEC_ARGS, canvas_size, drawn_size, resolve_sources, segment_path
+)
+from segments import (
+    OUTPUT_FPS, SAFE_START, frame_count, plan_segments, segment_frames,
+    stem_needs_loop, stem_source_time
+)
+
+
+# ======================================================
+# STREAMING BACKEND
+# the timeline is walked in order, source frames come from
+# a small LRU pool of ffmpeg readers and go straight into
+# one encoder pipe, so memory and open processes stay the
+# same no matter how long the song or how many cuts
+# ======================================================
+READER_POOL_SIZE = 4
+STREAM_SKIP_SECONDS = 1.0  # read through gaps up to this long instead of seeking
+
+
+class FrameReader:
+    # one source file decoded front to back as raw frames on the canvas, in the output pixel format
+    # size: what the source is scaled to first, when the profile's height shrinks it
+    def __init__(self, path, canvas, fps, pix_fmt="yuv420p", size=None):
+        self.path = path
+        self.canvas = canvas
+        self.size = size
+        self.fps = fps
+        self.pix_fmt = pix_fmt
+        W, H = canvas
+        self.frame_size = frame_bytes(pix_fmt, W, H)
+        self.proc = None
+        self.pos = None  # timeline position of the next frame
+        self.last = None
+
+    def open(self, seek, pos, loop=False):
+        self.close()
+        W, H = self.canvas
+        cmd = [FFMPEG_BIN, "-hide_banner", "-nostdin", "-loglevel", "error"]
+        cmd += (["-stream_loop", "-1"] if loop else []) + ["-ss", f"{seek:.6f}", "-i", self.path]
+        scale = f"scale={self.size[0]}:{self.size[1]}," if self.size else ""
+        cmd += [
+            "-map", "0:v:0", "-an",
+            "-vf",
+            f"fps={self.fps},{scale}pad={W}:{H}:(ow-iw)/2:(oh-ih)/2:color=black,setsar=1,format={self.pix_fmt}",
+            "-f", "rawvideo", "-pix_fmt", self.pix_fmt, "-",
+        ]
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        track(self.proc)
+        count("seeks")
+        self.pos = pos
+        self.last = None
+
+    def read(self):
+        frame = self.proc.stdout.read(self.frame_size) if self.proc else b""
+        if len(frame) == self.frame_size:
+            self.last = frame
+        # past the end of the source the last frame is held, like tpad=stop_mode=clone
+        self.pos += 1.0 / self.fps
+        return self.last
+
+    def frames(self, pos, count, seek, loop=False):
+        gap = round((pos - self.pos) * self.fps) if self.pos is not None else -1
+        on_grid = self.pos is not None and abs(pos - self.pos - gap / self.fps) < 1e-6
+        if not on_grid or gap < 0 or gap > STREAM_SKIP_SECONDS * self.fps:
+            self.open(seek, pos, loop)
+        else:
+            for _ in range(gap):
+                self.read()
+
+        for _ in range(count):
+            yield self.read()
+
+    def close(self):
+        if self.proc is not None:
+            self.proc.kill()
+            self.proc.stdout.close()
+            self.proc.wait()
+            untrack(self.proc)
+        self.proc = None
+        self.pos = None
+
+
+class ReaderPool:
+    def __init__(self, canvas, fps, size=READER_POOL_SIZE, pix_fmt="yuv420p", max_height=None):
+        self.canvas = canvas
+        self.fps = fps
+        self.size = size
+        self.pix_fmt = pix_fmt
+        self.max_height = max_height
+        self.readers = OrderedDict()
+
+    def get(self, path):
+        reader = self.readers.pop(path, None)
+        if reader is None:
+            info = probe_video(path)
+            size = drawn_size(info, self.max_height)
+            scaled = size if size != (info["width"], info["height"]) else None
+            reader = FrameReader(path, self.canvas, self.fps, self.pix_fmt, scaled)
+            if len(self.readers) >= self.size:
+                # least recently used reader goes, its ffmpeg process with it
+                _, old = self.readers.popitem(last=False)
+                old.close()
+        self.readers[path] = reader
+        return reader
+
+    def close(self):
+        for reader in self.readers.values():
+            reader.close()
+        self.readers.clear()
+
+
+def segment_reads(seg, path, offset, info, song_length, lead):
+    # (timeline position, file seek time, loop) of the segment's first frame,
+    # the same positions segment_input hands to the filter graph
+    if seg["type"] == "stem":
+        D = info["duration"]
+        if D <= SAFE_START:
+            raise RuntimeError(f"Video too short to use: {path}")
+        pos = seg["source_start"] + lead
+        return pos, stem_source_time(pos, D, song_length), stem_needs_loop(D, song_length)
+
+    return offset + lead, offset + lead, False
+
+
+def build_video_stream(
+    timeline, stems, video_map, song_length, final_audio_path, output_path,
+    fps=OUTPUT_FPS, use_proxies=True, stabilize="off", codec_args=VIDEO_CODEC_ARGS, audio_args=AUDIO_CODEC_ARGS,
+    threads=0, pix_fmt="yuv420p", max_height=None
+):
+    plan = plan_segments(timeline)
+    count("segments", len(plan))
+    with stage("sources"):
+        if use_proxies:
+            prepare_proxies([segment_path(seg, video_map) for seg in plan], fps, stabilize, max_height)
+        sources = resolve_sources(plan, video_map, use_proxies, fps, stabilize, max_height)
+        infos = [probe_video(path) for path, _ in sources]
+
+    with stage("encode"):
+        return encode_stream(
+            plan, sources, infos, song_length, final_audio_path, output_path, fps, codec_args, audio_args, threads,
+            pix_fmt, max_height
+        )
+
+
+def encode_stream(
+    plan, sources, infos, song_length, final_audio_path, output_path, fps=OUTPUT_FPS,
+    codec_args=VIDEO_CODEC_ARGS, audio_args=AUDIO_CODEC_ARGS, threads=0, pix_fmt="yuv420p", max_height=None
+):
+    W, H = canvas_size(infos, max_height=max_height)
+    total = frame_count(song_length, fps)
+    count("frames_encoded", total)
+    black = black_frame(pix_fmt, W, H)
+
+    encoder = subprocess.Popen(
+        [FFMPEG_BIN, "-hide_banner", "-nostdin", "-y", "-loglevel", "error",
+         "-f", "rawvideo", "-pix_fmt", pix_fmt, "-s", f"{W}x{H}", "-r", str(fps), "-i", "-",
+         "-i", final_audio_path,
+         "-map", "0:v:0", "-map", "1:a:0", "-t", f"{song_length:.6f}",
+         "-frames:v", str(total)]
+        + codec_args + ["-threads", str(threads)] + audio_args + [output_path],
+        stdin=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    track(encoder)
+
+    pool = ReaderPool((W, H), fps, pix_fmt=pix_fmt, max_height=max_height)
+    written = 0
+    try:
+        for seg, (path, offset), info in zip(plan, sources, infos):
+            f0, f1 = segment_frames(seg, fps)
+            if f1 <= f0:
+                continue
+
+            lead = min(max(f0 / fps - seg["out_start"], 0.0), seg["duration"])
+            pos, seek, loop = segment_reads(seg, path, offset, info, song_length, lead)
+
+            for frame in pool.get(path).frames(pos, f1 - f0, seek, loop):
+                check_cancelled()
+                encoder.stdin.write(frame or black)
+            written = f1
+            advance(written, total)
+
+        # anything past the last cut is black
+        for _ in range(written, total):
+            encoder.stdin.write(black)
+        encoder.stdin.close()
+    except BrokenPipeError:
+        # the encoder died, its error is reported below
+        pass
+    except BaseException:
+        encoder.kill()
+        raise
+    finally:
+        pool.close()
+        untrack(encoder)
+
+    err = encoder.stderr.read().decode(errors="replace").strip()
+    if encoder.wait() != 0:
+        raise RuntimeError("streaming render failed:\n" + "\n".join(err.splitlines()[-20:]))
+
+    return output_path
@@ -0,0 +1,91 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from cache import cache_key, load_npz, save_npz
+from jobs import wait_for
+from media import run_ffmpeg
+
+
+# ======================================================
+# SOURCE SCENE CUTS
+# hard cuts inside a source video (e.g. between generated
+# sets) found from a tiny grey-scale decode at a few fps,
+# cached per file, so the timeline can keep camera
+# switches away from them or use them to hide the jump
+# ======================================================
+SCENE_FPS = 6
+SCENE_SIZE = (64, 36)
+SCENE_THRESHOLD = 0.12  # mean absolute luma change, 0..1
+SCENE_CONTRAST = 3.0  # ... and this many times the change around it (ignores busy motion)
+SCENE_WINDOW = 1.0  # seconds of neighbouring frames the contrast is measured against
+SCENE_WORKERS = max(1, min(4, (os.cpu_count() or 1) // 2))
+
+_pool = ThreadPoolExecutor(max_workers=SCENE_WORKERS, thread_name_prefix="scenes")
+_jobs = {}
+_lock = threading.Lock()
+
+
+def frame_changes(frames):
+    # mean absolute difference between consecutive frames, frames is (n, pixels) uint8
+    if len(frames) < 2:
+        return np.zeros(0)
+    return np.abs(np.diff(frames.astype(np.int16), axis=0)).mean(axis=1) / 255.0
+
+
+def detect_scene_cuts(changes, fps=SCENE_FPS):
+    # times of the changes that stand out from their neighbourhood
+    if len(changes) == 0:
+        return np.zeros(0)
+
+    half = max(1, int(SCENE_WINDOW * fps))
+    padded = np.pad(changes, half, mode="edge")
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * half + 1)
+    local = np.median(windows, axis=1)
+
+    hits = np.flatnonzero((changes > SCENE_THRESHOLD) & (changes > SCENE_CONTRAST * local))
+    # change k is between sampled frames k and k + 1, the cut happened in between
+    return (hits + 0.5) / fps
+
+
+def scan_scenes(path):
+    key = cache_key(path, kind="scenes", fps=SCENE_FPS, size=SCENE_SIZE,
+                    threshold=SCENE_THRESHOLD, contrast=SCENE_CONTRAST, window=SCENE_WINDOW)
+    cached = load_npz("analysis", key)
+    if cached is not None:
+        return cached["cuts"]
+
+    W, H = SCENE_SIZE
+    proc = run_ffmpeg([
+        "-i", path, "-map", "0:v:0", "-an",
+        "-vf", f"fps={SCENE_FPS},scale={W}:{H}:flags=area,format=gray",
+        "-f", "rawvideo", "-pix_fmt", "gray", "-",
+    ], what=f"scene scan of {os.path.basename(path)}")
+
+    frames = np.frombuffer(proc.stdout, dtype=np.uint8)
+    frames = frames[:len(frames) // (W * H) * W * H].reshape(-1, W * H)
+    cuts = detect_scene_cuts(frame_changes(frames))
+
+    save_npz("analysis", key, cuts=cuts)
+    return cuts
+
+
+def prepare_scenes(paths):
+    # scan in the background, e.g. as soon as the videos are uploaded
+    jobs = []
+    for p in dict.fromkeys(paths):
+        st = os.stat(p)
+        key = (os.path.abspath(p), st.st_size, st.st_mtime_ns)
+        with _lock:
+            job = _jobs.get(key)
+            if job is None or (job.done() and job.exception() is not None):
+                job = _pool.submit(scan_scenes, p)
+                _jobs[key] = job
+        jobs.append(job)
+    return jobs
+
+
+def scene_cuts(path):
+    return wait_for(prepare_scenes([path])[0])
@@ -0,0 +1,115 @@
+import math
+
+
+SAFE_START = 0.05  # never allow frame-0 access
+OUTPUT_FPS = 24
+
+
+# ======================================================
+# SEGMENT PLAN
+# the timeline -> segment rules shared by every render
+# backend, so they all cut in exactly the same places
+# ======================================================
+def plan_segments(timeline):
+    plan = []
+    start = 0.0
+    out = 0.0
+
+    for e in timeline:
+        kind = e.get("type")
+        end = e.get("end", e["time"])
+
+        # allow intro/outro at same timestamp as start
+        if kind not in ("intro", "outro") and end <= start:
+            continue
+
+        # 🔒 critical clamp
+        clip_start = max(start, SAFE_START)
+        clip_end = max(end, clip_start + 0.001)
+        duration = clip_end - clip_start
+
+        if kind in ("intro", "outro"):
+            # intro/outro are standalone clips — do not clamp
+            seg = {
+                "type": kind,
+                "clip": e["clip"],
+                "source_start": 0.0,
+                "source_end": end - start,
+                "duration": end - start,
+                "transform": [],
+            }
+        elif kind == "free":
+            seg = {
+                "type": "free",
+                "clip": e["clip"],
+                "source_start": 0.0,
+                "source_end": duration,
+                "duration": duration,
+                "transform": list(e.get("transform", [])),
+            }
+        else:
+            # source times are on the normalized (trimmed / looped) stem clip
+            seg = {
+                "type": "stem",
+                "stem": e["stem"],
+                "source_start": clip_start,
+                "source_end": clip_end,
+                "duration": duration,
+                "transform": [],
+            }
+
+        seg["out_start"] = out
+        out += seg["duration"]
+        seg["out_end"] = out
+        plan.append(seg)
+
+        start = end
+
+    return plan
+
+
+def frame_index(t, fps=OUTPUT_FPS):
+    # first output frame sampled at or after t (frame k is sampled at k / fps)
+    return int(math.ceil(t * fps - 1e-6))
+
+
+def frame_count(duration, fps=OUTPUT_FPS):
+    return frame_index(duration, fps)
+
+
+def segment_frames(seg, fps=OUTPUT_FPS):
+    return frame_index(seg["out_start"], fps), frame_index(seg["out_end"], fps)
+
+
+def snap_to_frames(plan, fps=OUTPUT_FPS):
+    # every cut moved to the output frame the ffmpeg backends cut on (the first
+    # one sampled at or after it), sources shifted along, so each segment is a
+    # whole number of frames and none is repeated or lost where two meet;
+    # segments that own no frame are dropped
+    snapped = []
+    for seg in plan:
+        f0, f1 = segment_frames(seg, fps)
+        if f1 <= f0:
+            continue
+        lead = f0 / fps - seg["out_start"]
+        duration = (f1 - f0) / fps
+        snapped.append(dict(
+            seg,
+            out_start=f0 / fps,
+            out_end=f1 / fps,
+            duration=duration,
+            source_start=seg["source_start"] + lead,
+            source_end=seg["source_start"] + lead + duration,
+        ))
+    return snapped
+
+
+def stem_source_time(t, source_duration, song_len, safe_start=SAFE_START):
+    # where a stem source is read: trimmed from safe_start, looped when shorter than the song
+    if source_duration >= song_len + safe_start:
+        return safe_start + t
+    return (safe_start + t) % source_duration
+
+
+def stem_needs_loop(source_duration, song_len, safe_start=SAFE_START):
+    return source_duration < song_len + safe_start
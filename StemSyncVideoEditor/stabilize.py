@@ -0,0 +1,137 @@
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from cache import cache_dir, cache_key, evict, touch
+from jobs import wait_for
+from media import FFMPEG_BIN, run_ffmpeg
+from metrics import log
+
+
+# ======================================================
+# STABILIZATION
+# shaky handheld or AI footage is stabilized once per file,
+# in the background as soon as it is uploaded, and cached by
+# content hash: vidstab's two passes (find the camera path,
+# then smooth it) when this ffmpeg has it, deshake otherwise.
+# Proxies and renders read the stabilized file instead of
+# the original, timing is unchanged
+# ======================================================
+STABILIZE_MODES = ["off", "auto", "deshake", "vidstab"]
+VIDSTAB_SHAKINESS = 5
+VIDSTAB_ACCURACY = 15
+VIDSTAB_SMOOTHING = 15  # frames either side the camera path is averaged over
+STABILIZE_ARGS = [
+    "-c:v", "libx264", "-preset", "veryfast", "-crf", "16", "-pix_fmt", "yuv420p", "-an",
+]
+STABILIZE_WORKERS = max(1, min(4, (os.cpu_count() or 1) // 2))
+
+_pool = ThreadPoolExecutor(max_workers=STABILIZE_WORKERS, thread_name_prefix="stabilize")
+_jobs = {}
+_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def has_vidstab():
+    # vidstab is an optional ffmpeg build flag (--enable-libvidstab)
+    try:
+        proc = subprocess.run([FFMPEG_BIN, "-hide_banner", "-filters"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError:
+        return False
+    return b"vidstabdetect" in proc.stdout
+
+
+def stabilize_method(mode):
+    if mode not in STABILIZE_MODES:
+        raise ValueError(f"Unknown stabilization {mode!r}, expected one of {', '.join(STABILIZE_MODES)}")
+    if mode in ("auto", "vidstab"):
+        if has_vidstab():
+            return "vidstab"
+        if mode == "vidstab":
+            log.warning("This ffmpeg has no vidstab, stabilizing with deshake")
+        return "deshake"
+    return mode
+
+
+def filter_path(path):
+    # a file name as a filter option: escaped once for the option, once for the graph
+    path = path.replace("\\", "/")
+    for c in ":,;[]'":
+        path = path.replace(c, "\\\\" + c)
+    return path
+
+
+def stabilized_path(path, method):
+    if method == "vidstab":
+        params = dict(shakiness=VIDSTAB_SHAKINESS, accuracy=VIDSTAB_ACCURACY, smoothing=VIDSTAB_SMOOTHING)
+    else:
+        params = {}
+    key = cache_key(path, kind="stabilized", method=method, args=" ".join(STABILIZE_ARGS), **params)
+    return os.path.join(cache_dir("stabilized"), key + ".mp4")
+
+
+def make_stabilized(path, method):
+    out = stabilized_path(path, method)
+    if os.path.exists(out):
+        touch(out)
+        return out
+
+    tmp = out[:-len(".mp4")] + f".{os.getpid()}.{threading.get_ident()}.tmp.mp4"
+    transforms = tmp[:-len(".mp4")] + ".trf"
+    name = os.path.basename(path)
+    try:
+        if method == "vidstab":
+            run_ffmpeg([
+                "-i", path, "-map", "0:v:0",
+                "-vf", f"vidstabdetect=shakiness={VIDSTAB_SHAKINESS}:accuracy={VIDSTAB_ACCURACY}"
+                       f":result={filter_path(transforms)}",
+                "-f", "null", "-",
+            ], what=f"motion analysis of {name}")
+            vf = f"vidstabtransform=input={filter_path(transforms)}:smoothing={VIDSTAB_SMOOTHING}:optzoom=1"
+        else:
+            vf = "deshake"
+        run_ffmpeg(["-i", path, "-map", "0:v:0", "-vf", vf] + STABILIZE_ARGS + [tmp],
+                   what=f"stabilizing {name}")
+        os.replace(tmp, out)
+    finally:
+        for p in (tmp, transforms):
+            if os.path.exists(p):
+                os.remove(p)
+
+    evict("stabilized")
+    return out
+
+
+def prepare_stabilized(paths, mode="off"):
+    # stabilize in the background, e.g. as soon as the videos are uploaded
+    if mode == "off":
+        return []
+    method = stabilize_method(mode)
+    jobs = []
+    for p in dict.fromkeys(paths):
+        st = os.stat(p)
+        key = (os.path.abspath(p), st.st_size, st.st_mtime_ns, method)
+        with _lock:
+            job = _jobs.get(key)
+            stale = job is not None and job.done() and (
+                job.exception() is not None or not os.path.exists(job.result())
+            )
+            if job is None or stale:
+                job = _pool.submit(make_stabilized, p, method)
+                _jobs[key] = job
+        jobs.append(job)
+    return jobs
+
+
+def stabilize_video(path, mode="off"):
+    # the file to read instead of `path`, waits for its stabilization
+    if mode == "off":
+        return path
+    try:
+        return wait_for(prepare_stabilized([path], mode)[0])
+    except RuntimeError as e:
+        # a source ffmpeg cannot stabilize is still rendered as it is
+        log.warning(f"Stabilization failed, using original: {e}")
+        return path
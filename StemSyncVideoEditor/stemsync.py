@@ -0,0 +1,281 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+from jobs import RenderQueue, wait_job
+from metrics import setup_logging
+
+# ======================================================
+# HEADLESS CLI
+#   python -m stemsync render project.json
+#   python -m stemsync preview project.json
+#   python -m stemsync timeline project.json
+#   python -m stemsync check project.json
+#   python -m stemsync sweep project.json
+#   python -m stemsync batch manifest.json --jobs 2
+# Gradio is never imported, librosa / moviepy only when a
+# song actually needs them
+# ======================================================
+
+# same defaults as the sliders in app.py
+PROJECT_DEFAULTS = {
+    "snap_window": 0.08,
+    "chorus_aggression": 0.5,
+    "phrase_beats": 4,
+    "downbeat_bias": 0,
+    "cooldown": 3.0,
+    "free_clip_probability": 0.2,
+    "intro_min": 3.0,
+    "outro_min": 3.0,
+    "analysis_workers": os.cpu_count() or 1,
+    "analysis_sr": 0,
+    "scene_mode": "off",
+    "scene_window": 0.5,
+    "energy_metric": "rms",
+    "render_backend": "moviepy",
+    "render_workers": 1,
+    "chunk_seconds": 0,
+    "incremental": False,
+    "seed": -1,
+    "use_proxies": True,
+    "stabilize": "off",
+    # a profile name, or {"base": "high quality", "fps": 25, "crf": 20, ...}
+    "encoding_profile": "standard",
+    "output": "",
+    # sweep: lists of values, empty = the single setting above
+    "sweep_chorus_aggression": [],
+    "sweep_phrase_beats": [],
+    "sweep_cooldown": [],
+    "sweep_seeds": [],
+    "sweep_mode": "preview",
+    "sweep_jobs": 2,
+}
+
+# file lists / files, relative paths are relative to the project file
+PROJECT_FILES = {
+    "stems": [],
+    "videos": [],
+    "free_clips": [],
+    "final_audio": None,
+}
+
+
+def load_project(project, root=None, overrides=None):
+    if isinstance(project, str):
+        root = os.path.dirname(os.path.abspath(project))
+        with open(project) as f:
+            project = json.load(f)
+    root = root or os.getcwd()
+
+    unknown = set(project) - set(PROJECT_DEFAULTS) - set(PROJECT_FILES)
+    if unknown:
+        raise ValueError(f"Unknown project keys: {', '.join(sorted(unknown))}")
+
+    settings = dict(PROJECT_DEFAULTS)
+    settings.update(PROJECT_FILES)
+    settings.update(project)
+    settings.update(overrides or {})
+
+    def resolve(p):
+        return os.path.normpath(os.path.join(root, p)) if p else p
+
+    for key in ("stems", "videos", "free_clips"):
+        settings[key] = [resolve(p) for p in settings[key] or []]
+    settings["final_audio"] = resolve(settings["final_audio"])
+    settings["output"] = resolve(settings["output"])
+    return settings
+
+
+def edit_inputs(s):
+    # positional inputs shared by pipeline.render_edit and preview_edit
+    return [
+        s["stems"], s["videos"], s["free_clips"], s["final_audio"],
+        s["snap_window"], s["chorus_aggression"], s["phrase_beats"], s["downbeat_bias"],
+        s["cooldown"], s["free_clip_probability"], s["intro_min"], s["outro_min"],
+        s["analysis_workers"], s["analysis_sr"], s["scene_mode"], s["scene_window"],
+        s["energy_metric"],
+    ]
+
+
+def sweep_project(s):
+    from pipeline import sweep_edit
+
+    table, paths, combinations, variants = sweep_edit(
+        *edit_inputs(s),
+        s["sweep_chorus_aggression"], s["sweep_phrase_beats"], s["sweep_cooldown"], s["sweep_seeds"],
+        s["sweep_mode"], s["sweep_jobs"],
+        s["render_backend"], s["render_workers"], s["incremental"], s["seed"], s["use_proxies"], s["stabilize"],
+        s["encoding_profile"], s["output"]
+    )
+    print(f"{combinations} combinations, {variants} distinct timelines")
+    print("\t".join(table["headers"]))
+    for row in table["data"]:
+        print("\t".join(str(v) for v in row))
+    return next(p for p in paths if p.endswith("_sweep.csv"))
+
+
+def check_project(s):
+    from pipeline import EditError, check_edit
+
+    # every problem at once, one per line; warnings are logged
+    try:
+        warnings = check_edit(s["stems"], s["videos"], s["free_clips"], s["final_audio"])
+    except EditError as e:
+        print(e)
+        raise SystemExit(1)
+    return f"{len(warnings)} warning(s)"
+
+
+def render_project(s):
+    from pipeline import render_edit
+
+    return render_edit(
+        *edit_inputs(s),
+        s["render_backend"], s["render_workers"], s["chunk_seconds"], s["incremental"],
+        s["seed"], s["use_proxies"], s["stabilize"], s["encoding_profile"], s["output"]
+    )
+
+
+def preview_project(s):
+    from pipeline import preview_edit
+
+    output = s["output"] or os.path.splitext(s["final_audio"])[0] + "_preview.mp4"
+    path, cuts, seed = preview_edit(
+        *edit_inputs(s), s["render_workers"], s["seed"], s["use_proxies"], s["stabilize"], s["encoding_profile"],
+        output
+    )
+    print(f"{cuts} cuts, seed {seed}")
+    return path
+
+
+def timeline_project(s):
+    from pipeline import timeline_edit
+
+    paths, cuts, seed = timeline_edit(*edit_inputs(s), s["seed"], s["encoding_profile"], s["output"])
+    print(f"{cuts} cuts, seed {seed}")
+    return paths[0]
+
+
+# ======================================================
+# BATCH
+# songs run side by side and share one analysis process
+# pool and one proxy pool, so workers are started once
+# ======================================================
+def load_manifest(path, overrides=None):
+    root = os.path.dirname(os.path.abspath(path))
+    with open(path) as f:
+        manifest = json.load(f)
+
+    # either a list of projects or {"defaults": {...}, "projects": [...]}
+    if isinstance(manifest, list):
+        manifest = {"projects": manifest}
+    defaults = manifest.get("defaults", {})
+
+    projects = []
+    for entry in manifest.get("projects", []):
+        if isinstance(entry, str):
+            entry = os.path.join(root, entry)
+            with open(entry) as f:
+                project, project_root = json.load(f), os.path.dirname(os.path.abspath(entry))
+        else:
+            project, project_root = entry, root
+        projects.append(load_project(dict(defaults, **project), project_root, overrides))
+
+    return projects
+
+
+def render_batch(projects, jobs=1, preview=False):
+    run = preview_project if preview else render_project
+
+    # songs finishing together must not both pick the next free render_NNN.mp4
+    for s in projects:
+        if not s["output"] and not preview and s["final_audio"]:
+            s["output"] = os.path.splitext(s["final_audio"])[0] + "_edit.mp4"
+
+    def one(s):
+        t0 = time.perf_counter()
+        try:
+            path = run(s)
+        except Exception as e:
+            print(f"FAILED {s['final_audio']}: {e}")
+            return None
+        print(f"Render complete: {path} ({time.perf_counter() - t0:.1f}s)")
+        return path
+
+    # the same job queue the UI uses, so Ctrl-C also stops running ffmpeg processes
+    queue = RenderQueue(workers=jobs)
+    pending = [queue.submit(one, s, label=s["final_audio"] or "Render") for s in projects]
+    try:
+        return [wait_job(job) for job in pending]
+    except KeyboardInterrupt:
+        queue.cancel_all()
+        raise
+
+
+def parse_overrides(pairs):
+    overrides = {}
+    for pair in pairs or []:
+        key, _, value = pair.partition("=")
+        try:
+            overrides[key] = json.loads(value)
+        except ValueError:
+            overrides[key] = value
+    return overrides
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m stemsync", description="Stem-Sync Video Editor without the UI")
+    parser.add_argument("--log-level", default="INFO", help="DEBUG also logs every stage as it finishes")
+    parser.add_argument("--log-json", action="store_true", help="one JSON object per log line")
+    parser.add_argument("--profile", choices=["cprofile", "pyinstrument"],
+                        help="profile each run, written next to its output")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    commands = {
+        "render": (render_project, "render one project"),
+        "preview": (preview_project, "360p / 12 fps preview of one project"),
+        "timeline": (timeline_project, "edit summary, EDL and OTIO only, no video"),
+        "sweep": (sweep_project, "one analysis, every combination of the sweep_* settings"),
+        "check": (check_project, "probe every file and report all problems, nothing is analysed"),
+    }
+    for name, (_, help_text) in commands.items():
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("project", help="project .json")
+        p.add_argument("-o", "--output", help="output .mp4 (overrides the project)")
+        p.add_argument("--set", action="append", metavar="KEY=VALUE", help="override a project setting")
+
+    p = sub.add_parser("batch", help="render every project of a manifest")
+    p.add_argument("manifest", help="manifest .json")
+    p.add_argument("-j", "--jobs", type=int, default=2, help="songs rendered at the same time")
+    p.add_argument("--preview", action="store_true", help="previews instead of full renders")
+    p.add_argument("--set", action="append", metavar="KEY=VALUE", help="override a setting of every project")
+
+    args = parser.parse_args(argv)
+    overrides = parse_overrides(args.set)
+
+    setup_logging(args.log_level, args.log_json)
+    if args.profile:
+        os.environ["STEMSYNC_PROFILE"] = args.profile
+
+    if args.command == "batch":
+        projects = load_manifest(args.manifest, overrides)
+        # one pool size for every song, otherwise the shared pool is rebuilt per song
+        workers = overrides.get("analysis_workers", PROJECT_DEFAULTS["analysis_workers"])
+        for s in projects:
+            s["analysis_workers"] = workers
+        results = render_batch(projects, args.jobs, args.preview)
+        return 0 if all(results) else 1
+
+    if args.output:
+        overrides["output"] = args.output
+    s = load_project(args.project, overrides=overrides)
+    t0 = time.perf_counter()
+    path = commands[args.command][0](s)
+    print(f"{args.command.capitalize()} complete: {path} ({time.perf_counter() - t0:.2f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
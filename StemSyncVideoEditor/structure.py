@@ -0,0 +1,173 @@
+import numpy as np
+
+
+# ======================================================
+# SONG STRUCTURE
+# bars and sections of the final mix from beat-synchronous
+# chroma (harmony) and MFCC (timbre). Only a band of the
+# beat self-similarity matrix around its diagonal is ever
+# built, so the work grows linearly with song length
+# ======================================================
+# anything that changes these must change the mix cache key too (analysis.mix_key)
+BEATS_PER_BAR = 4
+BAR_RESTART_PENALTY = 3.0  # evidence a bar needs to start early (a 2/4 bar, a beat-tracker slip)
+NOVELTY_BARS = 4  # checkerboard kernel: this many bars either side of a boundary
+MIN_SECTION_BARS = 4
+NOVELTY_THRESHOLD = 0.5  # boundaries are novelty peaks above mean + this many std
+CHORUS_SIMILARITY = 0.8  # cosine of the mean beat vectors of two sections that are the same part
+N_MFCC = 13
+
+
+def beat_sync(features, beat_frames):
+    # mean of the frames from each beat to the next (the last beat to the end)
+    bounds = np.clip(np.asarray(beat_frames, dtype=int), 0, len(features) - 1)
+    sums = np.add.reduceat(features, bounds, axis=0)
+    counts = np.diff(np.append(bounds, len(features)))
+    return sums / np.maximum(counts, 1)[:, None]
+
+
+def unit_rows(X):
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    return X / np.maximum(norms, 1e-10)
+
+
+def beat_vectors(chroma, mfcc):
+    # one unit vector per beat: chroma shape plus standardised timbre
+    # (MFCC 0 is loudness, the rms already says that), equal weight each
+    c = unit_rows(chroma)
+    m = mfcc[:, 1:]
+    m = (m - m.mean(axis=0)) / np.maximum(m.std(axis=0), 1e-10)
+    m = m / np.sqrt(m.shape[1])
+    return unit_rows(np.hstack([c, m]))
+
+
+def banded_similarity(X, width):
+    # band[i, d] = similarity of beats i and i + d, for d < width (0 past the end)
+    n = len(X)
+    band = np.zeros((n, width))
+    for d in range(min(width, n)):
+        band[:n - d, d] = np.einsum("ij,ij->i", X[:n - d], X[d:])
+    return band
+
+
+def checkerboard_novelty(band, half):
+    # Foote novelty read off the band: similarity within the `half` beats
+    # before and within the `half` after, minus across, Gaussian tapered
+    n = len(band)
+    offsets = np.arange(-half, half)
+    taper = np.exp(-0.5 * ((offsets + 0.5) / (0.5 * half)) ** 2)
+    side = np.where(offsets >= 0, 1.0, -1.0)
+    rows = np.arange(n)
+
+    novelty = np.zeros(n)
+    for i, a in enumerate(offsets):
+        for j in range(i, len(offsets)):
+            # (a, b) and (b, a) are the same similarity
+            w = taper[i] * taper[j] * side[i] * side[j] * (1.0 if i == j else 2.0)
+            start = rows + a
+            ok = (start >= 0) & (start + (j - i) < n)
+            novelty[ok] += w * band[start[ok], j - i]
+    return novelty
+
+
+def bar_positions(evidence):
+    # position in the bar of every beat (0 = downbeat), Viterbi over the
+    # positions: a bar runs BEATS_PER_BAR beats and only restarts early
+    # where the downbeat evidence pays for BAR_RESTART_PENALTY
+    n, P = len(evidence), BEATS_PER_BAR
+    score = np.zeros(P)
+    score[0] = evidence[0] if n else 0.0
+    back = np.zeros((n, P), dtype=int)
+    for i in range(1, n):
+        new = np.empty(P)
+        new[1:] = score[:-1]
+        back[i, 1:] = np.arange(P - 1)
+        restart = score - BAR_RESTART_PENALTY
+        restart[P - 1] = score[P - 1]
+        k = int(np.argmax(restart))
+        new[0] = restart[k] + evidence[i]
+        back[i, 0] = k
+        score = new
+
+    positions = np.zeros(n, dtype=int)
+    if n:
+        positions[-1] = int(np.argmax(score))
+        for i in range(n - 1, 0, -1):
+            positions[i - 1] = back[i, positions[i]]
+    return positions
+
+
+def downbeat_evidence(onset_at_beats, chroma_beats):
+    # downbeats are hit harder and are where the chords change
+    c = unit_rows(chroma_beats)
+    change = np.zeros(len(c))
+    change[1:] = 1.0 - np.einsum("ij,ij->i", c[1:], c[:-1])
+
+    def z(x):
+        return (x - x.mean()) / max(x.std(), 1e-10)
+
+    return z(onset_at_beats) + z(change)
+
+
+def section_bounds(novelty, downbeats, min_gap):
+    # beat indices where sections start: novelty peaks moved to the nearest
+    # downbeat, strongest first, at least min_gap beats from each other and the ends
+    n = len(novelty)
+    if n == 0 or len(downbeats) == 0:
+        return []
+    reach = max(1, min_gap // 2)
+    padded = np.pad(novelty, reach, mode="constant", constant_values=-np.inf)
+    local_max = novelty >= np.lib.stride_tricks.sliding_window_view(padded, 2 * reach + 1).max(axis=1)
+    peaks = np.flatnonzero(local_max & (novelty > novelty.mean() + NOVELTY_THRESHOLD * novelty.std()))
+
+    bounds = []
+    for p in peaks[np.argsort(-novelty[peaks], kind="stable")]:
+        b = int(downbeats[np.argmin(np.abs(downbeats - p))])
+        if b < min_gap or n - b < min_gap:
+            continue
+        if all(abs(b - k) >= min_gap for k in bounds):
+            bounds.append(b)
+    return sorted(bounds)
+
+
+def section_types(starts, n, X, rms_beats):
+    # chorus = louder than the song's average and sounding like another loud,
+    # non-neighbouring section (the part that comes back); when no loud part
+    # comes back, loudness alone decides
+    ends = starts[1:] + [n]
+    means = unit_rows(np.array([X[s:e].mean(axis=0) for s, e in zip(starts, ends)]))
+    energy = np.array([rms_beats[s:e].mean() for s, e in zip(starts, ends)])
+    loud = energy >= rms_beats.mean()
+
+    k = np.arange(len(starts))
+    partners = loud[None, :] & (np.abs(k[:, None] - k[None, :]) > 1)
+    repeated = ((means @ means.T >= CHORUS_SIMILARITY) & partners).any(axis=1)
+    chorus = loud & repeated if (loud & repeated).any() else loud
+    return ["chorus" if c else "verse" for c in chorus]
+
+
+def analyze_structure(beat_times, beat_frames, chroma, mfcc, onset_env, rms, duration):
+    # (sections, downbeat times), or None when there are too few beats to find bars
+    n = len(beat_frames)
+    if n < 2 * BEATS_PER_BAR or len(chroma) == 0:
+        return None
+    beat_times = np.asarray(beat_times, dtype=float)
+
+    chroma_beats = beat_sync(chroma, beat_frames)
+    X = beat_vectors(chroma_beats, beat_sync(mfcc, beat_frames))
+    rms_beats = beat_sync(rms[:, None], beat_frames)[:, 0]
+    onset_at_beats = onset_env[np.clip(beat_frames, 0, len(onset_env) - 1)]
+
+    positions = bar_positions(downbeat_evidence(onset_at_beats, chroma_beats))
+    downbeats = np.flatnonzero(positions == 0)
+
+    half = NOVELTY_BARS * BEATS_PER_BAR
+    novelty = checkerboard_novelty(banded_similarity(X, 2 * half), half)
+    starts = [0] + section_bounds(novelty, downbeats, MIN_SECTION_BARS * BEATS_PER_BAR)
+    types = section_types(starts, n, X, rms_beats)
+
+    times = [0.0] + [float(beat_times[s]) for s in starts[1:]] + [float(duration)]
+    sections = [
+        {"start": times[i], "end": times[i + 1], "type": t} for i, t in enumerate(types)
+    ]
+    return sections, beat_times[downbeats]
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cache
+from media import run_ffmpeg
+
+
+@pytest.fixture(autouse=True)
+def cache_root(tmp_path, monkeypatch):
+    # probes, proxies etc. of the test files never land in the app's own cache
+    monkeypatch.setattr(cache, "CACHE_ROOT", str(tmp_path / "cache"))
+
+
+@pytest.fixture
+def make_media(tmp_path):
+    # short lavfi test files: make_media("a.mp4", video="testsrc=size=64x36:rate=30:duration=4")
+    def make(name, video=None, audio=None, args=()):
+        path = str(tmp_path / name)
+        inputs = []
+        for source in (video, audio):
+            if source:
+                inputs += ["-f", "lavfi", "-i", source]
+        run_ffmpeg(inputs + list(args) + [path], what=f"test file {name}")
+        return path
+
+    return make
@@ -0,0 +1,70 @@
+from fractions import Fraction
+
+import pytest
+
+from encoding import (
+    AUDIO_ENCODE_ARGS, audio_codec_args, container_path, fitted_size, resolve_profile, video_codec_args
+)
+
+
+@pytest.mark.parametrize("name, codec, container, copied", [
+    ("mix.m4a", "aac", "mp4", True),
+    ("mix.wav", "pcm_s16le", "mp4", False),
+    ("mix.wav", "pcm_s16le", "mov", True),
+    ("mix.flac", "flac", "mov", False),
+])
+def test_audio_codec_args(make_media, name, codec, container, copied):
+    mix = make_media(name, audio="sine=frequency=440:duration=1", args=["-c:a", codec])
+    args = audio_codec_args(mix, resolve_profile({"container": container}))
+    assert args == (["-c:a", "copy"] if copied else AUDIO_ENCODE_ARGS)
+
+
+@pytest.mark.parametrize("path, profile, expected", [
+    ("out/render_001.mp4", "standard", "out/render_001.mp4"),
+    ("out/render_001.mp4", "master", "out/render_001.mov"),
+    ("out/song.edit.mov", "draft", "out/song.edit.mp4"),
+    ("song", "master", "song.mov"),
+])
+def test_container_path(path, profile, expected):
+    assert container_path(path, resolve_profile(profile)) == expected
+
+
+def test_resolve_profile_overrides():
+    settings = resolve_profile({"base": "master", "fps": "30000/1001", "crf": 20, "height": 1080})
+    assert settings["fps"] == Fraction(30000, 1001)
+    assert settings["pix_fmt"] == "yuv422p10le" and settings["container"] == "mov"
+    assert settings["height"] == 1080
+    assert resolve_profile({"fps": "24/1"})["fps"] == 24
+    assert video_codec_args(settings)[-4:] == ["-crf", "20", "-pix_fmt", "yuv422p10le"]
+
+
+@pytest.mark.parametrize("profile", [
+    "cinema",
+    {"base": "cinema"},
+    {"bitrate": "8M"},
+    {"fps": 0},
+    {"fps": "fast"},
+    {"preset": "quick"},
+    {"crf": 52},
+    {"threads": -1},
+    {"pix_fmt": "rgb24"},
+    {"container": "avi"},
+    {"height": 719},
+    {"height": 8},
+    {"height": "tall"},
+])
+def test_resolve_profile_rejects(profile):
+    with pytest.raises(ValueError):
+        resolve_profile(profile)
+
+
+@pytest.mark.parametrize("size, max_height, expected", [
+    ((1920, 1080), None, (1920, 1080)),
+    ((1920, 1080), 720, (1280, 720)),
+    ((1280, 720), 1080, (1280, 720)),
+    # odd widths round up to even, the encoders need it
+    ((1366, 768), 720, (1282, 720)),
+    ((1080, 1920), 720, (406, 720)),
+])
+def test_fitted_size(size, max_height, expected):
+    assert fitted_size(*size, max_height) == expected
@@ -0,0 +1,74 @@
+from fractions import Fraction
+
+import pytest
+
+from exports import timecode, write_edl, write_otio
+from segments import frame_count, plan_segments, segment_frames
+
+
+SONG_LENGTH = 4.1
+
+
+@pytest.fixture
+def project(make_media):
+    # two 30 fps cameras, the second shorter than the song so its stem loops
+    videos = [
+        make_media("cam0.mp4", video="testsrc=size=64x36:rate=30:duration=6"),
+        make_media("cam1.mp4", video="testsrc=size=64x36:rate=30:duration=2"),
+    ]
+    mix = make_media("mix.wav", audio=f"sine=frequency=440:duration={SONG_LENGTH}")
+    video_map = {"stem0.wav": videos[0], "stem1.wav": videos[1]}
+    timeline = [
+        {"time": t, "type": "stem", "stem": f"stem{k % 2}.wav"}
+        for k, t in enumerate([0.77, 1.51, 3.3, SONG_LENGTH])
+    ]
+    return timeline, video_map, mix
+
+
+def last_frame(timeline, fps):
+    # the video stops SAFE_START short of the song, the renders fill it with black
+    return segment_frames(plan_segments(timeline)[-1], fps)[1]
+
+
+def edl_events(path):
+    # (track, source in, source out, record in, record out) per event, in frames
+    events = []
+    for line in open(path):
+        if line[:3].isdigit():
+            fields = line.split()
+            events.append((fields[2], *fields[-4:]))
+    return events
+
+
+@pytest.mark.parametrize("fps", [24, 30, Fraction(30000, 1001)])
+def test_edl_frame_grid(tmp_path, project, fps):
+    timeline, video_map, mix = project
+    path = write_edl(timeline, video_map, SONG_LENGTH, mix, str(tmp_path / "edit.mp4"), fps)
+    events = edl_events(path)
+    video = [e for e in events if e[0] == "V"]
+    total = frame_count(SONG_LENGTH, fps)
+
+    # the record side covers every output frame once, the mix runs the whole song
+    assert video[0][3] == timecode(0, fps)
+    for a, b in zip(video, video[1:]):
+        assert a[4] == b[3]
+    assert video[-1][4] == timecode(last_frame(timeline, fps), fps)
+    assert events[-1] == ("AA", timecode(0, fps), timecode(total, fps), timecode(0, fps), timecode(total, fps))
+
+    # the looping stem wraps back into its 2 s file as a new event
+    assert len(video) > 4
+
+
+@pytest.mark.parametrize("fps", [24, Fraction(30000, 1001)])
+def test_otio_rate(tmp_path, project, fps):
+    otio = pytest.importorskip("opentimelineio")
+    timeline, video_map, mix = project
+    path = write_otio(timeline, video_map, SONG_LENGTH, mix, str(tmp_path / "edit.mp4"), fps)
+    edit = otio.adapters.read_from_file(path)
+
+    clips = list(edit.find_clips())
+    assert {clip.source_range.duration.rate for clip in clips} == {float(fps)}
+    video, audio = edit.tracks
+    frames = sum(clip.source_range.duration.value for clip in video.find_clips())
+    assert frames == last_frame(timeline, fps)
+    assert audio.find_clips()[0].source_range.duration.value == frame_count(SONG_LENGTH, fps)
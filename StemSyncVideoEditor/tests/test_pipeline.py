@@ -0,0 +1,34 @@
+import pytest
+
+from pipeline import EditError, check_profile
+
+
+@pytest.mark.parametrize("profile, backend, use_proxies", [
+    # settings the profile itself does not allow, on any backend
+    ("cinema", "ffmpeg", True),
+    ({"crf": 60}, "stream", False),
+    ({"height": 721}, "ffmpeg", True),
+    ({"fps": "source", "bitrate": "8M"}, "ffmpeg", True),
+    (["standard"], "ffmpeg", True),
+    # 10-bit 4:2:2 where the backend only writes 8-bit 4:2:0
+    ("master", "moviepy", False),
+    ({"pix_fmt": "yuv444p"}, "moviepy", True),
+    ("master", "smart", True),
+    ({"pix_fmt": "yuv420p10le"}, "smart", True),
+])
+def test_check_profile_rejects(profile, backend, use_proxies):
+    with pytest.raises(EditError):
+        check_profile(profile, backend, use_proxies)
+
+
+@pytest.mark.parametrize("profile, backend, use_proxies", [
+    ("master", "ffmpeg", True),
+    ("master", "stream", True),
+    # smart without proxies renders like the ffmpeg backend
+    ("master", "smart", False),
+    ("draft", "moviepy", True),
+    ({"base": "high quality", "height": 1080}, "smart", True),
+])
+def test_check_profile_accepts(profile, backend, use_proxies):
+    settings = check_profile(profile, backend, use_proxies)
+    assert settings["container"] in ("mp4", "mov")
@@ -0,0 +1,48 @@
+from fractions import Fraction
+
+import pytest
+
+from render_ffmpeg import split_chunks
+from segments import plan_segments, segment_frames, snap_to_frames
+
+
+def plan_for(times, fps):
+    timeline = [{"time": t, "type": "stem", "stem": f"stem{k % 3}.wav"} for k, t in enumerate(times)]
+    return snap_to_frames(plan_segments(timeline), fps)
+
+
+def chunk_frames(chunk, fps):
+    return sum(f1 - f0 for f0, f1 in (segment_frames(seg, fps) for seg in chunk))
+
+
+def test_split_chunks_empty():
+    assert split_chunks([], 4) == [[]]
+
+
+@pytest.mark.parametrize("fps", [24, Fraction(30000, 1001)])
+@pytest.mark.parametrize("workers", [1, 2, 3, 8])
+def test_split_chunks_by_workers(fps, workers):
+    plan = plan_for([0.5 * k for k in range(1, 21)], fps)
+    chunks = split_chunks(plan, workers, fps=fps)
+
+    # cut on segment boundaries only, every segment once, in order
+    assert [seg for chunk in chunks for seg in chunk] == plan
+    assert all(chunks)
+    assert len(chunks) <= workers
+
+    # every chunk but the last reaches the even share, no chunk runs a segment past it
+    total = segment_frames(plan[-1], fps)[1]
+    target = -(-total // workers)
+    longest = max(f1 - f0 for f0, f1 in (segment_frames(seg, fps) for seg in plan))
+    for chunk in chunks[:-1]:
+        assert target <= chunk_frames(chunk, fps) < target + longest
+
+
+def test_split_chunks_by_seconds():
+    plan = plan_for([0.5 * k for k in range(1, 21)], 24)
+    chunks = split_chunks(plan, 2, chunk_seconds=2.0, fps=24)
+
+    # chunk_seconds wins over the worker count, a chunk closes on the first cut past 2 s
+    assert len(chunks) == 5
+    assert all(48 <= chunk_frames(chunk, 24) < 60 for chunk in chunks[:-1])
+    assert [seg for chunk in chunks for seg in chunk] == plan
@@ -0,0 +1,60 @@
+from fractions import Fraction
+
+import pytest
+
+from segments import frame_count, frame_index, plan_segments, segment_frames, snap_to_frames
+
+
+def stem_timeline(times):
+    return [{"time": t, "type": "stem", "stem": f"stem{k % 2}.wav"} for k, t in enumerate(times)]
+
+
+@pytest.mark.parametrize("t, fps, expected", [
+    (0.0, 24, 0),
+    (1.0, 24, 24),
+    (1.01, 24, 25),
+    # float noise right on a frame boundary stays on that frame
+    (0.1 * 3, 30, 9),
+    (1001 / 30000, Fraction(30000, 1001), 1),
+    (10.0, Fraction(30000, 1001), 300),
+])
+def test_frame_index(t, fps, expected):
+    assert frame_index(t, fps) == expected
+
+
+def test_frame_count_ntsc():
+    # a frame sampled at or after the end is not part of the song
+    assert frame_count(60.0, Fraction(30000, 1001)) == 1799
+    assert frame_count(60.0, 30) == 1800
+
+
+@pytest.mark.parametrize("fps", [24, 30, Fraction(30000, 1001)])
+def test_snap_to_frames_whole_frames(fps):
+    raw = plan_segments(stem_timeline([0.51, 1.234, 1.25, 2.0, 3.777]))
+    plan = snap_to_frames(raw, fps)
+
+    # every segment starts where the previous one stopped, on a whole frame
+    assert plan[0]["out_start"] == 0.0
+    for a, b in zip(plan, plan[1:]):
+        assert a["out_end"] == b["out_start"]
+    for seg in plan:
+        f0, f1 = segment_frames(seg, fps)
+        assert f1 > f0
+        assert seg["out_start"] == f0 / fps
+        assert seg["duration"] == pytest.approx((f1 - f0) / fps)
+    assert segment_frames(plan[-1], fps)[1] == frame_index(raw[-1]["out_end"], fps)
+
+
+def test_snap_to_frames_drops_empty_and_shifts_source():
+    # 1.234 -> 1.25 holds no 24 fps frame of its own
+    plan = plan_segments(stem_timeline([0.51, 1.234, 1.25]))
+    snapped = snap_to_frames(plan, 24)
+    assert [seg["stem"] for seg in snapped] == ["stem0.wav", "stem1.wav"]
+
+    # the second cut moves to the next frame boundary, its source moves along
+    f0 = frame_index(plan[1]["out_start"], 24)
+    lead = f0 / 24 - plan[1]["out_start"]
+    assert 0 < lead < 1 / 24
+    assert snapped[1]["out_start"] == f0 / 24
+    assert snapped[1]["source_start"] == pytest.approx(plan[1]["source_start"] + lead)
+    assert snapped[1]["source_end"] - snapped[1]["source_start"] == pytest.approx(snapped[1]["duration"])
@@ -0,0 +1,121 @@
+import numpy as np
+
+from segments import SAFE_START, stem_needs_loop, stem_source_time
+from structure import BEATS_PER_BAR
+
+
+# ======================================================
+# TIMELINE ENGINE
+# everything that does not depend on previous cuts is
+# computed for all beats at once, generate_timeline only
+# walks the stateful cooldown / cut selection
+# ======================================================
+def cut_horizon(beat_times, song_length):
+    # beats from the first one at/after the song end are never used
+    past_end = np.flatnonzero(beat_times >= song_length)
+    return int(past_end[0]) if len(past_end) else len(beat_times)
+
+
+def section_labels(sections, times):
+    # vectorised section_at_time, sections are contiguous and sorted
+    labels = np.full(len(times), "verse", dtype=object)
+    if not sections:
+        return labels
+
+    starts = np.array([s["start"] for s in sections], dtype=float)
+    ends = np.array([s["end"] for s in sections], dtype=float)
+    types = np.array([s["type"] for s in sections], dtype=object)
+
+    i = np.searchsorted(starts, times, side="right") - 1
+    inside = i >= 0
+    inside[inside] = times[inside] < ends[i[inside]]
+    labels[inside] = types[i[inside]]
+    return labels
+
+
+def sample_frames(times, frame_times, columns):
+    # linear interpolation of several per-frame features at once, the
+    # beats are placed on the frame grid one time for all of them
+    columns = np.column_stack(columns)
+    if len(frame_times) == 0:
+        return np.zeros((len(times), columns.shape[1]))
+    pos = np.interp(times, frame_times, np.arange(len(frame_times)))
+    lo = np.floor(pos).astype(int)
+    hi = np.minimum(lo + 1, len(frame_times) - 1)
+    w = (pos - lo)[:, None]
+    return columns[lo] + (columns[hi] - columns[lo]) * w
+
+
+def beat_features(times, a):
+    # the features of one stem analysis (analysis.STEM_FEATURES) at the beats,
+    # all on the rms frame grid, so they are sampled in one pass
+    names = [n for n in ("rms", "flux", "onsets", "centroid") if n in a]
+    sampled = sample_frames(times, a["rms_times"], [a[n] for n in names])
+    return dict(zip(names, sampled.T))
+
+
+def energy_matrix(times, stems, audio, metric="rms"):
+    # beats x stems of the chosen feature (which camera wins a cut), plus
+    # which stems are playing at all (RMS above their silence floor)
+    energy = np.zeros((len(times), len(stems)))
+    active = np.zeros((len(times), len(stems)), dtype=bool)
+    for j, s in enumerate(stems):
+        features = beat_features(times, audio[s])
+        ended = times > audio[s]["duration"]
+        energy[:, j] = np.where(ended, 0.0, features[metric])
+        active[:, j] = ~ended & (features["rms"] > audio[s]["silence"])
+    return energy, active
+
+
+def min_beats_per_beat(labels, phrase_beats, chorus_aggression):
+    # Chorus aggression: lower = more cuts
+    chorus_min = max(1, int(phrase_beats * (1 - chorus_aggression)))
+    return np.where(labels == "chorus", chorus_min, phrase_beats)
+
+
+def bar_counts(times, downbeats):
+    # beat count that jumps to the next multiple of BEATS_PER_BAR on every
+    # detected downbeat (negative before the first), None without downbeats
+    if downbeats is None or len(downbeats) == 0 or len(times) < 2:
+        return None
+    idx = np.arange(len(times))
+    right = np.clip(np.searchsorted(times, downbeats), 1, len(times) - 1)
+    closer = np.abs(times[right] - downbeats) < np.abs(times[right - 1] - downbeats)
+    marks = np.unique(np.where(closer, right, right - 1))
+    bar = np.searchsorted(marks, idx, side="right") - 1
+    return np.where(bar >= 0, bar * BEATS_PER_BAR + idx - marks[np.maximum(bar, 0)], idx - marks[0])
+
+
+def cut_opportunities(count, downbeat_bias, counts=None):
+    # Downbeat emphasis (favor every N beats, counted from the bar starts when known)
+    idx = np.arange(count)
+    if downbeat_bias > 0:
+        pos = idx if counts is None else counts
+        idx = idx[pos % int(downbeat_bias) == 0]
+    return idx
+
+
+def scene_matrix(times, stems, scenes, song_length, window):
+    # beats x stems: the stem's source jumps (a hard cut, or its loop point)
+    # within `window` seconds of where the stem would be at that beat
+    near = np.zeros((len(times), len(stems)), dtype=bool)
+    for j, s in enumerate(stems):
+        if s not in scenes:
+            continue
+        cuts, duration = scenes[s]
+        if duration <= SAFE_START:
+            continue
+
+        points = np.asarray(cuts, dtype=float)
+        if stem_needs_loop(duration, song_length):
+            points = np.concatenate([points, [0.0, duration]])
+        if len(points) == 0:
+            continue
+        points = np.sort(points)
+
+        src = stem_source_time(times, duration, song_length)
+        i = np.searchsorted(points, src)
+        before = points[np.clip(i - 1, 0, len(points) - 1)]
+        after = points[np.clip(i, 0, len(points) - 1)]
+        near[:, j] = np.minimum(np.abs(src - before), np.abs(after - src)) <= window
+    return near